@@ -0,0 +1,6 @@
+"""Pytest configuration: Modules of optional dependencies are only collected if installed."""
+
+try:
+    import numpy  # noqa: F401 pylint: disable=unused-import
+except ImportError:
+    collect_ignore = ['rpi433rc/business/decoder.py']  # pylint: disable=invalid-name
@@ -5,6 +5,10 @@ case ${1} in
       shift
       exec rpi-rf_receive "$@"
       ;;
+    history)
+      shift
+      exec python -m rpi433rc.business.audit "${CONFIG_DIR:-/conf}/${AUDIT_FILE:-audit.bin}" "$@"
+      ;;
     serve)
       exec ./run.sh
       ;;
@@ -12,6 +12,9 @@ api = Api(
     description='Raspberry Pi 433mhz socket remote control Rest-API'
 )
 
+from .flaskutil.representations import output_json
+api.representations['application/json'] = output_json
+
 from .version import api as ns_version
 api.add_namespace(ns_version)
 
@@ -21,5 +24,39 @@ api.add_namespace(ns_devices)
 from .send import api as ns_send
 api.add_namespace(ns_send)
 
-from ..factories import create_registry
-device_db = create_registry()
+from .radio import api as ns_radio
+api.add_namespace(ns_radio)
+
+from .schedules import api as ns_schedules
+api.add_namespace(ns_schedules)
+
+from .health import api as ns_health
+api.add_namespace(ns_health)
+
+from .store import api as ns_store
+api.add_namespace(ns_store)
+
+from .state import api as ns_state
+api.add_namespace(ns_state)
+
+from .learn import api as ns_learn
+api.add_namespace(ns_learn)
+
+from ..factories import use_owner
+if use_owner():
+    # State, radio and scheduler live in the owner process
+    from ..factories import create_owner_client
+    device_db = create_owner_client()
+    rate_limiter = device_db.rate_limiter
+    idempotency_cache = device_db.idempotency_cache
+    scheduler = device_db.scheduler
+    learner = device_db.learner
+else:
+    from ..factories import (Lazy, create_cluster, create_idempotency_cache, create_learner,
+                             create_rate_limiter, create_scheduler)
+    device_db = create_cluster()
+    device_db.start()
+    rate_limiter = create_rate_limiter()
+    idempotency_cache = create_idempotency_cache()
+    scheduler = Lazy(create_scheduler, device_db)  # Started by the server (see `runner`)
+    learner = create_learner(device_db)
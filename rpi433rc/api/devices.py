@@ -4,6 +4,10 @@ from flask_restplus import Resource, Namespace, fields
 
 from .flaskutil import fields as _fields
 from .flaskutil.auth import requires_auth
+from .flaskutil.idempotency import idempotent
+from .flaskutil.ratelimit import rate_limited
+from .flaskutil.serializer import marshal_fast
+from ..business.cluster import RemoteNodeError
 from ..business.devices import UnknownDeviceError
 from ..business.rc433 import UnsupportedDeviceError
 
@@ -17,9 +21,16 @@ def unknown_device(error):
     return {'message': str(error), 'value': 'device_name'}, 400
 
 
+@api.errorhandler(RemoteNodeError)
+def remote_node(error):
+    """Remote node error serializer."""
+    return {'message': str(error)}, 502
+
+
 STATE = api.model('State', {
     'state': _fields.OnOff,
-    'result': fields.Boolean
+    'result': fields.Boolean,
+    'transmitted': fields.Boolean
 })
 
 DEVICE = api.model('Device', {
@@ -30,13 +41,12 @@ DEVICE = api.model('Device', {
     'state': _fields.OnOff
 })
 
-
 @api.route('/')
 @api.route('/list')
 class DeviceList(Resource):
     """Endpoint to list devices."""
     @requires_auth
-    @api.marshal_with(DEVICE)
+    @marshal_fast(api, DEVICE)
     def get(self):  # pylint: disable=no-self-use
         """Implements get operation."""
         from . import device_db
@@ -48,7 +58,7 @@ class DeviceList(Resource):
 class DeviceLookup(Resource):
     """Endpoint to lookup a specific device."""
     @requires_auth
-    @api.marshal_with(DEVICE)
+    @marshal_fast(api, DEVICE)
     def get(self, device_name):  # pylint: disable=no-self-use
         """Implements get operation."""
         from . import device_db
@@ -59,10 +69,13 @@ class DeviceLookup(Resource):
 class DeviceSwitch(Resource):
     """Endpoint to switch a specific device to a given state."""
     @requires_auth
+    @idempotent
+    @rate_limited('rest')
     @api.marshal_with(STATE)
+    @api.header('Idempotency-Key', 'Retries with the same key are not transmitted again')
     def get(self, device_name, on_off):  # pylint: disable=no-self-use
         """Implements get operation."""
         from . import device_db
 
-        res = device_db.switch(on_off, device_name=device_name)
-        return {'state': on_off, 'result': res}
+        res = device_db.switch(on_off, device_name=device_name, source='rest')
+        return {'state': on_off, 'result': res.result, 'transmitted': res.transmitted}
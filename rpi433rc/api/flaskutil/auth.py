@@ -2,7 +2,7 @@
 
 from functools import wraps
 
-from flask import request, Response
+from flask import g, request, Response
 
 
 def validate_auth(username, password):
@@ -22,7 +22,8 @@ def auth_401():
 
 
 def requires_auth(fun):
-    """Decorator to mark endpoints that they require authentication."""
+    """Decorator to mark endpoints that they require authentication. The authenticated user is
+    available as `g.auth_user`."""
     @wraps(fun)
     def decorated(*args, **kwargs):
         from ...config import AUTH_USER
@@ -30,5 +31,6 @@ def requires_auth(fun):
             auth = request.authorization
             if not auth or not validate_auth(auth.username, auth.password):
                 return auth_401()
+            g.auth_user = auth.username
         return fun(*args, **kwargs)
     return decorated
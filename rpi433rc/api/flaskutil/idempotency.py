@@ -0,0 +1,33 @@
+"""Provides idempotency keys for flask: Retried requests with the same key are answered with
+the response of the first request instead of being executed again."""
+
+from functools import wraps
+
+from flask import request, Response
+
+from .ratelimit import client_id
+
+HEADER = 'Idempotency-Key'
+
+
+def idempotent(fun):
+    """Decorator to mark endpoints that honour the `Idempotency-Key` header. Responses of the
+    type `flask.Response` (e.g. errors) are not remembered."""
+    @wraps(fun)
+    def decorated(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return fun(*args, **kwargs)
+        from .. import idempotency_cache
+        scoped_key = (client_id(), request.path, key)
+        claimed, result = idempotency_cache.claim(scoped_key)
+        if not claimed:
+            return result
+        result = None
+        try:
+            result = fun(*args, **kwargs)
+            return result
+        finally:
+            idempotency_cache.complete(
+                scoped_key, None if isinstance(result, Response) else result)
+    return decorated
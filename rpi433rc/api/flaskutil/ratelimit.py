@@ -0,0 +1,34 @@
+"""Provides rate limiting for flask."""
+
+import math
+from functools import wraps
+
+from flask import g, request, Response
+
+
+def client_id():
+    """Identifies the client of the current request: The user if authenticated (by
+    `requires_auth`); otherwise the remote address. Unchecked credentials are ignored, so a client
+    can not evade its limit by sending random user names."""
+    return g.get('auth_user') or request.remote_addr
+
+
+def too_many_requests(retry_after):
+    """Sends a 429 response that tells the client when to retry."""
+    return Response(
+        'Too many requests. Retry later.', 429,
+        {'Retry-After': str(int(math.ceil(retry_after)))})
+
+
+def rate_limited(source):
+    """Decorator to limit the request rate of an endpoint per client."""
+    def wrapper(fun):
+        @wraps(fun)
+        def decorated(*args, **kwargs):
+            from .. import rate_limiter
+            retry_after = rate_limiter.acquire(source, client_id())
+            if retry_after:
+                return too_many_requests(retry_after)
+            return fun(*args, **kwargs)
+        return decorated
+    return wrapper
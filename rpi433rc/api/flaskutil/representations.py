@@ -0,0 +1,13 @@
+"""Provides response representations for flask_restplus."""
+
+from flask import make_response
+
+from ... import codec
+
+
+def output_json(data, code, headers=None):
+    """Makes a flask response with a json encoded body by using the configured json codec."""
+    resp = make_response(codec.dumpb(data) + b'\n', code)
+    resp.headers.extend(headers or {})
+    resp.headers['Content-Type'] = 'application/json'
+    return resp
@@ -0,0 +1,126 @@
+"""Provides a precompiled serializer for flask_restplus models. The models are compiled once to
+a list of getters and formatters instead of walking the model fields on every request."""
+
+import operator
+from functools import wraps
+
+from flask import request, Response
+from flask_restplus import fields, marshal
+from flask_restplus.utils import merge, unpack
+
+from . import fields as _fields
+from ... import codec
+
+
+def _on_off(value):
+    return 'on' if value else 'off'
+
+
+def _dict(value):
+    if isinstance(value, dict):
+        return value
+    raise fields.MarshallingError("Can not marshal dictionary")
+
+
+# Order matters: Subclasses before their base classes
+_FORMATTERS = [
+    (_fields.OnOff, _on_off),
+    (_fields.Dict, _dict),
+    (fields.Boolean, bool),
+    (fields.Integer, int),
+    (fields.Float, float),
+    (fields.String, str),
+]
+
+
+def _getter(key, field):
+    attribute = key if field.attribute is None else field.attribute
+    if callable(attribute):
+        return attribute
+    getter = operator.attrgetter(attribute)
+
+    def _get(obj):
+        if isinstance(obj, dict):
+            return fields.get_value(attribute, obj)
+        try:
+            return getter(obj)
+        except AttributeError:
+            return None
+    return _get
+
+
+def _compile_field(key, field):
+    if isinstance(field, type):
+        field = field()
+    if field.default is not None or getattr(field, 'mask', None):
+        return lambda obj: field.output(key, obj)  # Not worth it: Let restplus handle it
+
+    for field_type, formatter in _FORMATTERS:
+        if type(field) is field_type:  # pylint: disable=unidiomatic-typecheck
+            getter = _getter(key, field)
+
+            def _output(obj, _get=getter, _fmt=formatter):
+                value = _get(obj)
+                return None if value is None else _fmt(value)
+            return _output
+    return lambda obj: field.output(key, obj)
+
+
+def compile_model(model):
+    """
+    Compiles a model to a function that serializes an object to a dictionary. The result is the
+    same as the one of `flask_restplus.marshal`.
+
+    Example:
+
+        >>> from flask_restplus import Model
+        >>> model = Model('Test', {'name': fields.String(attribute='device.name'),
+        ...                        'state': _fields.OnOff})
+        >>> from collections import namedtuple
+        >>> Device = namedtuple('Device', ['name'])
+        >>> Stateful = namedtuple('Stateful', ['device', 'state'])
+        >>> serialize = compile_model(model)
+        >>> serialize(Stateful(Device('device1'), True)) == {'name': 'device1', 'state': 'on'}
+        True
+    """
+    compiled = [(key, _compile_field(key, field)) for key, field in model.items()]
+
+    def _serialize(obj):
+        return {key: output(obj) for key, output in compiled}
+    return _serialize
+
+
+def marshal_fast(api, model, code=200, description=None):
+    """
+    Replacement for `api.marshal_with`. Serializes the result of the endpoint by a precompiled
+    serializer directly to a json response. The swagger documentation stays the same.
+    Requests that pass a field mask (X-Fields) are handled by flask_restplus. Like
+    `marshal_with` the endpoint may return a `(data, status[, headers])` tuple; listings have
+    to be lists.
+    """
+    serialize = compile_model(model)
+
+    def wrapper(func):
+        func.__apidoc__ = merge(getattr(func, '__apidoc__', {}), {
+            'responses': {code: (description, model)},
+            '__mask__': True
+        })
+
+        @wraps(func)
+        def decorated(*args, **kwargs):
+            resp = func(*args, **kwargs)
+            if isinstance(resp, Response):
+                return resp
+            status, headers = code, {}
+            if type(resp) is tuple:  # pylint: disable=unidiomatic-typecheck
+                resp, status, headers = unpack(resp, code)  # Named tuples are data
+            if request.headers.get('X-Fields'):
+                return marshal(resp, model, mask=request.headers.get('X-Fields')), status, headers
+            if isinstance(resp, list):
+                data = [serialize(obj) for obj in resp]
+            else:
+                data = serialize(resp)
+            return Response(codec.dumpb(data) + b'\n', status=status, headers=headers,
+                            mimetype='application/json')
+        return decorated
+    return wrapper
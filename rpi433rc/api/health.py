@@ -0,0 +1,25 @@
+"""Provides health related endpoints (e.g. for probes of a container orchestrator)."""
+
+from flask_restplus import Resource, Namespace, fields
+
+api = Namespace('health', description='Health')  # pylint: disable=invalid-name
+
+
+READINESS = api.model('Readiness', {
+    'ready': fields.Boolean(description='True if the service can switch devices'),
+    'radio': fields.Boolean(description='True if the radio is armed'),
+    'state': fields.Boolean(description='True if the device states are known')
+})
+
+
+@api.route('/ready')
+class Ready(Resource):
+    """Endpoint that tells if the service is ready. Responds with 503 if it is not."""
+    @api.marshal_with(READINESS)
+    @api.response(503, 'Not ready', READINESS)
+    def get(self):  # pylint: disable=no-self-use
+        """Implements get operation."""
+        from . import device_db
+        res = dict(device_db.readiness())
+        res['ready'] = all(res.values())
+        return res, 200 if res['ready'] else 503
@@ -0,0 +1,56 @@
+"""Provides endpoints to learn the codes of a device from its physical remote."""
+
+from flask_restplus import Resource, Namespace, fields, reqparse
+
+from .flaskutil.auth import requires_auth
+from ..business.devices import UnknownDeviceError
+from ..business.learn import LearnError
+
+api = Namespace('learn', description='Learn the codes of a device from its remote')  # pylint: disable=invalid-name
+
+
+@api.errorhandler(UnknownDeviceError)
+def unknown_device(error):
+    """Unknown device error serializer."""
+    return {'message': str(error), 'value': 'device_name'}, 404
+
+
+@api.errorhandler(LearnError)
+def busy(error):
+    """Learn error serializer."""
+    return {'message': str(error)}, 409
+
+
+SESSION = api.model('LearnSession', {
+    'device_name': fields.String,
+    'state': fields.String(description='waiting_on, waiting_off, done, timeout or failed'),
+    'code_on': fields.Integer,
+    'code_off': fields.Integer,
+    'protocol': fields.Integer,
+    'pulse_length': fields.Integer,
+    'code_length': fields.Integer,
+    'message': fields.String(description='Why learning failed')
+})
+
+START_ARGS = reqparse.RequestParser()  # pylint: disable=invalid-name
+START_ARGS.add_argument('timeout', type=float, help='Seconds to wait for the button presses')
+
+
+@api.route('/<string:device_name>')
+class Learn(Resource):
+    """Endpoint to learn a device: Start it and press the on and then the off button."""
+    @requires_auth
+    @api.expect(START_ARGS)
+    @api.marshal_with(SESSION, code=202)
+    def post(self, device_name):  # pylint: disable=no-self-use
+        """Arms the receiver to learn the device. Only one device is learned at a time."""
+        from . import learner
+        args = START_ARGS.parse_args()
+        return learner.start(device_name, timeout=args['timeout']), 202
+
+    @requires_auth
+    @api.marshal_with(SESSION)
+    def get(self, device_name):  # pylint: disable=no-self-use
+        """Returns the progress of learning the device."""
+        from . import learner
+        return learner.status(device_name)
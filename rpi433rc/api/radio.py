@@ -0,0 +1,51 @@
+"""Provides endpoints to inspect the 433mhz radio."""
+
+from flask_restplus import Resource, Namespace, fields, reqparse
+
+from .flaskutil.auth import requires_auth
+
+api = Namespace('radio', description='Radio related operations')  # pylint: disable=invalid-name
+
+
+TRANSMISSION = api.model('Transmission', {
+    'timestamp': fields.Float(description='Epoch seconds of the transmission'),
+    'code': fields.Integer,
+    'device_name': fields.String,
+    'source': fields.String(description='Where the request came from (e.g. rest, mqtt)'),
+    'repeats': fields.Integer(description='How many times the code was sent'),
+    'duration': fields.Float(description='Seconds the transmission took'),
+    'result': fields.Boolean(description='True if the radio acknowledged')
+})
+
+HISTORY_ARGS = reqparse.RequestParser()  # pylint: disable=invalid-name
+HISTORY_ARGS.add_argument('device', type=str, help='Only transmissions of this device')
+HISTORY_ARGS.add_argument('since', type=float, help='Only transmissions since (epoch seconds)')
+HISTORY_ARGS.add_argument('until', type=float, help='Only transmissions until (epoch seconds)')
+HISTORY_ARGS.add_argument('limit', type=int, default=100, help='Max. number of transmissions')
+
+
+@api.route('/stats')
+class ResendStats(Resource):
+    """Endpoint that provides the delivery statistics per device."""
+    @requires_auth
+    def get(self):  # pylint: disable=no-self-use
+        """Implements get operation."""
+        from . import device_db
+        return device_db.rc433.resend_stats()
+
+
+@api.route('/history')
+class History(Resource):
+    """Endpoint that queries the audit log of the transmissions."""
+    @requires_auth
+    @api.expect(HISTORY_ARGS)
+    @api.marshal_list_with(TRANSMISSION)
+    def get(self):  # pylint: disable=no-self-use
+        """Lists the most recent transmissions (newest first)."""
+        from . import device_db
+        audit_log = getattr(device_db.rc433, 'audit_log', None)
+        if audit_log is None:
+            api.abort(404, "The audit log is disabled. Set AUDIT_FILE to enable it")
+        args = HISTORY_ARGS.parse_args()
+        return audit_log.query(device_name=args['device'], since=args['since'],
+                               until=args['until'], limit=args['limit'])
@@ -0,0 +1,84 @@
+"""Provides endpoints to schedule switches of devices."""
+
+import time
+
+from flask_restplus import Resource, Namespace, fields
+
+from .flaskutil import fields as _fields
+from .flaskutil.auth import requires_auth
+from ..business.scheduler import Schedule
+
+api = Namespace('schedules', description='Scheduled switching of devices')  # pylint: disable=invalid-name
+
+
+SCHEDULE = api.model('Schedule', {
+    'schedule_id': fields.String(readonly=True),
+    'device_name': fields.String(required=True),
+    'on_off': _fields.OnOff(required=True),
+    'due': fields.Float(description='Epoch seconds of the next firing', readonly=True),
+    'every': fields.Float(description='Repeat every n seconds'),
+    'daily': fields.String(description='Repeat daily at the given local time (HH:MM)')
+})
+
+NEW_SCHEDULE = api.inherit('NewSchedule', SCHEDULE, {
+    'at': fields.Float(description='Fire once at the given epoch seconds'),
+    'delay': fields.Float(description='Fire once after n seconds')
+})
+
+STATS = api.model('ScheduleStats', {
+    'pending': fields.Integer,
+    'fired': fields.Integer,
+    'mean_latency': fields.Float(description='Mean firing latency in seconds'),
+    'max_latency': fields.Float(description='Max firing latency in seconds')
+})
+
+
+@api.route('/')
+class ScheduleList(Resource):
+    """Endpoint to list and create schedules."""
+    @requires_auth
+    @api.marshal_list_with(SCHEDULE)
+    def get(self):  # pylint: disable=no-self-use
+        """Lists all pending schedules."""
+        from . import scheduler
+        return scheduler.list()
+
+    @requires_auth
+    @api.expect(NEW_SCHEDULE)
+    @api.marshal_with(SCHEDULE, code=201)
+    def post(self):  # pylint: disable=no-self-use
+        """Creates a schedule. Pass one of `at`, `delay`, `every` or `daily`."""
+        from . import device_db, scheduler
+        props = api.payload or {}
+        device_db.lookup(device_name=props.get('device_name'))  # Fail early on unknown devices
+        try:
+            schedule = Schedule.create(
+                props.get('device_name'), props.get('on_off'), now=time.time(),
+                **{key: props[key] for key in ('at', 'delay', 'every', 'daily') if props.get(key)}
+            )
+        except ValueError as error:
+            api.abort(400, str(error))
+        return scheduler.add(schedule), 201
+
+
+@api.route('/stats')
+class ScheduleStats(Resource):
+    """Endpoint that provides the firing latency of the scheduler."""
+    @requires_auth
+    @api.marshal_with(STATS)
+    def get(self):  # pylint: disable=no-self-use
+        """Implements get operation."""
+        from . import scheduler
+        return scheduler.stats()
+
+
+@api.route('/<string:schedule_id>')
+class ScheduleCancel(Resource):
+    """Endpoint to cancel a schedule."""
+    @requires_auth
+    def delete(self, schedule_id):  # pylint: disable=no-self-use
+        """Cancels a schedule."""
+        from . import scheduler
+        if not scheduler.cancel(schedule_id):
+            api.abort(404, "Schedule '{}' is unknown".format(schedule_id))
+        return '', 204
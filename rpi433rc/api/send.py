@@ -1,24 +1,42 @@
 """Provides endpoints to send bare codes to devices via 433 mhz hardware."""
 
-from flask_restplus import Resource, Namespace, fields
+from flask_restplus import Resource, Namespace, fields, reqparse
 
 from .flaskutil.auth import requires_auth
+from .flaskutil.ratelimit import rate_limited
+from ..business.rc433 import UnsupportedDeviceError
 
 api = Namespace('send', description='Remote control related operations')  # pylint: disable=invalid-name
 
 
+@api.errorhandler(UnsupportedDeviceError)
+def unsupported(error):
+    """Unsupported timing error serializer."""
+    return {'message': str(error), 'value': 'protocol'}, 400
+
+
 CODE = api.model('Code', {
     'code': fields.Integer,
     'result': fields.Boolean
 })
 
+TIMING_ARGS = reqparse.RequestParser()  # pylint: disable=invalid-name
+TIMING_ARGS.add_argument('protocol', type=int, help='The rpi_rf protocol (1 - 6)')
+TIMING_ARGS.add_argument('pulse_length', type=int, help='The pulse length in us')
+TIMING_ARGS.add_argument('code_length', type=int, help='The length of the code in bits')
+
 
 @api.route('/<int:code>')
 class SendCode(Resource):
     """Endpoint to send bare 433mhz codes to devices in range."""
     @requires_auth
+    @rate_limited('rest')
+    @api.expect(TIMING_ARGS)
     @api.marshal_with(CODE)
     def get(self, code):  # pylint: disable=no-self-use
-        """Implements get operation."""
+        """Sends the code. Pass the timing of the remote if it is not rpi_rf's default."""
         from . import device_db
-        return {'code': code, 'result': device_db.rc433.send_code(code)}
+        args = TIMING_ARGS.parse_args()
+        timing = (args['protocol'], args['pulse_length'], args['code_length'])
+        return {'code': code, 'result': device_db.rc433.send_code(
+            code, source='rest', timing=timing if any(timing) else None)}
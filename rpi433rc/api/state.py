@@ -0,0 +1,43 @@
+"""State related routes."""
+
+from flask_restplus import Resource, Namespace, fields, reqparse
+
+from .flaskutil.auth import requires_auth
+
+api = Namespace('state', description='Device state related operations')  # pylint: disable=invalid-name
+
+
+CHANGE = api.model('StateChange', {
+    'device_name': fields.String,
+    'state': fields.String(attribute=lambda o: None if o.state is None else
+                           ('on' if o.state else 'off'),
+                           description="'on', 'off' or null if the device was removed"),
+    'version': fields.Integer(description='Version of the last change of the device')
+})
+
+CHANGES = api.model('StateChanges', {
+    'epoch': fields.String(description='Identifies the journal. Pass it along with since'),
+    'version': fields.Integer(description='The current version. Pass it as since next time'),
+    'resync': fields.Boolean(description='If true, changes holds the states of all devices'),
+    'changes': fields.List(fields.Nested(CHANGE))
+})
+
+CHANGES_ARGS = reqparse.RequestParser()  # pylint: disable=invalid-name
+CHANGES_ARGS.add_argument('since', type=int, default=0,
+                          help='The version of the last call (0 for all devices)')
+CHANGES_ARGS.add_argument('epoch', type=str, help='The epoch of the last call')
+
+
+@api.route('/changes')
+class StateChanges(Resource):
+    """Endpoint to fetch the state changes since a version."""
+    @requires_auth
+    @api.expect(CHANGES_ARGS)
+    @api.marshal_with(CHANGES)
+    def get(self):  # pylint: disable=no-self-use
+        """Lists the devices that changed since the given version. If the changes are no longer
+        known (or the epoch changed, e.g. by a restart) or since is 0, the states of all devices
+        are returned and resync is set."""
+        from . import device_db
+        args = CHANGES_ARGS.parse_args()
+        return device_db.changes(since=args['since'], epoch=args['epoch'])
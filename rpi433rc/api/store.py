@@ -0,0 +1,128 @@
+"""Provides endpoints to add, change and remove devices at runtime (requires a modifiable device
+store like sqlite)."""
+
+from flask import Response, request
+from flask_restplus import Resource, Namespace, fields, reqparse
+
+from .devices import DEVICE
+from .flaskutil import fields as _fields
+from .flaskutil.auth import requires_auth
+from .flaskutil.serializer import marshal_fast
+from ..business.devicefile import iter_export, FORMAT_JSON, FORMAT_JSONL
+from ..business.devices import ReadOnlyStoreError, UnknownDeviceError, build_device
+
+api = Namespace('store', description='Add, change and remove devices at runtime')  # pylint: disable=invalid-name
+
+
+@api.errorhandler(UnknownDeviceError)
+def unknown_device(error):
+    """Unknown device error serializer."""
+    return {'message': str(error), 'value': 'device_name'}, 404
+
+
+@api.errorhandler(ReadOnlyStoreError)
+def read_only(error):
+    """Read-only store error serializer."""
+    return {'message': str(error)}, 405
+
+
+@api.errorhandler(ValueError)
+def misconfigured(error):
+    """Invalid device error serializer."""
+    return {'message': str(error)}, 400
+
+
+NEW_DEVICE = api.model('NewDevice', {
+    'device_name': fields.String(required=True),
+    'configuration': _fields.Dict(required=True, description='e.g. {"code_on": 1, "code_off": 2}')
+})
+
+FIND_ARGS = reqparse.RequestParser()  # pylint: disable=invalid-name
+FIND_ARGS.add_argument('type', type=str, help='Only devices of this type (e.g. CodeDevice)')
+FIND_ARGS.add_argument('code', type=int, help='Only devices with this on or off code')
+FIND_ARGS.add_argument('group', type=str, help='Only members of this group')
+
+
+def _build(device_name, payload):
+    if not isinstance(payload, dict) or not isinstance(payload.get('configuration'), dict):
+        api.abort(400, "Expected an object with a configuration")
+    if not isinstance(device_name, str) or not device_name:
+        api.abort(400, "Expected a device_name")
+    return build_device(device_name, payload['configuration'])
+
+
+@api.route('/devices')
+class StoreDeviceList(Resource):
+    """Endpoint to find and add devices."""
+    @requires_auth
+    @api.expect(FIND_ARGS)
+    @marshal_fast(api, DEVICE)
+    def get(self):  # pylint: disable=no-self-use
+        """Finds devices by their type, code and / or group."""
+        from . import device_db
+        args = FIND_ARGS.parse_args()
+        return device_db.find(device_type=args['type'], code=args['code'], group=args['group'])
+
+    @requires_auth
+    @api.expect(NEW_DEVICE)
+    @marshal_fast(api, DEVICE, code=201)
+    def post(self):  # pylint: disable=no-self-use
+        """Adds a device."""
+        from . import device_db
+        payload = api.payload
+        device = _build((payload or {}).get('device_name'), payload)
+        try:
+            device_db.lookup(device_name=device.device_name)
+        except UnknownDeviceError:
+            pass
+        else:
+            api.abort(409, "Device '{}' already exists".format(device.device_name))
+        device_db.add(device)
+        return device_db.lookup(device_name=device.device_name)
+
+
+@api.route('/export')
+class StoreExport(Resource):
+    """Endpoint to export the device configurations."""
+    @requires_auth
+    @api.param('format', "'json' (like devices.json) or 'jsonl' (one device per line)",
+               enum=[FORMAT_JSON, FORMAT_JSONL], default=FORMAT_JSON)
+    def get(self):  # pylint: disable=no-self-use
+        """Streams the configuration of all devices of this node (devices of remote cluster nodes
+        are left out). The result can be used as devices.json."""
+        from . import device_db
+        fmt = request.args.get('format', FORMAT_JSON)
+        if fmt not in (FORMAT_JSON, FORMAT_JSONL):
+            api.abort(400, "Unknown format '{}'".format(fmt))
+        devices = (stateful.device for stateful in device_db.find())  # The local devices
+        return Response(
+            (chunk.encode('utf-8') for chunk in iter_export(devices, fmt)),
+            mimetype='application/x-ndjson' if fmt == FORMAT_JSONL else 'application/json'
+        )
+
+
+@api.route('/devices/<string:device_name>')
+class StoreDevice(Resource):
+    """Endpoint to change and remove a specific device."""
+    @requires_auth
+    @marshal_fast(api, DEVICE)
+    def get(self, device_name):  # pylint: disable=no-self-use
+        """Implements get operation."""
+        from . import device_db
+        return device_db.lookup(device_name=device_name)
+
+    @requires_auth
+    @api.expect(NEW_DEVICE)
+    @marshal_fast(api, DEVICE)
+    def put(self, device_name):  # pylint: disable=no-self-use
+        """Adds or replaces the device."""
+        from . import device_db
+        device_db.add(_build(device_name, api.payload))
+        return device_db.lookup(device_name=device_name)
+
+    @requires_auth
+    def delete(self, device_name):  # pylint: disable=no-self-use
+        """Removes the device. Members of groups can not be removed."""
+        from . import device_db
+        device_db.remove(device_name)
+        return '', 204
@@ -0,0 +1,250 @@
+"""Audit log of every transmission. The records are kept in a fixed-size, memory-mapped ring
+buffer file with fixed-width records. The file is allocated once and never rewritten as a whole,
+so it is cheap enough to leave on permanently (even on sd cards)."""
+
+import argparse
+import contextlib
+import datetime
+import fcntl
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+import attr
+
+from ..util import LogMixin
+
+MAGIC = b'RC433AUD'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQ')  # magic, version, record size, capacity, head
+# Index of the record that is written next (head + 1 while a record is written). Lets readers
+# detect records that were overwritten while they scanned them
+RESERVED = struct.Struct('<Q')
+HEADER_SIZE = 64
+# timestamp, code, device name, source, repeats, duration, result
+RECORD = struct.Struct('<dQ32s8sHfB')
+RECORD_SIZE = 64
+
+
+def _encode(value, size):
+    return (value or '').encode('utf-8')[:size]
+
+
+def _decode(value):
+    return value.rstrip(b'\0').decode('utf-8', errors='replace') or None
+
+
+@attr.s
+class AuditRecord:  # pylint: disable=too-few-public-methods
+    """A single transmission."""
+    timestamp = attr.ib(converter=float)
+    code = attr.ib(converter=int)
+    device_name = attr.ib(default=None)
+    source = attr.ib(default=None)
+    repeats = attr.ib(converter=int, default=1)
+    duration = attr.ib(converter=float, default=0.0)
+    result = attr.ib(converter=bool, default=True)
+
+
+@attr.s
+class AuditLog(LogMixin):
+    """
+    Memory-mapped ring buffer of transmissions. When the buffer is full the oldest records are
+    overwritten. Several processes may append to the same file: The head is read from the
+    header under an exclusive file lock on every append. Queries do not take the lock.
+
+    Example:
+
+        >>> import tempfile
+        >>> fn = tempfile.NamedTemporaryFile().name
+        >>> dut = AuditLog(fn, capacity=2)
+        >>> dut.append(AuditRecord(1.0, 12345, 'device1', 'rest', 3, 0.1, True))
+        >>> dut.append(AuditRecord(2.0, 23456, 'device2', 'mqtt', 3, 0.1, True))
+        >>> dut.append(AuditRecord(3.0, 12345, 'device1', 'mqtt', 3, 0.1, False))
+        >>> [(rec.timestamp, rec.device_name, rec.result) for rec in dut.query()]
+        [(3.0, 'device1', False), (2.0, 'device2', True)]
+        >>> [rec.timestamp for rec in dut.query(device_name='device2')]
+        [2.0]
+        >>> [rec.timestamp for rec in dut.query(since=2.5)]
+        [3.0]
+
+        Another process appends to the same file
+
+        >>> other = AuditLog(fn, capacity=2)
+        >>> other.append(AuditRecord(4.0, 12345, 'device1', 'rest', 3, 0.1, True))
+        >>> [rec.timestamp for rec in dut.query()]
+        [4.0, 3.0]
+        >>> other.close()
+        >>> dut.close()
+
+        The records survive a restart
+
+        >>> len(AuditLog(fn, capacity=2).query())
+        2
+    """
+    file_name = attr.ib(converter=str)
+    capacity = attr.ib(converter=int, default=1000000)
+    _mmap = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _fd = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, init=False)
+
+    def __attrs_post_init__(self):
+        size = HEADER_SIZE + self.capacity * RECORD_SIZE
+        self._fd = os.open(self.file_name, os.O_RDWR | os.O_CREAT, 0o644)
+        with self._file_lock():
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._mmap = mmap.mmap(self._fd, size)
+
+            magic, version, record_size, capacity, _ = HEADER.unpack_from(self._mmap, 0)
+            if (magic, version, record_size, capacity) != (MAGIC, VERSION, RECORD_SIZE,
+                                                           self.capacity):
+                if magic == MAGIC:
+                    self.logger.warning("Audit log %s has an incompatible layout. Starting over.",
+                                        self.file_name)
+                self._write_head(0)
+            RESERVED.pack_into(self._mmap, HEADER.size, self._read_head())
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Serializes the appends of all threads and processes that share the file."""
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _read_head(self):
+        return HEADER.unpack_from(self._mmap, 0)[4]
+
+    def _write_head(self, head):
+        HEADER.pack_into(self._mmap, 0, MAGIC, VERSION, RECORD_SIZE, self.capacity, head)
+
+    def __len__(self):
+        return min(self._read_head(), self.capacity)
+
+    def append(self, record):
+        """Appends a transmission record. Overwrites the oldest one if the buffer is full."""
+        with self._file_lock():
+            head = self._read_head()  # Another process may have appended meanwhile
+            RESERVED.pack_into(self._mmap, HEADER.size, head + 1)
+            offset = HEADER_SIZE + (head % self.capacity) * RECORD_SIZE
+            RECORD.pack_into(self._mmap, offset, record.timestamp, record.code,
+                             _encode(record.device_name, 32), _encode(record.source, 8),
+                             min(record.repeats, 0xFFFF), record.duration, record.result)
+            self._write_head(head + 1)  # The record is complete before it becomes visible
+
+    def _read(self, index):
+        offset = HEADER_SIZE + (index % self.capacity) * RECORD_SIZE
+        timestamp, code, device_name, source, repeats, duration, result = \
+            RECORD.unpack_from(self._mmap, offset)
+        return AuditRecord(timestamp, code, _decode(device_name), _decode(source), repeats,
+                           duration, result)
+
+    def query(self, device_name=None, since=None, until=None, limit=None):
+        """
+        Returns the most recent transmissions (newest first). The records are scanned without
+        blocking appends (seqlock style): Records that were overwritten during the scan are
+        dropped. Timestamps are filtered, not searched: They are not ordered (e.g. before the
+        clock is synced or if radios of a pool append concurrently).
+
+        Args:
+            device_name (str): Only transmissions of this device.
+            since (float): Only transmissions at or after this timestamp (epoch seconds).
+            until (float): Only transmissions at or before this timestamp (epoch seconds).
+            limit (int): Return at most this many records.
+
+        Returns:
+            A list of `AuditRecord`.
+        """
+        last = self._read_head()
+        first = max(0, last - self.capacity)
+        res = []
+        for index in range(last - 1, first - 1, -1):
+            if limit is not None and len(res) >= limit:
+                break
+            record = self._read(index)
+            if since is not None and record.timestamp < since:
+                continue
+            if until is not None and record.timestamp > until:
+                continue
+            if device_name is not None and record.device_name != device_name:
+                continue
+            res.append((index, record))
+        # Records that were (or are being) overwritten during the scan are dropped
+        oldest_valid = RESERVED.unpack_from(self._mmap, HEADER.size)[0] - self.capacity
+        return [record for index, record in res if index >= oldest_valid]
+
+    def flush(self):
+        """Writes the changes to disk."""
+        self._mmap.flush()
+
+    def close(self):
+        """Writes the changes to disk and closes the file."""
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap.close()
+            self._mmap = None
+            os.close(self._fd)
+            self._fd = None
+
+
+def record_transmission(audit_log, code, device_name, source, repeats, started, result):
+    """Appends a transmission that started at `started` (time.time()) to the audit log."""
+    if audit_log is None:
+        return
+    audit_log.append(AuditRecord(timestamp=started, code=code, device_name=device_name,
+                                 source=source, repeats=repeats,
+                                 duration=time.time() - started, result=result))
+
+
+def stored_capacity(file_name):
+    """Returns the capacity of an existing audit log file; None if it is not an audit log."""
+    if not os.path.isfile(file_name):
+        return None
+    with open(file_name, 'rb') as fpointer:
+        header = fpointer.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    magic, version, _, capacity, _ = HEADER.unpack(header)
+    return capacity if (magic, version) == (MAGIC, VERSION) else None
+
+
+def _parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        return time.mktime(datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S').timetuple())
+
+
+def main(argv=None):
+    """Command line interface to query the audit log."""
+    parser = argparse.ArgumentParser(description='Query the transmission audit log.')
+    parser.add_argument('file_name', help='Path of the audit log file')
+    parser.add_argument('--device', default=None, help='Only transmissions of this device')
+    parser.add_argument('--since', type=_parse_time, default=None,
+                        help="Epoch seconds or 'YYYY-MM-DD HH:MM:SS'")
+    parser.add_argument('--until', type=_parse_time, default=None,
+                        help="Epoch seconds or 'YYYY-MM-DD HH:MM:SS'")
+    parser.add_argument('--limit', type=int, default=100, help='Max. number of records')
+    args = parser.parse_args(argv)
+
+    capacity = stored_capacity(args.file_name)
+    if capacity is None:
+        parser.error("'{}' is not an audit log".format(args.file_name))
+    audit_log = AuditLog(args.file_name, capacity=capacity)
+    for record in audit_log.query(device_name=args.device, since=args.since, until=args.until,
+                                  limit=args.limit):
+        sys.stdout.write("{}\t{}\t{}\t{}\t{}\t{:.3f}s\t{}\n".format(
+            datetime.datetime.fromtimestamp(record.timestamp).isoformat(), record.device_name,
+            record.code, record.source, record.repeats, record.duration,
+            'ok' if record.result else 'failed'))
+    audit_log.close()
+
+
+if __name__ == '__main__':
+    main()
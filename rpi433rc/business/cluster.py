@@ -0,0 +1,269 @@
+"""Cluster related components. One instance acts as a front door and forwards requests
+for devices that are owned by other rpi433rc instances (nodes)."""
+
+import base64
+import http.client
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import attr
+
+from .devices import DeviceStore, UnknownDeviceError, device_validator, device_from_json
+from .registry import DeviceRegistry, StatefulDevice, SwitchResult
+from .state import DeviceState
+from .. import codec
+from ..util import LogMixin, on_off_to_bool, bool_to_on_off
+
+
+class RemoteNodeError(Exception):
+    """Raised when a remote node is unreachable or answers with an error."""
+    pass  # pylint: disable=unnecessary-pass
+
+
+def stateful_device_from_json(obj):
+    """
+    Creates a `StatefulDevice` from its serialized form (as used by the rest api).
+
+    Example:
+
+        >>> dev = stateful_device_from_json({'device_name': 'device1', 'type': 'CodeDevice',
+        ...                                  'configuration': {'code_on': 1, 'code_off': 2},
+        ...                                  'state': 'on'})
+        >>> dev.device_name, dev.device.code_on, dev.state
+        ('device1', 1, True)
+    """
+    device = device_from_json(obj['device_name'], obj['type'], obj['configuration'])
+    return StatefulDevice(device_name=device.device_name, device=device,
+                          state=on_off_to_bool(obj['state']))
+
+
+@attr.s
+class RemoteNode(LogMixin):
+    """
+    Client of a remote rpi433rc instance. Connections are kept alive and reused.
+
+    Example:
+
+        >>> RemoteNode('garden', 'http://10.0.0.5:5000')
+        RemoteNode(name='garden', url='http://10.0.0.5:5000', timeout=2.0, user=None)
+    """
+    name = attr.ib(converter=str)
+    url = attr.ib(converter=str)
+    timeout = attr.ib(converter=float, default=2.0)
+    user = attr.ib(default=None)
+    password = attr.ib(default=None, repr=False)
+    _idle = attr.ib(default=attr.Factory(list), repr=False, cmp=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, init=False)
+
+    def _headers(self):
+        headers = {'Accept': 'application/json', 'Connection': 'keep-alive'}
+        if self.user is not None:
+            credentials = '{}:{}'.format(self.user, self.password).encode('utf-8')
+            headers['Authorization'] = 'Basic ' + base64.b64encode(credentials).decode('ascii')
+        return headers
+
+    def _connect(self):
+        parts = urlsplit(self.url)
+        if parts.scheme == 'https':
+            return http.client.HTTPSConnection(parts.hostname, parts.port, timeout=self.timeout)
+        return http.client.HTTPConnection(parts.hostname, parts.port, timeout=self.timeout)
+
+    def _acquire(self, fresh=False):
+        with self._lock:
+            if self._idle and not fresh:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _release(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def _request(self, path):
+        return self._get(urlsplit(self.url).path.rstrip('/') + path)
+
+    def _get(self, path, fresh=False):
+        conn, reused = self._acquire(fresh)
+        try:
+            try:
+                conn.request('GET', path, headers=self._headers())
+                resp = conn.getresponse()
+            except (BrokenPipeError, ConnectionResetError):
+                # Includes `RemoteDisconnected`: The node closed the connection before it sent any
+                # response byte. If it was an idle one, the node did not see the request: Retry
+                # on a new connection. Anything else (e.g. a timeout) may have switched already.
+                if not reused:
+                    raise
+                conn.close()
+                return self._get(path, fresh=True)
+            body = resp.read()
+        except (OSError, http.client.HTTPException) as exc:
+            conn.close()
+            raise RemoteNodeError("Node '{}' is not reachable: {}".format(self.name, exc))
+        self._release(conn)
+
+        if resp.status == 400:
+            raise UnknownDeviceError(codec.loads(body).get('message'))
+        if resp.status != 200:
+            raise RemoteNodeError("Node '{}' answered with status {}"
+                                  .format(self.name, resp.status))
+        return codec.loads(body)
+
+    def list(self):
+        """Lists all devices of the node."""
+        return [stateful_device_from_json(obj) for obj in self._request('/devices/list')]
+
+    def lookup(self, device_name):
+        """Lookup a single device of the node."""
+        return stateful_device_from_json(self._request('/devices/{}'.format(device_name)))
+
+    def switch(self, on_off, device_name):
+        """Switches a device of the node. Returns a `SwitchResult`."""
+        res = self._request('/devices/{}/{}'.format(device_name, bool_to_on_off(on_off)))
+        return SwitchResult(result=res.get('result'), transmitted=res.get('transmitted', True))
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+@attr.s
+class ClusterRegistry(DeviceStore, DeviceState):
+    """
+    Front door of a cluster of rpi433rc instances. Requests for devices that are routed to a
+    remote node are forwarded to that node. Any other device is handled by the local registry.
+    Listing devices fans out to all nodes in parallel; nodes that do not answer in time
+    are left out.
+
+    Example:
+
+        >>> from rpi433rc.business.devices import DeviceDict
+        >>> from rpi433rc.business.state import MemoryState
+        >>> from rpi433rc.business.rc433 import RFDeviceMock, RC433
+        >>> rc433 = RC433()
+        >>> rc433.rf_device = RFDeviceMock()
+        >>> local = DeviceRegistry(DeviceDict({'device1': {"code_on": 1, 'code_off': 2}}),
+        ...                        MemoryState(), rc433)
+        >>> dut = ClusterRegistry(local, nodes={}, routes={})
+        >>> dut.switch(True, device_name='device1')
+        SwitchResult(result=True, transmitted=True)
+        >>> [(dev.device_name, dev.state) for dev in dut.list()]
+        [('device1', True)]
+    """
+    local = attr.ib(validator=attr.validators.instance_of(DeviceRegistry))
+    nodes = attr.ib(validator=attr.validators.instance_of(dict))
+    routes = attr.ib(validator=attr.validators.instance_of(dict))
+    _executor = attr.ib(default=None, repr=False, cmp=False, init=False)
+
+    def __attrs_post_init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.nodes)))
+
+    @property
+    def rc433(self):
+        """The local radio."""
+        return self.local.rc433
+
+    def _node(self, device_name):
+        node_name = self.routes.get(device_name)
+        if node_name is None:
+            return None
+        try:
+            return self.nodes[node_name]
+        except KeyError:
+            raise RemoteNodeError("Node '{}' of device '{}' is not configured"
+                                  .format(node_name, device_name))
+
+    @device_validator
+    def lookup(self, device=None, device_name=None):
+        node = self._node(device_name)
+        if node is None:
+            return self.local.lookup(device=device, device_name=device_name)
+        return node.lookup(device_name)
+
+    def list(self):
+        futures = {self._executor.submit(node.list): node for node in self.nodes.values()}
+        devices = self.local.list()
+
+        timeout = max([node.timeout for node in self.nodes.values()] or [0])
+        done, _ = wait(futures, timeout=timeout)
+        for future, node in futures.items():
+            if future not in done:
+                self.logger.warning("Node '%s' did not answer in time", node.name)
+                continue
+            try:
+                devices.extend(future.result())
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception("Listing the devices of node '%s' failed", node.name)
+        return devices
+
+    @device_validator
+    def switch(self, on_off, device=None, device_name=None, source=None):
+        node = self._node(device_name)
+        if node is None:
+            return self.local.switch(on_off, device=device, device_name=device_name,
+                                     source=source)
+        self.logger.info("Forwarding switch of %s to node '%s'", device_name, node.name)
+        return node.switch(on_off, device_name)
+
+    def start(self):
+        """Arms the local radio."""
+        self.local.start()
+
+    def stop(self):
+        """Releases the local radio."""
+        self.local.stop()
+
+    def readiness(self):
+        """Reports the readiness of the local registry."""
+        return self.local.readiness()
+
+    def changes(self, since=0, epoch=None):
+        """Returns the state changes of the local registry. Remote devices are not versioned."""
+        return self.local.changes(since, epoch)
+
+    def add(self, device):
+        """Adds a device to the local registry."""
+        return self.local.add(device)
+
+    def observe(self, observer):
+        """Registers an observer of the devices of the local registry."""
+        self.local.observe(observer)
+
+    def remove(self, device_name):
+        """Removes a device from the local registry."""
+        if self._node(device_name) is not None:
+            raise ValueError("The device '{}' is routed to a remote node".format(device_name))
+        self.local.remove(device_name)
+
+    def find(self, device_type=None, code=None, group=None):
+        """Finds devices of the local registry."""
+        return self.local.find(device_type, code, group)
+
+    @classmethod
+    def from_json(cls, local, file_name):
+        """
+        Creates a cluster registry from a json file.
+
+            {
+                "nodes": {"garden": {"url": "http://10.0.0.5:5000", "timeout": 2}},
+                "devices": {"pump": "garden"}
+            }
+
+        Args:
+            local (DeviceRegistry): The registry of this instance.
+            file_name (str): Path of the file to load the cluster configuration from.
+
+        Returns:
+            Returns a `ClusterRegistry`.
+        """
+        with open(file_name, 'r') as fpointer:
+            jsonf = codec.load(fpointer)
+
+        nodes = {
+            name: RemoteNode(name=name, **props)
+            for name, props in jsonf.get('nodes', {}).items()
+        }
+        return cls(local, nodes=nodes, routes=dict(jsonf.get('devices', {})))
@@ -0,0 +1,127 @@
+"""Vectorized decoding of received edge durations (requires numpy). The frames of a capture are
+batched into arrays and matched against all protocols at once; `learn.decode` is the plain
+python counterpart and yields the same frames."""
+
+import attr
+import numpy as np
+
+from .learn import Decoded, MIN_BITS, MIN_GAP, TOLERANCE
+from .protocols import known_protocols
+
+MAX_BITS = 64  # Codes are packed into uint64
+_CHUNK = 4096  # Frames per pass. Bounds the memory of the frames x protocols x bits arrays
+
+
+@attr.s
+class DecoderBank:
+    """
+    Decodes captures against a bank of protocols (rpi_rf's protocols plus custom ones) in a
+    single vectorized pass per frame length. A bit matches if its timing is within the
+    `tolerance` (relative to the pulse length); ambiguous frames are assigned to the protocol
+    with the least timing error.
+
+    Example:
+
+        >>> from rpi433rc.business.learn import encode
+        >>> dut = DecoderBank()
+        >>> capture = [300] + encode(1234, protocol=5) * 3 + encode(77, bit_length=12) * 3
+        >>> dut.decode(capture)  # doctest: +NORMALIZE_WHITESPACE
+        [Decoded(code=1234, bit_length=24, protocol=5, pulse_length=500),
+         Decoded(code=1234, bit_length=24, protocol=5, pulse_length=500),
+         Decoded(code=77, bit_length=12, protocol=5, pulse_length=500),
+         Decoded(code=77, bit_length=12, protocol=1, pulse_length=350),
+         Decoded(code=77, bit_length=12, protocol=1, pulse_length=350)]
+        >>> dut.presses(capture)  # The 3rd frame was misread by the sync of protocol 5
+        [Decoded(code=1234, bit_length=24, protocol=5, pulse_length=500), \
+Decoded(code=77, bit_length=12, protocol=1, pulse_length=350)]
+    """
+    protocols = attr.ib(default=None)
+    tolerance = attr.ib(converter=float, default=TOLERANCE)
+    min_gap = attr.ib(converter=int, default=MIN_GAP)
+    min_repeats = attr.ib(converter=int, default=2)
+    _numbers = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _table = attr.ib(default=None, repr=False, cmp=False, init=False)
+
+    def __attrs_post_init__(self):
+        self.protocols = list(self.protocols or known_protocols())
+        self._numbers = np.array([number for number, _ in self.protocols], dtype=np.int64)
+        # One row per protocol: pulse_length, sync_high, sync_low, zero_high, ..., one_low
+        self._table = np.array([proto for _, proto in self.protocols], dtype=np.float64)
+
+    def _match(self, frames, sync):
+        """Matches k frames of n bits (k x 2n durations) against all protocols. Returns the code,
+        the index of the protocol and the pulse length of each frame and a mask of the matched
+        frames."""
+        table = self._table
+        delay = sync[:, None] / table[None, :, 2]  # frames x protocols
+        scale = delay[:, :, None]
+        high, low = frames[:, None, 0::2], frames[:, None, 1::2]
+        zero = (np.abs(high - scale * table[None, :, 3, None]) +
+                np.abs(low - scale * table[None, :, 4, None]))
+        one = (np.abs(high - scale * table[None, :, 5, None]) +
+               np.abs(low - scale * table[None, :, 6, None]))
+        error = np.minimum(zero, one)  # frames x protocols x bits
+        bit_count = frames.shape[1] // 2
+        weights = np.left_shift(np.uint64(1), np.arange(bit_count - 1, -1, -1, dtype=np.uint64))
+        codes = (one <= zero).astype(np.uint64) @ weights
+        matched = (error < self.tolerance * scale).all(axis=2) & (codes != 0)
+        score = np.where(matched, error.sum(axis=2) / delay, np.inf)
+        best = score.argmin(axis=1)
+        rows = np.arange(len(frames))
+        return (codes[rows, best], best, np.rint(delay[rows, best]),
+                np.isfinite(score[rows, best]))
+
+    def decode(self, durations):
+        """
+        Decodes the frames of a sequence of edge durations (us). Frames are separated by the
+        long low of the sync; the first frame is only decoded if its sync precedes it.
+
+        Returns:
+            Returns the decoded frames in order of reception.
+        """
+        durations = np.asarray(durations, dtype=np.float64)
+        gaps = np.flatnonzero(durations > self.min_gap)
+        if len(gaps) < 2:
+            return []
+        starts = gaps[:-1] + 1
+        bit_counts = (gaps[1:] - starts) // 2  # Drops the high of the next sync
+        sync = durations[gaps[:-1]]
+        codes = np.zeros(len(starts), dtype=np.uint64)
+        protocols = np.zeros(len(starts), dtype=np.int64)
+        pulse_lengths = np.zeros(len(starts), dtype=np.int64)
+        found = np.zeros(len(starts), dtype=bool)
+        candidates = (bit_counts >= MIN_BITS) & (bit_counts <= MAX_BITS)
+        for bit_count in np.unique(bit_counts[candidates]):
+            offsets = np.arange(2 * bit_count)
+            selected = np.flatnonzero(candidates & (bit_counts == bit_count))
+            for i in range(0, len(selected), _CHUNK):
+                chunk = selected[i:i + _CHUNK]
+                frames = durations[starts[chunk, None] + offsets]
+                (codes[chunk], protocols[chunk], pulse_lengths[chunk],
+                 found[chunk]) = self._match(frames, sync[chunk])
+        return [Decoded(int(codes[i]), int(bit_counts[i]), int(self._numbers[protocols[i]]),
+                        int(pulse_lengths[i]))
+                for i in np.flatnonzero(found)]
+
+    def vote(self, frames):
+        """
+        Collapses the repeated frames of a button press to a single frame (with the median
+        pulse length). Runs of less than `min_repeats` identical frames are dropped as noise.
+        """
+        res = []
+        run = []
+        for frame in list(frames) + [None]:
+            if run and (frame is None or (frame.code, frame.bit_length, frame.protocol) !=
+                        (run[0].code, run[0].bit_length, run[0].protocol)):
+                if len(run) >= self.min_repeats:
+                    pulse_lengths = sorted(decoded.pulse_length for decoded in run)
+                    res.append(attr.evolve(run[0],
+                                           pulse_length=pulse_lengths[len(run) // 2]))
+                run = []
+            if frame is not None:
+                run.append(frame)
+        return res
+
+    def presses(self, durations):
+        """Returns the button presses of a capture (see `decode` and `vote`)."""
+        return self.vote(self.decode(durations))
@@ -0,0 +1,300 @@
+"""Streaming import and export of device configurations. Devices are validated and created entry
+by entry, so the whole document is never held in memory.
+
+Two formats are supported:
+
+* json: A json object of device name -> configuration (like `devices.json`)
+* jsonl: One json object per line; the device name is given by the key `device_name`
+"""
+
+import json
+import re
+import sys
+from collections import OrderedDict
+
+from .devices import DeviceGroup, build_device, check_group
+from .. import codec
+
+FORMAT_JSON = 'json'
+FORMAT_JSONL = 'jsonl'
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class DeviceImportError(ValueError):
+    """
+    Raised when a device file contains errors. `errors` is the list of (line, message).
+
+    Example:
+
+        >>> DeviceImportError([(3, "Misconfigured device 'device1'")])
+        DeviceImportError("Line 3: Misconfigured device 'device1'")
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('\n'.join("Line {}: {}".format(line, message)
+                                   for line, message in errors))
+
+
+def format_of(file_name):
+    """
+    Returns the format of a device file by its extension.
+
+    Example:
+
+        >>> format_of('devices.json'), format_of('devices.jsonl'), format_of('devices.ndjson')
+        ('json', 'jsonl', 'jsonl')
+    """
+    return FORMAT_JSONL if file_name.endswith(('.jsonl', '.ndjson')) else FORMAT_JSON
+
+
+class _Scanner:
+    """Incrementally scans a json object of device configurations from a file."""
+    def __init__(self, fpointer, chunk_size):
+        self.fpointer = fpointer
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self._line = 1
+        self._counted = 0
+
+    def line(self):
+        """Returns the line number of the current position."""
+        self._line += self.buf.count('\n', self._counted, self.pos)
+        self._counted = self.pos
+        return self._line
+
+    def _fill(self):
+        chunk = self.fpointer.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.line()
+        self.buf = self.buf[self.pos:] + chunk  # Forget what is consumed
+        self.pos = self._counted = 0
+        return True
+
+    def peek(self):
+        """Skips whitespace and returns the next character ('' at the end of the file)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        """Consumes one of the given characters."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("Expected one of {} but found {}".format(
+                ', '.join(repr(c) for c in chars), repr(char) if char else 'the end of the file'))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decodes the next json value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self._fill():
+                    continue  # The value might be incomplete
+                raise
+            if end == len(self.buf) and self._fill():
+                continue  # A number might be cut off
+            self.pos = end
+            return obj
+
+
+def iter_json(fpointer, chunk_size=65536):
+    """
+    Iterates over the entries of a json object of device configurations.
+
+    Example:
+
+        >>> import io
+        >>> list(iter_json(io.StringIO('{\\n"device1": {"code_on": 1},\\n"device2": {}\\n}')))
+        [(2, 'device1', {'code_on': 1}), (3, 'device2', {})]
+
+    Returns:
+        Yields (line, device name, configuration).
+    """
+    scanner = _Scanner(fpointer, chunk_size)
+    try:
+        scanner.expect('{')
+        if scanner.peek() == '}':
+            return
+        while True:
+            scanner.peek()
+            line = scanner.line()
+            device_name = scanner.value()
+            scanner.expect(':')
+            props = scanner.value()
+            yield line, device_name, props
+            if scanner.expect(',}') == '}':
+                return
+    except ValueError as exc:
+        raise DeviceImportError([(scanner.line(), "Invalid json: {}".format(exc))])
+
+
+def iter_jsonl(fpointer):
+    """
+    Iterates over the lines of a json lines file of device configurations. Lines with invalid
+    json are reported as (line, None, error message).
+
+    Example:
+
+        >>> import io
+        >>> list(iter_jsonl(io.StringIO('{"device_name": "device1", "code_on": 1}\\n\\n[]')))
+        [(1, 'device1', {'code_on': 1}), (3, None, 'Expected an object with a device_name')]
+
+    Returns:
+        Yields (line, device name, configuration).
+    """
+    for line, text in enumerate(fpointer, 1):
+        if not text.strip():
+            continue
+        try:
+            props = codec.loads(text)
+        except ValueError as exc:
+            yield line, None, "Invalid json: {}".format(exc)
+            continue
+        if not isinstance(props, dict) or 'device_name' not in props:
+            yield line, None, "Expected an object with a device_name"
+            continue
+        yield line, props.pop('device_name'), props
+
+
+def read_devices(fpointer, fmt=FORMAT_JSON, max_errors=100):
+    """
+    Reads, validates and creates the devices of a device file entry by entry.
+
+    Example:
+
+        >>> import io
+        >>> devices = read_devices(io.StringIO('{"device1": {"code_on": 1, "code_off": 2}}'))
+        >>> list(devices), devices['device1'].code_on
+        (['device1'], 1)
+
+        >>> read_devices(io.StringIO('{"device_name": "device1", "code_on": 1, "code_off": 2}\\n'
+        ...                          '{"device_name": "device2", "code_on": 1}\\n'
+        ...                          '{"device_name": "device1", "code_on": 1, "code_off": 2}\\n'
+        ...                          '{"device_name": "group", "members": ["device3"]}\\n'),
+        ...              fmt='jsonl')
+        Traceback (most recent call last):
+        ...
+        rpi433rc.business.devicefile.DeviceImportError: Line 2: Misconfigured device 'device2'
+        Line 3: Duplicate device 'device1'
+        Line 4: Misconfigured device 'group': Member 'device3' is unknown or a group
+
+    Args:
+        fpointer: The file to read.
+        fmt (str): The format of the file (json or jsonl).
+        max_errors (int): Stops reading after this many errors.
+
+    Returns:
+        Returns the devices as an ordered dictionary device name -> device.
+    """
+    entries = iter_jsonl(fpointer) if fmt == FORMAT_JSONL else iter_json(fpointer)
+    devices = OrderedDict()
+    groups = []
+    errors = []
+    try:
+        for line, device_name, props in entries:
+            if len(errors) >= max_errors:
+                break
+            if device_name is None:
+                errors.append((line, props))
+                continue
+            if device_name in devices:
+                errors.append((line, "Duplicate device '{}'".format(device_name)))
+                continue
+            try:
+                device = build_device(str(device_name), props)
+            except (TypeError, ValueError) as exc:
+                errors.append((line, str(exc)))
+                continue
+            devices[device.device_name] = device
+            if isinstance(device, DeviceGroup):
+                groups.append((line, device))
+    except DeviceImportError as exc:  # Invalid json: Can not read any further
+        errors.extend(exc.errors)
+
+    def _is_member(device_name):
+        return device_name in devices and not isinstance(devices[device_name], DeviceGroup)
+
+    for line, group in groups:
+        try:
+            check_group(group, _is_member)
+        except ValueError as exc:
+            errors.append((line, str(exc)))
+    if errors:
+        raise DeviceImportError(sorted(errors)[:max_errors])
+    return devices
+
+
+def iter_export(devices, fmt=FORMAT_JSON):
+    """
+    Serializes the given devices chunk by chunk.
+
+    Example:
+
+        >>> from rpi433rc.business.devices import CodeDevice
+        >>> print(''.join(iter_export([CodeDevice('device1', code_on=1, code_off=2)])))
+        {
+        "device1":{"code_on":1,"code_off":2,"resend":3}
+        }
+        >>> print(''.join(iter_export([CodeDevice('device1', code_on=1, code_off=2)], 'jsonl')))
+        {"device_name":"device1","code_on":1,"code_off":2,"resend":3}
+        <BLANKLINE>
+    """
+    if fmt == FORMAT_JSONL:
+        for device in devices:
+            props = {'device_name': device.device_name}
+            props.update(device.configuration)
+            yield codec.dumps(props) + '\n'
+        return
+    yield '{'
+    separator = '\n'
+    for device in devices:
+        yield '{}{}:{}'.format(separator, codec.dumps(device.device_name),
+                               codec.dumps(device.configuration))
+        separator = ',\n'
+    yield '\n}'
+
+
+def write_devices(devices, fpointer, fmt=FORMAT_JSON):
+    """Writes the given devices to a file (see `iter_export`)."""
+    for chunk in iter_export(devices, fmt):
+        fpointer.write(chunk)
+
+
+def main(argv=None):
+    """
+    Command line interface. Validates a device file and optionally converts it to another
+    format.
+
+    Usage: python -m rpi433rc.business.devicefile <device_file> [<output_file>]
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        sys.stderr.write("Usage: python -m rpi433rc.business.devicefile <device_file> "
+                         "[<output_file>]\n")
+        return 2
+    try:
+        with open(argv[0], 'r', encoding='utf-8') as fpointer:
+            devices = read_devices(fpointer, format_of(argv[0]))
+    except DeviceImportError as exc:
+        sys.stderr.write("{}\n".format(exc))
+        return 1
+    sys.stdout.write("{} devices are valid\n".format(len(devices)))
+    if len(argv) > 1:
+        with open(argv[1], 'w', encoding='utf-8') as fpointer:
+            write_devices(devices.values(), fpointer, format_of(argv[1]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,10 @@
 """Device related business classes."""
 import functools
-import json
+import re
 from abc import abstractmethod
 
 import attr
-from schema import Schema, Or, Use, Optional
+from schema import Schema, SchemaError, Or, Use, Optional
 
 from ..util import LogMixin
 
@@ -14,6 +14,43 @@ class UnknownDeviceError(Exception):
     pass  # pylint: disable=unnecessary-pass
 
 
+class ReadOnlyStoreError(Exception):
+    """Error to signal that the device store can not be modified."""
+    pass  # pylint: disable=unnecessary-pass
+
+
+SWITCH_ALWAYS = 'always'
+SWITCH_SKIP_IF_SAME = 'skip_if_same'
+SWITCH_SKIP_IF_SAME_WITHIN = 'skip_if_same_within'
+
+
+def parse_switch_policy(policy):
+    """
+    Parses the switch policy of a device. Returns the policy and its time to live (if any).
+
+    Example:
+
+        >>> parse_switch_policy(None), parse_switch_policy('skip_if_same')
+        (('always', None), ('skip_if_same', None))
+        >>> parse_switch_policy('skip_if_same_within(30)')
+        ('skip_if_same_within', 30.0)
+        >>> parse_switch_policy('sometimes')
+        Traceback (most recent call last):
+        ...
+        ValueError: Unknown switch policy 'sometimes'
+    """
+    if policy is None or policy in (SWITCH_ALWAYS, SWITCH_SKIP_IF_SAME):
+        return policy or SWITCH_ALWAYS, None
+    match = re.match(r'^skip_if_same_within\((\d+(?:\.\d*)?)\)$', policy)
+    if not match:
+        raise ValueError("Unknown switch policy '{}'".format(policy))
+    return SWITCH_SKIP_IF_SAME_WITHIN, float(match.group(1))
+
+
+def _switch_policy_validator(instance, attribute, value):  # pylint: disable=unused-argument
+    parse_switch_policy(value)
+
+
 @attr.s
 class Device:
     """
@@ -32,12 +69,23 @@ class Device:
 
     @property
     def configuration(self):
-        """Returns the configuration of the device."""
-        return {
-            name: getattr(self, name, None)
-            for name, _ in self.props().items()
-            if name != 'device_name'
-        }
+        """Returns the configuration of the device. Optional settings that are not set
+        are left out."""
+        res = {}
+        for name in self._prop_names():
+            value = getattr(self, name, None)
+            if name != 'device_name' and value is not None:
+                res[name] = value
+        return res
+
+    @classmethod
+    def _prop_names(cls):
+        """Returns the names of the properties. Computed once per class."""
+        names = cls.__dict__.get('_prop_names_cache')
+        if names is None:
+            names = tuple(a.name for a in cls.__attrs_attrs__)
+            cls._prop_names_cache = names
+        return names
 
     @classmethod
     def props(cls):
@@ -61,16 +109,30 @@ class CodeDevice(Device):
     Example:
 
         >>> d2 = CodeDevice(device_name='device2', code_on="12345", code_off=23456, resend=1)
-        >>> print(repr(d2))
-        CodeDevice(device_name='device2', code_on=12345, code_off=23456, resend=1)
+        >>> print(repr(d2))  # doctest: +NORMALIZE_WHITESPACE
+        CodeDevice(device_name='device2', code_on=12345, code_off=23456, resend=1, radio=None,
+                   switch_policy=None, protocol=None, pulse_length=None, code_length=None)
+
+        >>> sorted(CodeDevice.props())  # doctest: +NORMALIZE_WHITESPACE
+        ['code_length', 'code_off', 'code_on', 'device_name', 'protocol', 'pulse_length', 'radio',
+         'resend', 'switch_policy']
+        >>> CodeDevice.props()['resend']
+        (<class 'int'>, 3)
 
-        >>> CodeDevice.props() == {'device_name': (str, None), 'code_on': (int, None),
-        ...                        'code_off': (int, None), 'resend': (int, 3)}
+        >>> d2.configuration == {'code_on': 12345, 'code_off': 23456, 'resend': 1}
         True
     """
     code_on = attr.ib(converter=int)
     code_off = attr.ib(converter=int)
     resend = attr.ib(converter=int, validator=lambda i, a, v: v > 0, default=3)
+    radio = attr.ib(converter=attr.converters.optional(str), default=None)
+    switch_policy = attr.ib(converter=attr.converters.optional(str), default=None,
+                            validator=_switch_policy_validator)
+    # The rpi_rf protocol (1 - 6), pulse length (us) and code length (bits) of the remote (e.g.
+    # found by learn mode). Unset means rpi_rf's defaults (protocol 1, 24 bits)
+    protocol = attr.ib(converter=attr.converters.optional(int), default=None)
+    pulse_length = attr.ib(converter=attr.converters.optional(int), default=None)
+    code_length = attr.ib(converter=attr.converters.optional(int), default=None)
 
 
 @attr.s
@@ -81,19 +143,134 @@ class SystemDevice(Device):
     Example:
 
         >>> d3 = SystemDevice(device_name='device3', system_code="00111", device_code="4")
-        >>> print(repr(d3))
-        SystemDevice(device_name='device3', system_code='00111', device_code=4, resend=3)
+        >>> print(repr(d3))  # doctest: +NORMALIZE_WHITESPACE
+        SystemDevice(device_name='device3', system_code='00111', device_code=4, resend=3,
+                     radio=None, switch_policy=None)
 
-        >>> SystemDevice.props() == {'device_name': (str, None), 'system_code': (str, None),
-        ...                          'device_code': (int, None), 'resend': (int, 3)}
-        True
+        >>> sorted(SystemDevice.props())
+        ['device_code', 'device_name', 'radio', 'resend', 'switch_policy', 'system_code']
     """
     system_code = attr.ib(converter=str)
     device_code = attr.ib(converter=int)
     resend = attr.ib(converter=int, validator=lambda i, a, v: v > 0, default=3)
+    radio = attr.ib(converter=attr.converters.optional(str), default=None)
+    switch_policy = attr.ib(converter=attr.converters.optional(str), default=None,
+                            validator=_switch_policy_validator)
+
 
+def _members(value):
+    """Converts the members of a group to a list of device names."""
+    if isinstance(value, str) or not value:
+        raise ValueError("Members are expected to be a non-empty list of device names")
+    return [str(member) for member in value]
 
-__ALL_DEVICES__ = [CodeDevice, SystemDevice]
+
+@attr.s
+class DeviceGroup(Device):
+    """
+    A group of devices that are switched together. Members that share a code are switched
+    by a single transmission.
+
+    Example:
+
+        >>> group = DeviceGroup(device_name='living_room', members=('lamp1', 'lamp2'))
+        >>> group
+        DeviceGroup(device_name='living_room', members=['lamp1', 'lamp2'])
+        >>> group.configuration
+        {'members': ['lamp1', 'lamp2']}
+
+        >>> DeviceGroup(device_name='living_room', members=[])
+        Traceback (most recent call last):
+        ...
+        ValueError: Members are expected to be a non-empty list of device names
+    """
+    members = attr.ib(converter=_members)
+
+
+__ALL_DEVICES__ = [CodeDevice, SystemDevice, DeviceGroup]
+
+
+def device_from_json(device_name, device_type, configuration):
+    """
+    Creates a device from its serialized form (as used by the rest api).
+
+    Example:
+
+        >>> (device_from_json('device1', 'CodeDevice', {'code_on': 1, 'code_off': 2}) ==
+        ...     CodeDevice(device_name='device1', code_on=1, code_off=2))
+        True
+
+        >>> device_from_json('device1', 'Bulb', {})
+        Traceback (most recent call last):
+        ...
+        ValueError: Unknown device type 'Bulb'
+    """
+    for dev in __ALL_DEVICES__:
+        if dev.__name__ == device_type:
+            return dev.from_props(device_name, configuration)
+    raise ValueError("Unknown device type '{}'".format(device_type))
+
+
+@functools.lru_cache(maxsize=None)
+def device_schema():
+    """
+    Returns the validation schema of a single device configuration. Created once.
+
+    Example:
+
+        >>> device_schema().validate({'code_on': '1', 'code_off': 2}) == {
+        ...     'code_on': 1, 'code_off': 2, 'resend': 3, 'radio': None, 'switch_policy': None,
+        ...     'protocol': None, 'pulse_length': None, 'code_length': None}
+        True
+    """
+    device_schemas = list()
+    for dev in __ALL_DEVICES__:
+        device_schemas.append({
+            a.name if a.default is attr.NOTHING else Optional(a.name, default=a.default):
+            Use(a.converter)
+            for a in attr.fields(dev) if a.name != 'device_name'
+        })
+    return Schema(Or(*device_schemas))
+
+
+def build_device(device_name, props, validate=True):
+    """
+    Validates the configuration of a single device and creates the device.
+
+    Example:
+
+        >>> build_device('device1', {'code_on': 1, 'code_off': 2}) == CodeDevice('device1', 1, 2)
+        True
+        >>> build_device('device1', {'code_on': 1})
+        Traceback (most recent call last):
+        ...
+        ValueError: Misconfigured device 'device1'
+    """
+    if validate:
+        try:
+            props = device_schema().validate(props)
+        except SchemaError:
+            raise ValueError("Misconfigured device '{}'".format(device_name))
+    for dev in __ALL_DEVICES__:
+        try:
+            return dev.from_props(device_name, props)
+        except (TypeError, ValueError):
+            pass
+    raise ValueError("Misconfigured device '{}'".format(device_name))
+
+
+def check_group(group, is_member):
+    """
+    Checks that all members of a group are known devices (but not groups).
+
+    Args:
+        group (DeviceGroup): The group to check.
+        is_member (callable): Returns True if the device name is a valid member.
+    """
+    for member in group.members:
+        if not is_member(member):
+            raise ValueError("Misconfigured device '{}': Member '{}' is unknown or a group"
+                             .format(group.device_name, member))
 
 
 def device_validator(fun):
@@ -106,8 +283,8 @@ def device_validator(fun):
         ...    return device, device_name
 
         >>> from rpi433rc.business.devices import CodeDevice
-        >>> do(device=CodeDevice(code_on=1, code_off=2, resend=2, device_name='d1'))
-        (CodeDevice(device_name='d1', code_on=1, code_off=2, resend=2), 'd1')
+        >>> do(device=CodeDevice(code_on=1, code_off=2, resend=2, device_name='d1'))[1]
+        'd1'
 
         >>> do(device_name='d1')
         (None, 'd1')
@@ -166,6 +343,56 @@ class DeviceStore(LogMixin):
         """
         raise NotImplementedError()
 
+    def add(self, device):
+        """
+        Adds a device or replaces the device with the same name.
+
+        Returns:
+            Returns the added device.
+        """
+        raise ReadOnlyStoreError("The device store {} can not be modified"
+                                 .format(type(self).__name__))
+
+    def remove(self, device_name):
+        """Removes a device. Raises a `UnknownDeviceError` if the device is unknown."""
+        raise ReadOnlyStoreError("The device store {} can not be modified"
+                                 .format(type(self).__name__))
+
+    def find(self, device_type=None, code=None, group=None):
+        """
+        Finds devices by their type, code (on or off) and / or group.
+
+        Example:
+
+            >>> dut = DeviceDict({'device1': {'code_on': 1, 'code_off': 2},
+            ...                   'device2': {'code_on': 3, 'code_off': 4},
+            ...                   'group1': {'members': ['device2']}})
+            >>> [device.device_name for device in dut.find(code=2)]
+            ['device1']
+            >>> [device.device_name for device in dut.find(device_type='DeviceGroup')]
+            ['group1']
+            >>> [device.device_name for device in dut.find(group='group1')]
+            ['device2']
+
+        Returns:
+            Returns a list of matching devices.
+        """
+        members = None
+        if group is not None:
+            members = set(getattr(self.lookup(device_name=group), 'members', []))
+        return [
+            device for device in self.list()
+            if (device_type is None or type(device).__name__ == device_type) and
+            (code is None or code in (getattr(device, 'code_on', None),
+                                      getattr(device, 'code_off', None))) and
+            (members is None or device.device_name in members)
+        ]
+
+    def groups_of(self, device_name):
+        """Returns the names of the groups the given device is a member of."""
+        return [device.device_name for device in self.list()
+                if device_name in getattr(device, 'members', ())]
+
 
 @attr.s
 class DeviceDict(DeviceStore):
@@ -184,15 +411,26 @@ class DeviceDict(DeviceStore):
         ...     SystemDevice(device_name='device2', system_code='00010', device_code=2)])
         True
 
-        >>> dut.lookup(device_name='device1')
-        CodeDevice(device_name='device1', code_on=12345, code_off=23456, resend=3)
+        >>> dut.lookup(device_name='device1') == CodeDevice('device1', 12345, 23456)
+        True
+
+        >>> dut = DeviceDict({'device3': {"code_on": 1, "code_off": 2, "radio": "upstairs"}})
+        >>> dut.lookup(device_name='device3').radio
+        'upstairs'
 
         >>> dut.lookup(device_name='unknown')
         Traceback (most recent call last):
         ...
         rpi433rc.business.devices.UnknownDeviceError: The requested device 'unknown' is unknown
 
-        >>> import tempfile
+        >>> dut = DeviceDict({'device1': {"code_on": 1, "code_off": 2},
+        ...                   'group1': {"members": ["device1", "device2"]}})
+        >>> dut.list()
+        Traceback (most recent call last):
+        ...
+        ValueError: Misconfigured device 'group1': Member 'device2' is unknown or a group
+
+        >>> import json, tempfile
         >>> fn = tempfile.NamedTemporaryFile().name
         >>> with open(fn, 'w') as fp:
         ...     json.dump(device_dict, fp)
@@ -204,26 +442,22 @@ class DeviceDict(DeviceStore):
     """
     device_dict = attr.ib(validator=attr.validators.instance_of(dict))
     devices = attr.ib(default=None, repr=False, cmp=False, hash=False, init=False)
+    _by_code = attr.ib(default=None, repr=False, cmp=False, hash=False, init=False)
+    _groups = attr.ib(default=None, repr=False, cmp=False, hash=False, init=False)
 
     @property
     def validation_schema(self):
         """Dynamically creates a validation schema for the device."""
-        device_schemas = list()
-        for dev in __ALL_DEVICES__:
-            props = dev.props()
-            device_schemas.append({
-                k if default is None else Optional(k, default=default): Use(conv)
-                for k, (conv, default) in props.items() if k != 'device_name'
-            })
-
         return Schema({
-            str: Or(*device_schemas)
+            str: device_schema()
         })
 
     @classmethod
     def from_json(cls, file_name):
         """
-        Instead from dictionary loads the devices from a json file.
+        Instead from dictionary loads the devices from a json file. The file is read entry by
+        entry (see `devicefile.read_devices`). Files with the extension `.jsonl` are read as
+        json lines.
 
         Args:
             file_name (str): Path of the file to load the devices from.
@@ -231,27 +465,41 @@ class DeviceDict(DeviceStore):
         Returns:
             Returns a `DeviceDict` that is initialized from the given json file.
         """
-        with open(file_name, 'r') as fpointer:
-            jsonf = json.load(fpointer)
+        from .devicefile import read_devices, format_of
+        with open(file_name, 'r', encoding='utf-8') as fpointer:
+            return cls.from_devices(read_devices(fpointer, format_of(file_name)))
 
-        return DeviceDict(jsonf)
+    @classmethod
+    def from_devices(cls, devices):
+        """Creates a `DeviceDict` from already validated devices (device name -> device)."""
+        res = cls({})
+        res.devices = devices
+        return res
 
     def _init_devices(self):
-        def _init_device(device_name, props):
-            for dev in __ALL_DEVICES__:
-                try:
-                    return dev.from_props(device_name, props)
-                except (TypeError, ValueError):
-                    # import traceback
-                    # traceback.print_exc()
-                    pass
-
-            raise ValueError("Misconfigured device '{}'".format(device_name))
-
-        self.devices = {
-            device_name: _init_device(device_name, props)
+        devices = {
+            device_name: build_device(device_name, props, validate=False)
             for device_name, props in self.validation_schema.validate(self.device_dict).items()
         }
+        for device in devices.values():
+            if isinstance(device, DeviceGroup):
+                check_group(device, lambda member: not isinstance(devices.get(member, device),
+                                                                  DeviceGroup))
+        self.devices = devices
+
+    def build_index(self):
+        """Builds the indexes of the devices by code and of the groups by member. The store is
+        read-only, so they are built once (and kept in the config snapshot)."""
+        by_code = {}
+        groups = {}
+        for device in self.list():
+            for code in {getattr(device, 'code_on', None), getattr(device, 'code_off', None)}:
+                if code is not None:
+                    by_code.setdefault(code, []).append(device.device_name)
+            for member in getattr(device, 'members', ()):
+                groups.setdefault(member, []).append(device.device_name)
+        self._by_code = by_code
+        self._groups = groups
 
     def list(self):
         """
@@ -265,6 +513,25 @@ class DeviceDict(DeviceStore):
 
         return [device for _, device in self.devices.items()]
 
+    def find(self, device_type=None, code=None, group=None):
+        if code is None:
+            return super().find(device_type=device_type, group=group)
+        if self._by_code is None:
+            self.build_index()
+        members = None
+        if group is not None:
+            members = set(getattr(self.lookup(device_name=group), 'members', []))
+        return [
+            device for device in (self.devices[name] for name in self._by_code.get(code, ()))
+            if (device_type is None or type(device).__name__ == device_type) and
+            (members is None or device.device_name in members)
+        ]
+
+    def groups_of(self, device_name):
+        if self._groups is None:
+            self.build_index()
+        return list(self._groups.get(device_name, ()))
+
     @device_validator
     def lookup(self, device=None, device_name=None):
         if self.devices is None:
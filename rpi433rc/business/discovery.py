@@ -2,16 +2,18 @@
 
 import attr
 
-from .registry import DeviceRegistry
+from .devices import DeviceStore
+from .. import codec
 from ..model import MQTTConfig, MQTTTopicConfig
 from ..util import MQTTListener, LogMixin, on_off_to_bool, MQTTPublisher, safe_call
 
 
 class Callback(LogMixin):
     """Callback for incoming mqtt messages on the command topic(s)."""
-    def __init__(self, registry, topic_config):
+    def __init__(self, registry, topic_config, rate_limiter=None):
         self.topic_config = topic_config
         self.registry = registry
+        self.rate_limiter = rate_limiter
 
     @safe_call
     def on_mqtt_message(self, topic, message):
@@ -20,20 +22,30 @@ class Callback(LogMixin):
         if not device_name:
             self.logger.warning("Could not extract device_name from '%s'", topic)
             return
-        self.registry.switch(on_off=on_off_to_bool(message), device_name=device_name)
+        # Mqtt messages do not tell who published them: All commands share one bucket
+        if self.rate_limiter is not None and self.rate_limiter.acquire('mqtt'):
+            self.logger.warning("Dropped command for '%s' due to rate limiting", device_name)
+            return
+        self.registry.switch(on_off=on_off_to_bool(message), device_name=device_name,
+                             source='mqtt')
 
 
 @attr.s
 class MQTTDiscovery(LogMixin):
     """Publishes mqtt discovery compliant confugrations and listens for
-    state-change requests on the command topics of all devices."""
+    state-change requests on the command topics of all devices. Devices that are added or
+    removed at runtime (e.g. by the store api or the learn mode) are published resp.
+    withdrawn. The registry is a `DeviceRegistry` or anything that serves the same interface
+    (e.g. a `ClusterRegistry`)."""
     mqtt_config = attr.ib(validator=attr.validators.instance_of(MQTTConfig))
     topic_config = attr.ib(validator=attr.validators.instance_of(MQTTTopicConfig))
-    registry = attr.ib(validator=attr.validators.instance_of(DeviceRegistry))
+    registry = attr.ib(validator=attr.validators.instance_of(DeviceStore))
+    rate_limiter = attr.ib(default=None)
+    configs = attr.ib(default=attr.Factory(codec.Static), repr=False, cmp=False)
 
     def _start_command_listener(self, async_mode):
         command_topic_str = self.topic_config.mk_all_commands_topic()
-        callback = Callback(self.registry, self.topic_config)
+        callback = Callback(self.registry, self.topic_config, self.rate_limiter)
         listener = MQTTListener(
             config=self.mqtt_config,
             listen_topic=command_topic_str,
@@ -44,21 +56,29 @@ class MQTTDiscovery(LogMixin):
         else:
             listener.run()
 
-    def _publish_config(self):
+    def _publish_config(self, devices=None):
         publisher = MQTTPublisher(self.mqtt_config)
-        for dev in self.registry.list():
+        for dev in self.registry.list() if devices is None else devices:
             self.logger.debug("Publishing discovery config for %s", dev.device_name)
             config_topic = self.topic_config.mk_config_topic(dev.device_name)
-            config = {
-                'command_topic': self.topic_config.mk_command_topic(dev.device_name),
-                'state_topic': self.topic_config.mk_state_topic(dev.device_name),
-                'name': dev.device_name,
-                'state_on': 'on',
-                'state_off': 'off',
-                'payload_on': 'on',
-                'payload_off': 'off'
-            }
-            publisher.publish(config, config_topic, qos=0)
+            payload = self.configs.get(dev.device_name)
+            if payload is None:
+                payload = self.configs.encode(
+                    dev.device_name, self.topic_config.mk_discovery_config(dev.device_name))
+            publisher.publish(payload, config_topic, qos=0)
+
+    @safe_call
+    def device_added(self, device):
+        """Publishes the configuration of a device that was added (or changed) at runtime."""
+        self.configs.discard(device.device_name)
+        self._publish_config([device])
+
+    @safe_call
+    def device_removed(self, device_name):
+        """Withdraws the configuration of a device that was removed at runtime."""
+        self.configs.discard(device_name)
+        MQTTPublisher(self.mqtt_config).publish(
+            '', self.topic_config.mk_config_topic(device_name), qos=0)
 
     def run(self, async_mode=False):
         """Runs the discovery component. Whether async (non-blocking; threaded)
@@ -68,5 +88,6 @@ class MQTTDiscovery(LogMixin):
         if not self.topic_config.supports_commands():
             raise RuntimeError("MQTT Topic configuration does not support commands")
 
+        self.registry.observe(self)
         self._publish_config()
         self._start_command_listener(async_mode)
@@ -0,0 +1,78 @@
+"""Idempotency keys: Retried requests with the same key are answered with the result of the first
+request instead of being executed again."""
+
+import threading
+import time
+from collections import OrderedDict
+
+import attr
+
+
+@attr.s
+class IdempotencyCache:
+    """
+    Remembers the results of requests by their idempotency key for `ttl` seconds.
+    Concurrent requests with the same key wait for the first one to finish.
+
+    Example:
+
+        >>> dut = IdempotencyCache(ttl=60)
+        >>> dut.claim('key1')  # The caller computes the result
+        (True, None)
+        >>> dut.complete('key1', 'first')
+        >>> dut.claim('key1')
+        (False, 'first')
+
+        Keys without a result (e.g. the request failed) are released
+
+        >>> dut.claim('key2')
+        (True, None)
+        >>> dut.complete('key2', None)
+        >>> dut.claim('key2')
+        (True, None)
+    """
+    ttl = attr.ib(converter=float, default=300.0)
+    max_entries = attr.ib(converter=int, default=1024)
+    clock = attr.ib(default=time.monotonic, repr=False, cmp=False)
+    _entries = attr.ib(default=attr.Factory(OrderedDict), repr=False, cmp=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, init=False)
+
+    def _evict(self, now):
+        while self._entries:
+            _, (expires, _, _) = next(iter(self._entries.items()))
+            if expires > now and len(self._entries) <= self.max_entries:
+                return
+            self._entries.popitem(last=False)
+
+    def claim(self, key, timeout=None):
+        """
+        Claims a key. Waits while a concurrent request of the same key is computed, but at most
+        `timeout` seconds (then the key is handed over).
+
+        Returns:
+            Returns (True, None) if the caller has to compute the result and `complete` the key;
+            otherwise (False, result) with the remembered result.
+        """
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._evict(now)
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._entries[key] = (now + self.ttl, threading.Event(), None)
+                    return True, None
+                _, done, result = entry
+                if result is not None:
+                    return False, result
+            if not done.wait(timeout):
+                return True, None  # The first request hangs (or its worker died)
+
+    def complete(self, key, result):
+        """Remembers the result of a claimed key. A result of None releases the key."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            done = entry[1] if entry is not None else threading.Event()
+            if result is not None:
+                self._entries[key] = (self.clock() + self.ttl, done, result)
+        done.set()
+
@@ -0,0 +1,381 @@
+"""Learn mode. Captures the codes of a physical remote by a 433mhz receiver and adds the device
+to the store.
+
+The gpio interrupt only pushes the timestamp of each edge to a ring buffer. A background thread
+drains the buffer, decodes the frames (see `decode`) and votes on the repeated frames of a
+button press.
+"""
+
+import threading
+import time
+from array import array
+from collections import Counter
+
+import attr
+
+from .devices import CodeDevice, UnknownDeviceError
+from .protocols import PROTOCOLS, known_protocols
+from ..util import LogMixin, safe_call
+
+MIN_GAP = 1800  # Durations (us) longer than this separate the frames (sync)
+MIN_BITS = 8
+TOLERANCE = 0.8  # Of the pulse length (like rpi_rf)
+
+LEARN_WAITING_ON = 'waiting_on'
+LEARN_WAITING_OFF = 'waiting_off'
+LEARN_DONE = 'done'
+LEARN_TIMEOUT = 'timeout'
+LEARN_FAILED = 'failed'
+
+
+class LearnError(Exception):
+    """Raised when learning can not be started (e.g. another device is being learned)."""
+    pass  # pylint: disable=unnecessary-pass
+
+
+@attr.s(frozen=True)
+class Decoded:  # pylint: disable=too-few-public-methods
+    """A decoded frame."""
+    code = attr.ib()
+    bit_length = attr.ib()
+    protocol = attr.ib()
+    pulse_length = attr.ib()
+
+
+def encode(code, bit_length=24, protocol=1, pulse_length=None):
+    """
+    Returns the edge durations (us) of a single frame (the counterpart of `decode`).
+
+    Example:
+
+        >>> encode(5, bit_length=3)
+        [1050, 350, 350, 1050, 1050, 350, 350, 10850]
+    """
+    proto = PROTOCOLS[protocol]
+    pulse_length = pulse_length or proto.pulse_length
+    res = []
+    for bit in format(code, '0{}b'.format(bit_length)):
+        high, low = (proto.one_high, proto.one_low) if bit == '1' else (proto.zero_high,
+                                                                        proto.zero_low)
+        res.extend((high * pulse_length, low * pulse_length))
+    res.extend((proto.sync_high * pulse_length, proto.sync_low * pulse_length))
+    return res
+
+
+def _decode_frame(sync, durations, protocols):
+    """Returns the protocol that fits the frame best (least timing error)."""
+    best, best_error = None, None
+    for number, proto in protocols:
+        delay = sync / proto.sync_low
+        tolerance = delay * TOLERANCE
+        code, error = 0, 0.0
+        for i in range(0, len(durations) - 1, 2):
+            high, low = durations[i], durations[i + 1]
+            zero = abs(high - delay * proto.zero_high) + abs(low - delay * proto.zero_low)
+            one = abs(high - delay * proto.one_high) + abs(low - delay * proto.one_low)
+            if zero < one and zero < tolerance:
+                code, error = code << 1, error + zero
+            elif one < tolerance:
+                code, error = (code << 1) | 1, error + one
+            else:
+                break
+        else:
+            error /= delay
+            if code and (best_error is None or error < best_error):
+                best = Decoded(code, len(durations) // 2, number, int(round(delay)))
+                best_error = error
+    return best
+
+
+def decode(durations, protocols=None):
+    """
+    Decodes the frames of a sequence of edge durations (us). The frames are separated by the
+    long low of the sync.
+
+    Example:
+
+        >>> decode(encode(5592405) * 2)
+        [Decoded(code=5592405, bit_length=24, protocol=1, pulse_length=350)]
+        >>> decode([6500] + encode(1234, protocol=2) + [40, 30])
+        [Decoded(code=1234, bit_length=24, protocol=2, pulse_length=650)]
+        >>> decode([7000] + encode(1234, protocol=5) + [40, 30])
+        [Decoded(code=1234, bit_length=24, protocol=5, pulse_length=500)]
+
+    Args:
+        durations: The durations between the edges.
+        protocols: The protocols to try as (number, `Protocol`). Defaults to `known_protocols()`.
+
+    Returns:
+        Returns the decoded frames. The first frame is only decoded if its sync precedes it.
+    """
+    protocols = protocols or known_protocols()
+    res = []
+    sync = None
+    start = 0
+    for i, duration in enumerate(durations):
+        if duration <= MIN_GAP:
+            continue
+        if sync is not None:
+            frame = durations[start:i]
+            frame = frame[:len(frame) - len(frame) % 2]  # Drop the high of the sync
+            if len(frame) >= 2 * MIN_BITS:
+                decoded = _decode_frame(sync, frame, protocols)
+                if decoded is not None:
+                    res.append(decoded)
+        sync, start = duration, i + 1
+    return res
+
+
+class EdgeRing:
+    """
+    Lock-free ring buffer of edge timestamps (us) for a single producer (the gpio interrupt)
+    and a single consumer. If the consumer falls behind, the oldest edges are overwritten.
+
+    Example:
+
+        >>> dut = EdgeRing(capacity=4)
+        >>> for timestamp in (100, 450, 1500, 1850):
+        ...     dut.push(timestamp)
+        >>> dut.drain()
+        [350, 1050, 350]
+        >>> for timestamp in range(2000, 8000, 1000):
+        ...     dut.push(timestamp)
+        >>> dut.drain(), dut.overruns
+        ([1000, 1000, 1000], 2)
+    """
+    def __init__(self, capacity=8192):
+        if capacity & (capacity - 1):
+            raise ValueError("Capacity is expected to be a power of two")
+        self._buf = array('Q', bytes(8 * capacity))
+        self._mask = capacity - 1
+        self._head = 0  # Only written by the producer
+        self._tail = 0  # Only written by the consumer
+        self._last = None
+        self.overruns = 0
+
+    def push(self, timestamp):
+        """Adds the timestamp of an edge (called by the gpio interrupt)."""
+        self._buf[self._head & self._mask] = timestamp
+        self._head += 1
+
+    def drain(self):
+        """Returns the durations between the edges since the last call."""
+        head = self._head
+        if head - self._tail > self._mask + 1:
+            self.overruns += head - self._tail - self._mask - 1
+            self._tail = head - self._mask - 1
+            self._last = None  # Lost edges: The first duration is unknown
+        timestamps = [self._buf[i & self._mask] for i in range(self._tail, head)]
+        self._tail = head
+        if self._last is not None:
+            timestamps.insert(0, self._last)
+        if timestamps:
+            self._last = timestamps[-1]
+        return [b - a for a, b in zip(timestamps, timestamps[1:])]
+
+
+@attr.s
+class EdgeReceiver(LogMixin):
+    """Pushes the edges of a 433mhz receiver on the given gpio pin to a ring buffer."""
+    gpio_in = attr.ib(converter=int)
+    ring = attr.ib(default=attr.Factory(EdgeRing), repr=False, cmp=False)
+    _gpio = attr.ib(default=None, repr=False, cmp=False, init=False)
+
+    def start(self):
+        """Arms the receiver."""
+        try:
+            from RPi import GPIO
+        except ImportError:
+            raise LearnError("No gpio available to receive codes")
+        push = self.ring.push
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(self.gpio_in, GPIO.IN)
+        GPIO.add_event_detect(self.gpio_in, GPIO.BOTH,
+                              callback=lambda channel: push(int(time.perf_counter() * 1000000)))
+        self._gpio = GPIO
+        self.ring.drain()  # Forget anything before
+        self.logger.info("Receiving on gpio %s", self.gpio_in)
+
+    def stop(self):
+        """Disarms the receiver."""
+        if self._gpio is not None:
+            self._gpio.remove_event_detect(self.gpio_in)
+            self._gpio = None
+
+
+@attr.s
+class LearnSession:  # pylint: disable=too-few-public-methods
+    """The progress of learning a single device."""
+    device_name = attr.ib(converter=str)
+    state = attr.ib(default=LEARN_WAITING_ON)
+    code_on = attr.ib(default=None)
+    code_off = attr.ib(default=None)
+    protocol = attr.ib(default=None)
+    pulse_length = attr.ib(default=None)
+    code_length = attr.ib(default=None)
+    message = attr.ib(default=None)
+
+    @property
+    def active(self):
+        """True while the codes are captured."""
+        return self.state in (LEARN_WAITING_ON, LEARN_WAITING_OFF)
+
+
+@attr.s
+class Learner(LogMixin):
+    """
+    Learns a device: Press the on button and then the off button of the remote. A press is
+    accepted when `min_repeats` identical frames are received. The device is added to the
+    store of the registry (existing settings of the device are kept).
+
+    The receiver is armed while a device is learned. Call `listen` to keep it armed and to pass
+    every received frame to a callback (e.g. the echoes of the own transmissions).
+
+    Example:
+
+        >>> from rpi433rc.business.registry import DeviceRegistry
+        >>> from rpi433rc.business.sqlstore import SQLiteStore
+        >>> from rpi433rc.business.state import MemoryState
+        >>> from rpi433rc.business.rc433 import RFDeviceMock, RC433
+        >>> rc433 = RC433()
+        >>> rc433.rf_device = RFDeviceMock()
+        >>> registry = DeviceRegistry(SQLiteStore(':memory:'), MemoryState(), rc433)
+        >>> dut = Learner(registry, receiver=None)
+        >>> session = LearnSession('lamp')
+        >>> dut.feed(session, encode(4, bit_length=12) * 4)  # A press sends the frame repeatedly
+        >>> session.state, session.code_on
+        ('waiting_off', 4)
+        >>> dut.feed(session, encode(2, bit_length=12) * 4)
+        >>> session.state, session.code_off, session.protocol, session.pulse_length
+        ('done', 2, 1, 350)
+        >>> registry.lookup(device_name='lamp').device.code_length
+        12
+    """
+    registry = attr.ib()
+    receiver = attr.ib()
+    timeout = attr.ib(converter=float, default=30.0)
+    min_repeats = attr.ib(converter=int, default=2)
+    decoder = attr.ib(default=decode, repr=False, cmp=False)  # e.g. `decoder.DecoderBank.decode`
+    _session = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _deadline = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _listener = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _votes = attr.ib(default=attr.Factory(Counter), repr=False, cmp=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, init=False)
+
+    def start(self, device_name, timeout=None):
+        """Starts learning the given device. Returns the `LearnSession`."""
+        with self._lock:
+            if self._session is not None and self._session.active:
+                raise LearnError("Device '{}' is being learned".format(
+                    self._session.device_name))
+            session = LearnSession(device_name)
+            self._session = session
+            self._deadline = time.monotonic() + (timeout or self.timeout)
+            self._votes.clear()
+        if self._listener is None:  # Otherwise the receiving thread feeds the session
+            try:
+                self.receiver.start()
+            except Exception as exc:
+                session.state, session.message = LEARN_FAILED, str(exc)
+                raise
+            thread = threading.Thread(target=self._run, args=(session, self._deadline),
+                                      name='learn')
+            thread.daemon = True
+            thread.start()
+        self.logger.info("Learning %s: Press the on button of the remote", device_name)
+        return session
+
+    def status(self, device_name):
+        """Returns the `LearnSession` of the given device."""
+        session = self._session
+        if session is None or session.device_name != device_name:
+            raise UnknownDeviceError("Device '{}' is not being learned".format(device_name))
+        return session
+
+    def listen(self, callback):
+        """
+        Arms the receiver for good. The decoded frames (see `Decoded`) of each poll are passed
+        to the given callback. Devices are learned by the same receiver.
+        """
+        self.receiver.start()
+        self._listener = callback
+        thread = threading.Thread(target=self._listen, name='receive')
+        thread.daemon = True
+        thread.start()
+        self.logger.info("Listening for received codes")
+
+    def _listen(self):
+        while True:
+            time.sleep(0.05)
+            decoded = self.decoder(self.receiver.ring.drain())
+            session = self._session
+            if session is not None and session.active:
+                if time.monotonic() > self._deadline:
+                    session.state = LEARN_TIMEOUT
+                else:
+                    self._vote(session, decoded)
+                if not session.active:
+                    self.logger.info("Learning %s: %s", session.device_name, session.state)
+            if decoded:
+                self._notify(decoded)
+
+    @safe_call
+    def _notify(self, decoded):
+        self._listener(decoded)
+
+    def _run(self, session, deadline):
+        try:
+            while session.active:
+                if time.monotonic() > deadline:
+                    session.state = LEARN_TIMEOUT
+                    break
+                time.sleep(0.05)
+                self.feed(session, self.receiver.ring.drain())
+        finally:
+            self.receiver.stop()
+        self.logger.info("Learning %s: %s", session.device_name, session.state)
+
+    def feed(self, session, durations):
+        """Processes received edge durations."""
+        self._vote(session, self.decoder(durations))
+
+    def _vote(self, session, frames):
+        for decoded in frames:
+            key = (decoded.code, decoded.bit_length, decoded.protocol)
+            if session.state == LEARN_WAITING_OFF and decoded.code == session.code_on:
+                continue  # The on button is still pressed
+            self._votes[key] += 1
+            if self._votes[key] < self.min_repeats:
+                continue
+            self._votes.clear()
+            if session.state == LEARN_WAITING_ON:
+                session.code_on = decoded.code
+                session.protocol, session.pulse_length = decoded.protocol, decoded.pulse_length
+                session.code_length = decoded.bit_length
+                session.state = LEARN_WAITING_OFF
+                self.logger.info("Learning %s: Press the off button of the remote",
+                                 session.device_name)
+            else:
+                session.code_off = decoded.code
+                self._finish(session)
+                return
+
+    def _finish(self, session):
+        props = dict(code_on=session.code_on, code_off=session.code_off,
+                     protocol=session.protocol, pulse_length=session.pulse_length,
+                     code_length=session.code_length)
+        try:
+            try:
+                existing = self.registry.lookup(device_name=session.device_name).device
+            except UnknownDeviceError:
+                device = CodeDevice(session.device_name, **props)
+            else:
+                if not isinstance(existing, CodeDevice):
+                    raise ValueError("Device '{}' is not a CodeDevice"
+                                     .format(session.device_name))
+                device = attr.evolve(existing, **props)
+            self.registry.add(device)
+        except Exception as exc:  # pylint: disable=broad-except
+            session.state, session.message = LEARN_FAILED, str(exc)
+            return
+        session.state = LEARN_DONE
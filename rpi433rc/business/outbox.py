@@ -0,0 +1,258 @@
+"""Store-and-forward of outbound mqtt messages. Messages are published by a background thread, so
+a broker outage never blocks a switch. While the broker is unreachable a circuit breaker stops
+any connection attempts and messages are kept (latest per topic only) until the broker is back.
+"""
+
+import fcntl
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import attr
+
+from .. import codec
+from ..util import LogMixin
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+
+@attr.s
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures. While open, calls fail fast. After
+    `reset_timeout` seconds a single call is allowed to probe (half open).
+
+    Example:
+
+        >>> now = [0.0]
+        >>> dut = CircuitBreaker(threshold=2, reset_timeout=30, clock=lambda: now[0])
+        >>> dut.failure(); dut.state
+        'closed'
+        >>> dut.failure(); dut.state, dut.allow(), dut.retry_in()
+        ('open', False, 30.0)
+        >>> now[0] = 30.0
+        >>> dut.allow(), dut.state
+        (True, 'half_open')
+        >>> dut.failure(); dut.state  # The probe failed
+        'open'
+        >>> now[0] = 60.0
+        >>> dut.allow(), dut.success(), dut.state
+        (True, None, 'closed')
+    """
+    threshold = attr.ib(converter=int, default=3)
+    reset_timeout = attr.ib(converter=float, default=30.0)
+    clock = attr.ib(default=time.monotonic, repr=False, cmp=False)
+    failures = attr.ib(default=0, init=False)
+    opened_at = attr.ib(default=None, init=False)
+
+    @property
+    def state(self):
+        """The state of the breaker (closed, open or half_open)."""
+        if self.opened_at is None:
+            return BREAKER_CLOSED
+        return BREAKER_OPEN if self.retry_in() > 0 else BREAKER_HALF_OPEN
+
+    def retry_in(self):
+        """Returns the seconds until the next call is allowed."""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def allow(self):
+        """Returns True if a call may be made."""
+        return self.state != BREAKER_OPEN
+
+    def success(self):
+        """Records a successful call. Closes the breaker."""
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        """Records a failed call. Opens the breaker after too many failures."""
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = self.clock()
+
+
+def _text(payload):
+    if isinstance(payload, dict):
+        return codec.dumps(payload)
+    if isinstance(payload, bytes):
+        return payload.decode('utf-8')
+    return str(payload)
+
+
+@attr.s
+class MQTTOutbox(LogMixin):
+    """
+    Queues messages per topic (only the latest message of a topic is kept) and publishes them
+    in bulk by a background thread. The queue holds up to `max_size` topics; beyond that the
+    oldest topics are dropped. If a `file_name` is given, messages that could not be
+    published survive a restart. The file is locked (`<file_name>.lock`); if another process
+    holds it, the messages are kept in memory only. The file is only written while it
+    holds (or held) unpublished messages, so a healthy broker causes no writes at all.
+    `stop` waits at most `stop_timeout` seconds for a publish in progress.
+
+    Example:
+
+        >>> class Publisher:
+        ...     broker_up = False
+        ...     published = []
+        ...     def publish_many(self, messages):
+        ...         if not self.broker_up:
+        ...             raise OSError('Connection refused')
+        ...         self.published.extend(messages)
+        >>> publisher = Publisher()
+        >>> dut = MQTTOutbox(publisher, CircuitBreaker(threshold=1, reset_timeout=3600))
+        >>> dut.publish('on', 'rc433/device1/state')
+        >>> dut.publish('off', 'rc433/device1/state')  # Replaces the pending message
+        >>> dut.publish('on', 'rc433/device2/state')
+        >>> dut.flush(), dut.breaker.state, len(dut)
+        (False, 'open', 2)
+
+        >>> publisher.broker_up = True
+        >>> dut.flush(force=True), dut.breaker.state, len(dut)
+        (True, 'closed', 0)
+        >>> publisher.published
+        [('off', 'rc433/device1/state', True, 0), ('on', 'rc433/device2/state', True, 0)]
+    """
+    publisher = attr.ib()
+    breaker = attr.ib(default=attr.Factory(CircuitBreaker))
+    file_name = attr.ib(default=None)
+    max_size = attr.ib(converter=int, default=10000)
+    stop_timeout = attr.ib(converter=float, default=5.0)
+    _pending = attr.ib(default=attr.Factory(OrderedDict), repr=False, cmp=False, init=False)
+    _cond = attr.ib(default=attr.Factory(threading.Condition), repr=False, cmp=False,
+                    init=False)
+    _dirty = attr.ib(default=False, repr=False, cmp=False, init=False)
+    _persisted = attr.ib(default=False, repr=False, cmp=False, init=False)
+    _thread = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _stopped = attr.ib(default=False, repr=False, cmp=False, init=False)
+    _lock_fd = attr.ib(default=None, repr=False, cmp=False, init=False)
+
+    def __attrs_post_init__(self):
+        if self.file_name and not self._lock_file():
+            self.logger.warning("The outbox '%s' is used by another process. Keeping the "
+                                "messages in memory only", self.file_name)
+            self.file_name = None
+        if self.file_name and os.path.exists(self.file_name):
+            with open(self.file_name, 'r', encoding='utf-8') as fpointer:
+                for topic, message in codec.load(fpointer).items():
+                    self._pending[topic] = tuple(message)
+            self._persisted = bool(self._pending)
+            if self._pending:
+                self.logger.info("Restored %s unpublished mqtt messages", len(self._pending))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _lock_file(self):
+        """Locks the file against other processes. Returns False if it is locked already."""
+        lock_fd = os.open(self.file_name + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(lock_fd)
+            return False
+        self._lock_fd = lock_fd
+        return True
+
+    def _queue(self, topic, message):
+        """Queues a message unless a newer message of the topic is queued. Locked by caller."""
+        if topic in self._pending:
+            return
+        self._pending[topic] = message
+        if len(self._pending) > self.max_size:
+            dropped, _ = self._pending.popitem(last=False)
+            self.logger.warning("Outbox is full. Dropping the message of '%s'", dropped)
+
+    def publish(self, payload, topic, retain=True, qos=0):
+        """Queues a message. Never blocks on the broker."""
+        with self._cond:
+            self._pending.pop(topic, None)  # Coalesce: The latest message wins
+            self._queue(topic, (_text(payload), retain, qos))
+            self._dirty = True
+            self._cond.notify()
+
+    def flush(self, force=False):
+        """
+        Publishes all queued messages by a single connection (unless the breaker is open).
+
+        Returns:
+            Returns True if the queue was published; otherwise False.
+        """
+        with self._cond:
+            if not self._pending or not (force or self.breaker.allow()):
+                return not self._pending
+            batch, self._pending = self._pending, OrderedDict()
+        try:
+            self.publisher.publish_many([(payload, topic, retain, qos)
+                                         for topic, (payload, retain, qos) in batch.items()])
+        except Exception as exc:  # pylint: disable=broad-except
+            self.breaker.failure()
+            with self._cond:
+                for topic, message in reversed(batch.items()):
+                    self._queue(topic, message)
+                    self._pending.move_to_end(topic, last=False)
+                self._dirty = True
+            self.logger.warning("Publishing %s mqtt messages failed (circuit %s): %s",
+                                len(batch), self.breaker.state, exc)
+            return False
+        self.breaker.success()
+        with self._cond:
+            if self._persisted:
+                self._dirty = True  # The file still holds the published messages
+        return True
+
+    def save(self):
+        """Writes the queued messages to the file (if any). Skips the write if nothing is queued
+        and the file holds no messages either."""
+        with self._cond:
+            if not self.file_name or not self._dirty:
+                return
+            self._dirty = False
+            if not self._pending and not self._persisted:
+                return
+            snapshot = {topic: list(message) for topic, message in self._pending.items()}
+            self._persisted = bool(snapshot)
+        tmp_file = self.file_name + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as fpointer:
+            fpointer.write(codec.dumps(snapshot))
+        os.replace(tmp_file, self.file_name)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not (self._pending and self.breaker.allow()):
+                    if self._dirty and self.file_name:
+                        break
+                    self._cond.wait(self.breaker.retry_in() if self._pending else None)
+                if self._stopped:
+                    return
+            if self._pending and self.breaker.allow():
+                self.flush()
+            self.save()
+
+    def run_async(self):
+        """Publishes queued messages on a background thread."""
+        self._thread = threading.Thread(target=self._run, name='mqtt-outbox')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread, saves the queued messages and unlocks the file."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(self.stop_timeout)
+            if self._thread.is_alive():
+                self.logger.warning("Publishing mqtt messages did not finish within %s seconds. "
+                                    "Messages in flight are lost", self.stop_timeout)
+        self.save()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
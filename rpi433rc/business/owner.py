@@ -0,0 +1,462 @@
+"""Multi-process support. A single owner process holds the device state, the radio and the
+scheduler. Any number of stateless http workers talk to the owner via a unix domain socket
+(one json document per line), so all of them share one consistent state view and the radio
+is accessed by one process only. Given the state file of the owner (see `statefile`), the
+workers read the devices and their states on their own and only forward everything else."""
+
+import os
+import socket
+import socketserver
+import threading
+
+import attr
+
+from .audit import AuditRecord
+from .cluster import RemoteNodeError, stateful_device_from_json
+from .devices import ReadOnlyStoreError, UnknownDeviceError, device_from_json
+from .learn import LearnError, LearnSession
+from .rc433 import UnsupportedDeviceError
+from .registry import StatefulDevice, SwitchResult
+from .scheduler import Schedule
+from .state import Changes
+from .statefile import StateFileError, StateReader
+from .. import codec
+from ..util import LogMixin, bool_to_on_off
+
+# Errors that are re-raised on the side of the worker. Anything else is an `OwnerError`
+_ERRORS = {error.__name__: error for error in (UnknownDeviceError, UnsupportedDeviceError,
+                                               RemoteNodeError, ReadOnlyStoreError, LearnError,
+                                               ValueError, TypeError)}
+
+
+class OwnerError(Exception):
+    """Raised when the owner process is unreachable or fails unexpectedly."""
+    pass  # pylint: disable=unnecessary-pass
+
+
+def stateful_device_to_json(stateful):
+    """
+    Serializes a `StatefulDevice` (the counterpart of `cluster.stateful_device_from_json`).
+
+    Example:
+
+        >>> from rpi433rc.business.devices import CodeDevice
+        >>> from rpi433rc.business.registry import StatefulDevice
+        >>> obj = stateful_device_to_json(StatefulDevice(
+        ...     'device1', CodeDevice('device1', code_on=1, code_off=2), True))
+        >>> obj['type'], obj['state']
+        ('CodeDevice', 'on')
+        >>> stateful_device_from_json(obj).device.code_on
+        1
+    """
+    return {
+        'device_name': stateful.device_name,
+        'type': type(stateful.device).__name__,
+        'configuration': stateful.device.configuration,
+        'state': bool_to_on_off(stateful.state)
+    }
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Serves the requests of a single worker connection."""
+    def handle(self):
+        for line in self.rfile:
+            response = self.server.owner.dispatch(line)
+            self.wfile.write(codec.dumpb(response) + b'\n')
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+@attr.s
+class RegistryServer(LogMixin):
+    """
+    Exposes the registry (and its radio) and the scheduler of the owner process on a unix
+    domain socket.
+
+    Example:
+
+        >>> import tempfile
+        >>> from rpi433rc.business.devices import DeviceDict
+        >>> from rpi433rc.business.registry import DeviceRegistry
+        >>> from rpi433rc.business.state import MemoryState
+        >>> from rpi433rc.business.rc433 import RFDeviceMock, RC433
+        >>> rc433 = RC433()
+        >>> rc433.rf_device = RFDeviceMock()
+        >>> registry = DeviceRegistry(DeviceDict({'device1': {'code_on': 1, 'code_off': 2}}),
+        ...                           MemoryState(), rc433)
+        >>> path = tempfile.NamedTemporaryFile().name
+        >>> server = RegistryServer(registry, path)
+        >>> server.run_async()
+
+        >>> client = RegistryClient(path)
+        >>> client.switch(True, device_name='device1', source='rest')
+        SwitchResult(result=True, transmitted=True)
+        >>> client.lookup(device_name='device1').state
+        True
+        >>> client.lookup(device_name='unknown')
+        Traceback (most recent call last):
+        ...
+        rpi433rc.business.devices.UnknownDeviceError: The requested device 'unknown' is unknown
+        >>> client.rc433.send_code(12345)
+        True
+        >>> server.stop()
+    """
+    registry = attr.ib()
+    path = attr.ib(converter=str)
+    scheduler = attr.ib(default=None)
+    rate_limiter = attr.ib(default=None)
+    learner = attr.ib(default=None)
+    idempotency_cache = attr.ib(default=None)
+    _server = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _methods = attr.ib(default=None, repr=False, cmp=False, init=False)
+
+    def __attrs_post_init__(self):
+        self._methods = {
+            'list': self._list,
+            'lookup': self._lookup,
+            'switch': self._switch,
+            'add': self._add,
+            'remove': lambda device_name: self.registry.remove(device_name),
+            'find': self._find,
+            'readiness': lambda: self.registry.readiness(),
+            'changes': lambda since=0, epoch=None: attr.asdict(
+                self.registry.changes(since, epoch)),
+            'send_code': self._send_code,
+            'resend_stats': lambda: self.registry.rc433.resend_stats(),
+            'history': self._history,
+            'schedules.list': self._schedules_list,
+            'schedules.add': self._schedules_add,
+            'schedules.cancel': lambda schedule_id: self.scheduler.cancel(schedule_id),
+            'schedules.stats': lambda: self.scheduler.stats(),
+            'rate_limit': self._rate_limit,
+            'idempotency.claim': lambda key, timeout=None: self.idempotency_cache.claim(
+                tuple(key), timeout),
+            'idempotency.complete': lambda key, result: self.idempotency_cache.complete(
+                tuple(key), result),
+            'learn.start': lambda device_name, timeout=None: attr.asdict(
+                self.learner.start(device_name, timeout)),
+            'learn.status': lambda device_name: attr.asdict(self.learner.status(device_name)),
+        }
+
+    def _list(self):
+        return [stateful_device_to_json(stateful) for stateful in self.registry.list()]
+
+    def _lookup(self, device_name):
+        return stateful_device_to_json(self.registry.lookup(device_name=device_name))
+
+    def _switch(self, on_off, device_name, source=None):
+        return attr.asdict(self.registry.switch(on_off, device_name=device_name, source=source))
+
+    def _add(self, device_name, type, configuration):  # pylint: disable=redefined-builtin
+        device = self.registry.add(device_from_json(device_name, type, configuration))
+        return stateful_device_to_json(self.registry.lookup(device=device))
+
+    def _find(self, device_type=None, code=None, group=None):
+        return [stateful_device_to_json(stateful)
+                for stateful in self.registry.find(device_type, code, group)]
+
+    def _send_code(self, code, times=3, source=None, timing=None):
+        return self.registry.rc433.send_code(code, times=times, source=source,
+                                             timing=tuple(timing) if timing else None)
+
+    def _history(self, **query):
+        audit_log = getattr(self.registry.rc433, 'audit_log', None)
+        if audit_log is None:
+            return None
+        return [attr.asdict(record) for record in audit_log.query(**query)]
+
+    def _schedules_list(self):
+        return [attr.asdict(schedule) for schedule in self.scheduler.list()]
+
+    def _schedules_add(self, schedule):
+        return attr.asdict(self.scheduler.add(Schedule(**schedule)))
+
+    def _rate_limit(self, source, client=None):
+        if self.rate_limiter is None:
+            return 0.0
+        return self.rate_limiter.acquire(source, client)
+
+    def dispatch(self, line):
+        """Executes a single request (`{"method": ..., "params": {...}}`)."""
+        try:
+            request = codec.loads(line.decode('utf-8'))
+            return {'result': self._methods[request['method']](**request.get('params', {}))}
+        except Exception as exc:  # pylint: disable=broad-except
+            if type(exc).__name__ not in _ERRORS:
+                self.logger.exception("Request of a worker failed")
+            return {'error': type(exc).__name__, 'message': str(exc)}
+
+    def run_async(self):
+        """Listens on the unix domain socket on a background thread."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Stale socket of a previous run
+        self._server = _Server(self.path, _Handler)
+        self._server.owner = self
+        os.chmod(self.path, 0o600)
+        thread = threading.Thread(target=self._server.serve_forever, name='owner')
+        thread.daemon = True
+        thread.start()
+        self.logger.info("Owner process is listening on %s", self.path)
+
+    def stop(self):
+        """Stops listening."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            os.unlink(self.path)
+
+
+@attr.s
+class RegistryClient(LogMixin):
+    """
+    Stand-in for the registry inside of a http worker. Forwards everything to the owner
+    process. Each thread keeps its own connection.
+
+    If a `store` (e.g. on the sqlite file of the owner) and the `state_file` the owner mirrors
+    its states to are given, `list` and `lookup` are served without asking the owner. Devices
+    that are not mirrored (yet) are looked up by the owner.
+    """
+    path = attr.ib(converter=str)
+    timeout = attr.ib(converter=float, default=30.0)
+    store = attr.ib(default=None, repr=False, cmp=False)
+    state_file = attr.ib(default=None)
+    _local = attr.ib(default=attr.Factory(threading.local), repr=False, cmp=False, init=False)
+
+    def _reader(self):
+        """Returns the state reader of this thread. None if reads are forwarded."""
+        if self.store is None or self.state_file is None:
+            return None
+        reader = getattr(self._local, 'reader', None)
+        if reader is None:
+            try:
+                reader = StateReader(self.state_file)
+            except (OSError, ValueError):
+                return None  # Not written yet
+            self._local.reader = reader
+        return reader
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as exc:
+            sock.close()
+            raise OwnerError("Owner process at '{}' is unreachable: {}".format(self.path, exc))
+        return sock, sock.makefile('rb')
+
+    def _roundtrip(self, payload):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        sock, rfile = conn
+        try:
+            sock.sendall(payload)
+            line = rfile.readline()
+        except OSError as exc:
+            line, error = b'', exc
+        else:
+            error = None
+        if not line:
+            sock.close()
+            self._local.conn = None
+            raise OwnerError("Connection to the owner process was lost: {}".format(error))
+        return codec.loads(line.decode('utf-8'))
+
+    def call(self, method, **params):
+        """Calls a method of the owner process and returns its result."""
+        response = self._roundtrip(codec.dumpb({'method': method, 'params': params}) + b'\n')
+        if 'error' in response:
+            raise _ERRORS.get(response['error'], OwnerError)(response['message'])
+        return response['result']
+
+    def list(self):
+        """Lists all devices with their state."""
+        reader = self._reader()
+        if reader is not None:
+            try:
+                states = reader.states()
+                return [StatefulDevice(device.device_name, device, states[device.device_name])
+                        for device in self.store.list()]
+            except (KeyError, StateFileError):
+                pass  # Not mirrored
+        return [stateful_device_from_json(obj) for obj in self.call('list')]
+
+    def lookup(self, device=None, device_name=None):
+        """Looks up a single device with its state."""
+        device_name = device_name or device.device_name
+        reader = self._reader()
+        if reader is not None:
+            try:
+                state = reader.lookup(device_name)
+            except (UnknownDeviceError, StateFileError):
+                pass  # Not mirrored
+            else:
+                return StatefulDevice(device_name, self.store.lookup(device_name=device_name),
+                                      state)
+        return stateful_device_from_json(self.call('lookup', device_name=device_name))
+
+    def switch(self, on_off, device=None, device_name=None, source=None):
+        """Switches a device on resp. off."""
+        return SwitchResult(**self.call('switch', on_off=on_off,
+                                        device_name=device_name or device.device_name,
+                                        source=source))
+
+    def readiness(self):
+        """Reports the readiness of the owner process."""
+        return self.call('readiness')
+
+    def changes(self, since=0, epoch=None):
+        """Returns the state changes since the given version."""
+        return Changes(**self.call('changes', since=since, epoch=epoch))
+
+    def _refresh(self):
+        """Local reads see the own changes right away (see `SQLiteStore.refresh`)."""
+        refresh = getattr(self.store, 'refresh', None)
+        if refresh is not None:
+            refresh()
+
+    def add(self, device):
+        """Adds a device to the store of the owner process."""
+        res = stateful_device_from_json(self.call(
+            'add', device_name=device.device_name, type=type(device).__name__,
+            configuration=device.configuration)).device
+        self._refresh()
+        return res
+
+    def remove(self, device_name):
+        """Removes a device from the store of the owner process."""
+        self.call('remove', device_name=device_name)
+        self._refresh()
+
+    def find(self, device_type=None, code=None, group=None):
+        """Finds devices by their type, code (on or off) and / or group (with their state)."""
+        return [stateful_device_from_json(obj) for obj in self.call(
+            'find', device_type=device_type, code=code, group=group)]
+
+    @property
+    def rc433(self):
+        """The radio of the owner process."""
+        return _RadioClient(self)
+
+    @property
+    def scheduler(self):
+        """The scheduler of the owner process."""
+        return SchedulerClient(self)
+
+    @property
+    def rate_limiter(self):
+        """The rate limiter of the owner process."""
+        return RateLimiterClient(self)
+
+    @property
+    def idempotency_cache(self):
+        """The idempotency cache of the owner process."""
+        return IdempotencyCacheClient(self)
+
+    @property
+    def learner(self):
+        """The learn mode of the owner process."""
+        return LearnerClient(self)
+
+
+@attr.s
+class _RadioClient:
+    client = attr.ib()
+
+    def send_code(self, code, times=3, source=None, timing=None):
+        """Sends a decimal code by the radio of the owner."""
+        return self.client.call('send_code', code=code, times=times, source=source,
+                                timing=timing)
+
+    def resend_stats(self):
+        """Returns the delivery statistics of the owner."""
+        return self.client.call('resend_stats')
+
+    @property
+    def audit_log(self):
+        """Returns the audit log of the owner; None if it is disabled."""
+        if self.client.call('history', limit=0) is None:
+            return None
+        return _AuditLogClient(self.client)
+
+
+@attr.s
+class _AuditLogClient:  # pylint: disable=too-few-public-methods
+    client = attr.ib()
+
+    def query(self, device_name=None, since=None, until=None, limit=None):
+        """Queries the audit log of the owner."""
+        records = self.client.call('history', device_name=device_name, since=since,
+                                   until=until, limit=limit)
+        return [AuditRecord(**record) for record in records or []]
+
+
+@attr.s
+class SchedulerClient:
+    """Stand-in for the scheduler inside of a http worker."""
+    client = attr.ib()
+
+    def list(self):
+        """Lists all pending schedules ordered by their due time."""
+        return [Schedule(**schedule) for schedule in self.client.call('schedules.list')]
+
+    def add(self, schedule):
+        """Adds a schedule. Returns the schedule."""
+        return Schedule(**self.client.call('schedules.add', schedule=attr.asdict(schedule)))
+
+    def cancel(self, schedule_id):
+        """Cancels a schedule. Returns True if the schedule was pending; otherwise False."""
+        return self.client.call('schedules.cancel', schedule_id=schedule_id)
+
+    def stats(self):
+        """Returns the number of fired schedules and the firing latency in seconds."""
+        return self.client.call('schedules.stats')
+
+
+@attr.s
+class RateLimiterClient:  # pylint: disable=too-few-public-methods
+    """Stand-in for the rate limiter inside of a http worker. The buckets are shared by all
+    workers."""
+    client = attr.ib()
+
+    def acquire(self, source, client=None):
+        """Takes a token from the bucket of the given client."""
+        return self.client.call('rate_limit', source=source, client=client)
+
+
+@attr.s
+class IdempotencyCacheClient:
+    """Stand-in for the idempotency cache inside of a http worker. A retry is answered by the
+    result of the first request, even if another worker sent it."""
+    client = attr.ib()
+    timeout = attr.ib(converter=float, default=10.0)  # Below the timeout of the client
+
+    def claim(self, key):
+        """Claims a key (see `IdempotencyCache.claim`)."""
+        claimed, result = self.client.call('idempotency.claim', key=key, timeout=self.timeout)
+        return claimed, result
+
+    def complete(self, key, result):
+        """Remembers the result of a claimed key. A result of None releases the key."""
+        self.client.call('idempotency.complete', key=key, result=result)
+
+
+@attr.s
+class LearnerClient:
+    """Stand-in for the learn mode inside of a http worker."""
+    client = attr.ib()
+
+    def start(self, device_name, timeout=None):
+        """Starts learning the given device. Returns the `LearnSession`."""
+        return LearnSession(**self.client.call('learn.start', device_name=device_name,
+                                               timeout=timeout))
+
+    def status(self, device_name):
+        """Returns the `LearnSession` of the given device."""
+        return LearnSession(**self.client.call('learn.status', device_name=device_name))
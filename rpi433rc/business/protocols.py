@@ -0,0 +1,49 @@
+"""The protocols of 433mhz codes (the timings of the sync, zero and one pulses). Shared by the
+transmit path (see `rc433`) and the decoding of received codes (see `learn`)."""
+
+from collections import namedtuple
+
+Protocol = namedtuple('Protocol', ['pulse_length', 'sync_high', 'sync_low', 'zero_high',
+                                   'zero_low', 'one_high', 'one_low'])
+
+# The protocol table of rpi_rf (index = protocol number)
+PROTOCOLS = (None,
+             Protocol(350, 1, 31, 1, 3, 3, 1),
+             Protocol(650, 1, 10, 1, 2, 2, 1),
+             Protocol(100, 30, 71, 4, 11, 9, 6),
+             Protocol(380, 1, 6, 1, 3, 3, 1),
+             Protocol(500, 6, 14, 1, 2, 2, 1),
+             Protocol(200, 1, 10, 1, 5, 1, 1))
+
+
+def parse_protocols(spec):
+    """
+    Parses custom protocols. Protocols are separated by semicolons; each of them is given as
+    <number>=<pulse_length>,<sync_high>,<sync_low>,<zero_high>,<zero_low>,<one_high>,<one_low>.
+
+    Example:
+
+        >>> parse_protocols('7=450,1,23,1,2,2,1')
+        [(7, Protocol(pulse_length=450, sync_high=1, sync_low=23, zero_high=1, zero_low=2, \
+one_high=2, one_low=1))]
+        >>> parse_protocols('1=450,1,23,1,2,2,1')
+        Traceback (most recent call last):
+        ...
+        ValueError: Protocol 1 is a builtin protocol
+    """
+    res = []
+    for item in (spec or '').split(';'):
+        if not item.strip():
+            continue
+        number, timings = item.split('=')
+        number = int(number)
+        if number < len(PROTOCOLS):
+            raise ValueError("Protocol {} is a builtin protocol".format(number))
+        res.append((number, Protocol(*(int(timing) for timing in timings.split(',')))))
+    return res
+
+
+def known_protocols(custom=None):
+    """Returns the protocols of rpi_rf and the given custom protocols as (number, `Protocol`)."""
+    return [(number, proto) for number, proto in enumerate(PROTOCOLS)
+            if proto is not None] + list(custom or [])
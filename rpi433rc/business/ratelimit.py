@@ -0,0 +1,108 @@
+"""Rate limiting related components. Protects the radio from clients that send too many
+requests."""
+
+import threading
+import time
+from collections import OrderedDict
+
+import attr
+
+from ..util import LogMixin
+
+
+@attr.s
+class TokenBucket:
+    """
+    Classic token bucket. Holds up to `burst` tokens and refills `rate` tokens per second.
+
+    Example:
+
+        >>> now = [0.0]
+        >>> dut = TokenBucket(rate=1, burst=2, clock=lambda: now[0])
+        >>> dut.acquire(), dut.acquire(), dut.acquire()
+        (0.0, 0.0, 1.0)
+        >>> now[0] = 0.5
+        >>> dut.acquire()
+        0.5
+        >>> now[0] = 1.0
+        >>> dut.acquire()
+        0.0
+    """
+    rate = attr.ib(converter=float)
+    burst = attr.ib(converter=float)
+    clock = attr.ib(default=time.monotonic, repr=False, cmp=False)
+    tokens = attr.ib(default=None, init=False)
+    updated = attr.ib(default=None, init=False)
+
+    def acquire(self):
+        """
+        Takes a token from the bucket.
+
+        Returns:
+            Returns 0 if a token was available; otherwise the number of seconds until the
+            next token is available.
+        """
+        now = self.clock()
+        if self.tokens is None:
+            self.tokens, self.updated = self.burst, now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+@attr.s
+class RateLimiter(LogMixin):
+    """
+    Token bucket rate limits per source (e.g. rest, mqtt) and client (e.g. user or address).
+    Sources without a configured limit are not limited.
+
+    Example:
+
+        >>> now = [0.0]
+        >>> dut = RateLimiter({'rest': (1, 1)}, clock=lambda: now[0])
+        >>> dut.acquire('rest', 'alice'), dut.acquire('rest', 'alice')
+        (0.0, 1.0)
+        >>> dut.acquire('rest', 'bob')  # Each client has its own bucket
+        0.0
+        >>> dut.acquire('mqtt', 'homeassistant')
+        0.0
+    """
+    limits = attr.ib(validator=attr.validators.instance_of(dict))  # source -> (rate, burst)
+    max_clients = attr.ib(converter=int, default=1024)
+    clock = attr.ib(default=time.monotonic, repr=False, cmp=False)
+    _buckets = attr.ib(default=attr.Factory(OrderedDict), repr=False, cmp=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, init=False)
+
+    def acquire(self, source, client=None):
+        """
+        Takes a token from the bucket of the given client.
+
+        Args:
+            source (str): Where the request comes from (e.g. rest, mqtt).
+            client (str): Who sends the request.
+
+        Returns:
+            Returns 0 if the request is admitted; otherwise the number of seconds to wait
+            before retrying.
+        """
+        limit = self.limits.get(source)
+        if limit is None:
+            return 0.0
+        key = (source, client)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rate, burst = limit
+                bucket = TokenBucket(rate=rate, burst=burst, clock=self.clock)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)  # Forget the least recently seen client
+            else:
+                self._buckets.move_to_end(key)
+            retry_after = bucket.acquire()
+        if retry_after:
+            self.logger.warning("Rate limit of %s client '%s' exceeded", source, client)
+        return retry_after
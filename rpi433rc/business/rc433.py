@@ -1,9 +1,19 @@
 """RC433 related components. The heart to control 433mhz power sockets."""
 
+import functools
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+
 import attr
 
 from rpi433rc.util import LogMixin
+from .audit import record_transmission
 from .devices import CodeDevice
+from .protocols import PROTOCOLS
 
 
 class RFDeviceMock:
@@ -29,32 +39,390 @@ except ImportError:
     RFDevice = RFDeviceMock
 
 
+# Errors of the gpio layer (RPi.GPIO raises RuntimeError, /dev/mem access OSError)
+GPIO_ERRORS = (RuntimeError, OSError)
+RECOVER_MAX_DELAY = 60.0
+
+
 class UnsupportedDeviceError(Exception):
     """Raised when a device is unsupported."""
     pass  # pylint: disable=unnecessary-pass
 
 
+def code_for(on_off, device):
+    """
+    Returns the code to send to switch the given device on resp. off.
+
+    Example:
+
+        >>> from rpi433rc.business.devices import SystemDevice
+        >>> code_for(True, CodeDevice('device1', code_on=1, code_off=2))
+        1
+        >>> code_for(True, SystemDevice('device2', system_code="01010", device_code=4))
+        Traceback (most recent call last):
+        ...
+        rpi433rc.business.rc433.UnsupportedDeviceError: The device type ... is not supported
+    """
+    if isinstance(device, CodeDevice):
+        return device.code_on if on_off else device.code_off
+
+    raise UnsupportedDeviceError("The device type '{}' is not supported".format(type(device)))
+
+
+@functools.lru_cache(maxsize=None)
+def tx_settings(protocol=None, pulse_length=None, code_length=None):
+    """
+    Returns the keyword arguments of `RFDevice.tx_code` for the given timing. The result is
+    computed once per timing and shared, so do not modify it.
+
+    Example:
+
+        >>> tx_settings()
+        {}
+        >>> tx_settings(protocol=2) == {'tx_proto': 2, 'tx_pulselength': 650}
+        True
+        >>> tx_settings(pulse_length=300, code_length=32) == {
+        ...     'tx_proto': 1, 'tx_pulselength': 300, 'tx_length': 32}
+        True
+        >>> tx_settings(protocol=7)
+        Traceback (most recent call last):
+        ...
+        rpi433rc.business.rc433.UnsupportedDeviceError: Protocol 7 can not be sent (1 - 6)
+    """
+    if protocol is None and pulse_length is None and code_length is None:
+        return {}
+    protocol = protocol or 1
+    if not 0 < protocol < len(PROTOCOLS):
+        raise UnsupportedDeviceError("Protocol {} can not be sent (1 - {})"
+                                     .format(protocol, len(PROTOCOLS) - 1))
+    res = {'tx_proto': protocol,
+           'tx_pulselength': pulse_length or PROTOCOLS[protocol].pulse_length}
+    if code_length:
+        res['tx_length'] = code_length
+    return res
+
+
+# rpi_rf keeps the last pulse length. Sent after a custom timing instead of the defaults
+_RESET_SETTINGS = dict(tx_settings(protocol=1))
+
+
+def timing_of(device):
+    """Returns the (protocol, pulse_length, code_length) of the given device."""
+    return (getattr(device, 'protocol', None), getattr(device, 'pulse_length', None),
+            getattr(device, 'code_length', None))
+
+
+@attr.s
+class Frame:  # pylint: disable=too-few-public-methods
+    """A code that is sent once on behalf of one or more devices."""
+    code = attr.ib(converter=int)
+    radio = attr.ib(default=None)
+    devices = attr.ib(default=attr.Factory(list))
+    timing = attr.ib(default=(None, None, None))
+
+    @property
+    def device_names(self):
+        """Returns the names of the devices that are switched by the frame."""
+        return [device.device_name for device in self.devices]
+
+    @property
+    def leader(self):
+        """Returns the device that needs the most repeats. It decides on the repeat count."""
+        return max(self.devices, key=lambda device: device.resend)
+
+
+def plan_frames(on_off, devices):
+    """
+    Plans the minimal set of transmissions to switch all the given devices. Devices that share
+    a code (and radio and timing) are switched by a single frame. The frames are ordered by the
+    first device that needs it.
+
+    Example:
+
+        >>> frames = plan_frames(True, [CodeDevice('device1', code_on=1, code_off=2),
+        ...                             CodeDevice('device2', code_on=3, code_off=4),
+        ...                             CodeDevice('device3', code_on=1, code_off=5, resend=5)])
+        >>> [(frame.code, frame.device_names, frame.leader.device_name) for frame in frames]
+        [(1, ['device1', 'device3'], 'device3'), (3, ['device2'], 'device2')]
+    """
+    frames = []
+    by_key = {}
+    for device in devices:
+        key = (code_for(on_off, device), getattr(device, 'radio', None), timing_of(device))
+        frame = by_key.get(key)
+        if frame is None:
+            frame = Frame(code=key[0], radio=key[1], timing=key[2])
+            by_key[key] = frame
+            frames.append(frame)
+        frame.devices.append(device)
+    return frames
+
+
+def _leader(device_or_frame):
+    if isinstance(device_or_frame, Frame):
+        return device_or_frame.leader
+    return device_or_frame
+
+
+def _times(resend_policy, device_or_frame, on_off):
+    """Returns the repeat count of a device or frame (decided by its leader)."""
+    if resend_policy is None:
+        return _leader(device_or_frame).resend
+    return resend_policy.times(_leader(device_or_frame), on_off)
+
+
+def _report(resend_policy, device_or_frame, on_off, times, acknowledged):
+    """Reports the result of a transmission to the resend policy (if any)."""
+    if resend_policy is not None:
+        resend_policy.report_sent(_leader(device_or_frame), on_off, times, bool(acknowledged))
+    return bool(acknowledged)
+
+
+def _frame_name(frame, group_name):
+    """The name of a frame in the audit log."""
+    if len(frame.devices) == 1:
+        return frame.devices[0].device_name
+    return group_name or frame.leader.device_name
+
+
+def _work(jobs):
+    """Worker loop of a `TransmitQueue`. Runs until `None` is queued."""
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        future, fun, args = job
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            future.set_result(fun(*args))
+        except Exception as exc:  # pylint: disable=broad-except
+            future.set_exception(exc)
+
+
+@attr.s
+class FairQueue:
+    """
+    Blocking weighted fair queue (self-clocked fair queueing). Items of different sources are
+    interleaved according to the weight of the source and the cost of the item, so a source
+    that queues many items can not starve the others.
+
+    Example:
+
+        >>> dut = FairQueue(weights={'mqtt': 2})
+        >>> for i in range(3):
+        ...     dut.put('rest{}'.format(i), source='rest')
+        >>> for i in range(3):
+        ...     dut.put('mqtt{}'.format(i), source='mqtt')
+        >>> [dut.get() for _ in range(6)]
+        ['mqtt0', 'rest0', 'mqtt1', 'mqtt2', 'rest1', 'rest2']
+    """
+    weights = attr.ib(default=attr.Factory(dict), validator=attr.validators.instance_of(dict))
+    default_weight = attr.ib(converter=float, default=1.0)
+    _heap = attr.ib(default=attr.Factory(list), repr=False, cmp=False, init=False)
+    _finish = attr.ib(default=attr.Factory(dict), repr=False, cmp=False, init=False)
+    _virtual = attr.ib(default=0.0, repr=False, cmp=False, init=False)
+    _seq = attr.ib(default=attr.Factory(itertools.count), repr=False, cmp=False, init=False)
+    _cond = attr.ib(default=attr.Factory(threading.Condition), repr=False, cmp=False,
+                    init=False)
+
+    def put(self, item, source=None, cost=1):
+        """Queues the item of the given source. Costly items wait longer."""
+        with self._cond:
+            weight = float(self.weights.get(source, self.default_weight))
+            finish = max(self._virtual, self._finish.get(source, 0.0)) + cost / weight
+            self._finish[source] = finish
+            heapq.heappush(self._heap, (finish, next(self._seq), item))
+            self._cond.notify()
+
+    def put_last(self, item):
+        """Queues the item after anything that is queued now or later."""
+        with self._cond:
+            heapq.heappush(self._heap, (float('inf'), next(self._seq), item))
+            self._cond.notify()
+
+    def get(self):
+        """Removes and returns the next item. Blocks until an item is available."""
+        with self._cond:
+            while not self._heap:
+                self._cond.wait()
+            finish, _, item = heapq.heappop(self._heap)
+            self._virtual = finish
+            return item
+
+
+@attr.s
+class TransmitQueue(LogMixin):
+    """
+    Runs the transmissions of a single radio one after another on a dedicated worker thread.
+    Transmissions of different radios run in parallel. Pending transmissions of different
+    sources (e.g. rest, mqtt) are admitted by weighted fair scheduling.
+
+    Example:
+
+        >>> dut = TransmitQueue('radio1')
+        >>> dut.submit(lambda x: x * 2, 21).result()
+        42
+        >>> dut.stop()
+    """
+    name = attr.ib(converter=str)
+    weights = attr.ib(default=attr.Factory(dict), validator=attr.validators.instance_of(dict))
+    _jobs = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _worker = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, init=False)
+
+    def __attrs_post_init__(self):
+        self._jobs = FairQueue(weights=self.weights)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=_work, args=(self._jobs,),
+                                                name="tx-{}".format(self.name))
+                self._worker.daemon = True
+                self._worker.start()
+
+    def submit(self, fun, *args, source=None, cost=1):
+        """
+        Queues the given function for execution on the worker thread.
+
+        Args:
+            fun: The function to execute.
+            *args: The arguments to pass to the function.
+            source (str): Where the request comes from (e.g. rest, mqtt).
+            cost (int): The airtime the function will take (e.g. number of frames to send).
+
+        Returns:
+            Returns a `concurrent.futures.Future` that resolves to the result of the function.
+        """
+        self._ensure_worker()
+        future = Future()
+        self._jobs.put((future, fun, args), source=source, cost=cost)
+        return future
+
+    def stop(self):
+        """Stops the worker thread after all queued transmissions are done."""
+        with self._lock:
+            if self._worker is not None:
+                self._jobs.put_last(None)
+                self._worker = None
+
+
 @attr.s
 class RC433(LogMixin):
     """
     Remote control 433mhz devices.
+
+    Call `start` to arm the radio before the first transmission and `stop` to release the
+    gpio. Only the process that armed the radio releases it (not a forked child). If the gpio
+    fails, the radio is re-armed in the background; transmissions fail fast meanwhile.
+
+    Example:
+
+        >>> dut = RC433()
+        >>> dut.rf_device = RFDeviceMock()  # Usually created by start
+        >>> dut.start()
+        >>> dut.ready, dut.send_code(12345)
+        (True, True)
+        >>> dut.stop()
+        >>> dut.ready
+        False
     """
     gpio_out = attr.ib(default=17, converter=int, validator=attr.validators.instance_of(int))
+    resend_policy = attr.ib(default=None)
+    weights = attr.ib(default=attr.Factory(dict), validator=attr.validators.instance_of(dict))
+    audit_log = attr.ib(default=None, repr=False, cmp=False)
+    recover_delay = attr.ib(default=1.0, converter=float, repr=False, cmp=False)
+    # Creates the RFDevice of a gpio pin (e.g. a `simulator.SimulatedRFDevice`)
+    rf_factory = attr.ib(default=None, repr=False, cmp=False)
     rf_device = attr.ib(default=None, init=False)
+    tx_queue = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _failed = attr.ib(default=False, repr=False, cmp=False, init=False)
+    _recovery = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _custom_timing = attr.ib(default=False, repr=False, cmp=False, init=False)
+    _armed_by = attr.ib(default=None, repr=False, cmp=False, init=False)  # Process id
+
+    def __attrs_post_init__(self):
+        self.tx_queue = TransmitQueue("gpio{}".format(self.gpio_out), weights=self.weights)
+
+    @property
+    def ready(self):
+        """True if the radio is armed and can transmit."""
+        return self.rf_device is not None and not self._failed
 
     def _initialize(self):
         """Sets the RFDevice to transmit state if necessary"""
         if self.rf_device is None:
-            self.rf_device = RFDevice(self.gpio_out)
+            self.rf_device = (self.rf_factory or RFDevice)(self.gpio_out)
             self.rf_device.enable_tx()
 
+    def _release(self):
+        """Releases the gpio. Runs on the transmit worker."""
+        if self.rf_device is not None:
+            try:
+                self.rf_device.cleanup()
+            except GPIO_ERRORS as exc:
+                self.logger.warning("Releasing gpio %s failed: %s", self.gpio_out, exc)
+            self.rf_device = None
+
+    def start(self):
+        """
+        Arms the radio (gpio setup) and warms up the transmit worker, so the first transmission
+        is as fast as any other. Nothing is sent.
+        """
+        self._armed_by = os.getpid()
+        try:
+            self.tx_queue.submit(self._initialize).result()
+        except GPIO_ERRORS as exc:
+            self._fail(exc)
+            return
+        self.logger.info("Radio on gpio %s is ready", self.gpio_out)
+
+    def stop(self):
+        """Releases the gpio after all queued transmissions are sent."""
+        if self._armed_by not in (None, os.getpid()):
+            # Inherited by fork: The gpio and the transmit worker belong to the parent process
+            self.logger.debug("Not releasing gpio %s of process %s", self.gpio_out,
+                              self._armed_by)
+            return
+        if self._recovery is not None:
+            self._recovery.cancel()
+            self._recovery = None
+        self.tx_queue.submit(self._release).result()
+        self.tx_queue.stop()
+
+    def _fail(self, exc, delay=None):
+        """Takes the radio out of service and re-arms it in the background."""
+        delay = self.recover_delay if delay is None else delay
+        self.logger.error("Radio on gpio %s failed: %s. Recovering in %s seconds",
+                          self.gpio_out, exc, delay)
+        self._failed = True
+        self._recovery = threading.Timer(
+            delay, lambda: self.tx_queue.submit(self._recover, delay)
+        )
+        self._recovery.daemon = True
+        self._recovery.start()
+
+    def _recover(self, delay):
+        """Re-arms the radio. Runs on the transmit worker, not on the request path."""
+        self._release()
+        try:
+            self._initialize()
+        except GPIO_ERRORS as exc:
+            self._fail(exc, min(delay * 2, RECOVER_MAX_DELAY))
+            return
+        self._failed = False
+        self.logger.info("Radio on gpio %s recovered", self.gpio_out)
+
     def __del__(self):
         """Stops transmitting."""
+        if self.tx_queue is not None:
+            self.tx_queue.stop()
         if self.rf_device is not None:
             self.rf_device.cleanup()
             self.rf_device = None
 
-    def send_code(self, code, times=3):
+    def send_code(self, code, times=3, source=None, device_name=None, timing=None):
         """
         Sends a decimal code via 433mhz. This implementation will actually send
         the code multiple times to make sure that any disturbance in the force has less impact.
@@ -62,10 +430,32 @@ class RC433(LogMixin):
         Args:
             code (int): Code to send
             times (int):
+            source (str): Where the request comes from (e.g. rest, mqtt)
+            device_name (str): The device the code belongs to (for the audit log)
+            timing (tuple): The protocol, pulse length and code length (see `timing_of`).
+                Unset parts fall back to the defaults of rpi_rf.
 
         Returns:
             Returns True if the underlying RFDevice acknowledged; otherwise False.
         """
+        return self.submit_code(code, times, source=source, device_name=device_name,
+                                timing=timing).result()
+
+    def submit_code(self, code, times=3, source=None, device_name=None, timing=None):
+        """
+        Queues a decimal code for transmission without waiting for it to be sent.
+
+        Args:
+            code (int): Code to send
+            times (int):
+            source (str): Where the request comes from (e.g. rest, mqtt)
+            device_name (str): The device the code belongs to (for the audit log)
+            timing (tuple): The protocol, pulse length and code length (see `timing_of`).
+
+        Returns:
+            Returns a `concurrent.futures.Future` that resolves to True if the underlying
+            RFDevice acknowledged; otherwise False.
+        """
         if not isinstance(code, int):
             raise TypeError("Argument code is expected to be an int, but given is '{}'"
                             .format(type(code)))
@@ -75,12 +465,75 @@ class RC433(LogMixin):
 
         if times <= 0:
             times = 1
+        settings = tx_settings(*timing) if timing else tx_settings()
 
-        self._initialize()
-        self.logger.debug("Sending code '%s' for %s times", code, str(times))
-        return any([self.rf_device.tx_code(code) for _ in range(times)])
+        return self.tx_queue.submit(self._transmit, code, times, device_name, source, settings,
+                                    source=source, cost=times)
 
-    def switch_device(self, on_off, device):
+    def _transmit(self, code, times, device_name=None, source=None, settings=None):
+        started = time.time()
+        acknowledged = False
+        try:
+            if self._failed:
+                self.logger.warning("Radio on gpio %s is recovering. Dropping code '%s'",
+                                    self.gpio_out, code)
+                return acknowledged
+            self.logger.debug("Sending code '%s' for %s times", code, times)
+            if not settings and self._custom_timing:
+                settings = _RESET_SETTINGS
+            self._custom_timing = bool(settings) and settings is not _RESET_SETTINGS
+            try:
+                self._initialize()
+                for _ in range(times):
+                    acknowledged = self.rf_device.tx_code(code, **settings) or acknowledged
+            except GPIO_ERRORS as exc:
+                self._fail(exc)
+            return acknowledged
+        finally:
+            record_transmission(self.audit_log, code, device_name, source, times, started,
+                                acknowledged)
+
+    def switch_devices(self, on_off, devices, source=None, group_name=None):
+        """
+        Switches all the given devices to on resp. off. Devices that share a code are switched
+        by a single transmission (see `plan_frames`).
+
+        Args:
+            on_off (bool): If True the devices will be set on; otherwise off.
+            devices (list): The devices (rpi433rc.business.devices.Device) to switch.
+            source (str): Where the request comes from (e.g. rest, mqtt)
+            group_name (str): The group the devices belong to (for the audit log)
+
+        Returns:
+            Returns a dictionary device name -> True if the underlying RFDevice acknowledged.
+        """
+        futures = []
+        for frame in plan_frames(on_off, devices):
+            times = _times(self.resend_policy, frame, on_off)
+            futures.append((frame, times, self.submit_code(
+                frame.code, times=times, source=source,
+                device_name=_frame_name(frame, group_name), timing=frame.timing
+            )))
+        res = {}
+        for frame, times, future in futures:
+            acknowledged = _report(self.resend_policy, frame, on_off, times, future.result())
+            for device_name in frame.device_names:
+                res[device_name] = acknowledged
+        return res
+
+    def resend_stats(self):
+        """Returns the per device delivery statistics of the resend policy (if any)."""
+        if self.resend_policy is None:
+            return {}
+        return self.resend_policy.stats()
+
+    def report_skipped(self, on_off, device):
+        """Tells the resend policy (if any) that a switch of the device was skipped, because it
+        already is in the requested state."""
+        if self.resend_policy is not None:
+            self.resend_policy.report_skipped(device, on_off)
+
+    def switch_device(self, on_off, device, source=None):
         """
         Switches the specified device to on resp. off.
 
@@ -89,15 +542,155 @@ class RC433(LogMixin):
         Args:
             device (rpi433rc.business.devices.Device): The device to turn on resp. off
             on_off (bool): If True the device will be set on; otherwise off.
+            source (str): Where the request comes from (e.g. rest, mqtt)
 
         Returns:
             Returns True if the underlying RFDevice acknowledged; otherwise False.
         """
-        self.logger.debug("Device switch for '%s' to '%s' requested", str(device), str(on_off))
-        if isinstance(device, CodeDevice):
-            return self.send_code(
-                device.code_on if on_off else device.code_off,
-                times=device.resend
-            )
+        self.logger.debug("Device switch for '%s' to '%s' requested", device, on_off)
+        code = code_for(on_off, device)
+        times = _times(self.resend_policy, device, on_off)
+        acknowledged = self.send_code(code, times=times, source=source,
+                                      device_name=device.device_name, timing=timing_of(device))
+        return _report(self.resend_policy, device, on_off, times, acknowledged)
+
+
+@attr.s
+class RadioPool(LogMixin):
+    """
+    Manages multiple radios (each one is a `RC433` on its own gpio pin). A device is sent by the
+    radio that is configured by its `radio` setting. Devices without a radio are sent by all
+    radios (broadcast). Each radio has its own transmit queue, so different radios transmit
+    in parallel.
+
+    Example:
+
+        >>> from rpi433rc.business.devices import CodeDevice
+        >>> radios = {'ground': RC433(gpio_out=17), 'upstairs': RC433(gpio_out=27)}
+        >>> for radio in radios.values():
+        ...     radio.rf_device = RFDeviceMock()
+        >>> dut = RadioPool(radios)
+        >>> dut.switch_device(True, CodeDevice('device1', code_on=1, code_off=2, radio='ground'))
+        True
+        >>> dut.switch_device(True, CodeDevice('device2', code_on=1, code_off=2))
+        True
+        >>> dut.switch_device(True, CodeDevice('device3', code_on=1, code_off=2, radio='attic'))
+        Traceback (most recent call last):
+        ...
+        rpi433rc.business.rc433.UnsupportedDeviceError: The radio 'attic' ... is not configured
+    """
+    radios = attr.ib(validator=attr.validators.instance_of(dict))
+    resend_policy = attr.ib(default=None)
+    audit_log = attr.ib(default=None, repr=False, cmp=False)  # Shared by the radios
+
+    @property
+    def ready(self):
+        """True if all radios are armed."""
+        return all(rc433.ready for rc433 in self.radios.values())
+
+    def start(self):
+        """Arms all radios (see `RC433.start`)."""
+        for rc433 in self.radios.values():
+            rc433.start()
+
+    def stop(self):
+        """Releases the gpio of all radios."""
+        for rc433 in self.radios.values():
+            rc433.stop()
+
+    def _route(self, radio=None):
+        if radio is None:
+            return list(self.radios.values())
+        try:
+            return [self.radios[radio]]
+        except KeyError:
+            raise UnsupportedDeviceError("The radio '{}' of the device is not configured"
+                                         .format(radio))
+
+    def send_code(self, code, times=3, radio=None, source=None, device_name=None,
+                  timing=None):
+        """
+        Sends a decimal code via the given radio. If no radio is given all radios will send it.
+
+        Args:
+            code (int): Code to send
+            times (int): How many times to send the code
+            radio (str): Name of the radio to use
+            source (str): Where the request comes from (e.g. rest, mqtt)
+            device_name (str): The device the code belongs to (for the audit log)
+            timing (tuple): The protocol, pulse length and code length (see `timing_of`).
+
+        Returns:
+            Returns True if any underlying RFDevice acknowledged; otherwise False.
+        """
+        futures = [rc433.submit_code(code, times, source=source, device_name=device_name,
+                                     timing=timing)
+                   for rc433 in self._route(radio)]
+        results = [future.result() for future in futures]
+        return any(results)
+
+    def switch_device(self, on_off, device, source=None):
+        """
+        Switches the specified device to on resp. off by using the radio of the device.
+
+        Args:
+            device (rpi433rc.business.devices.Device): The device to turn on resp. off
+            on_off (bool): If True the device will be set on; otherwise off.
+            source (str): Where the request comes from (e.g. rest, mqtt)
+
+        Returns:
+            Returns True if any underlying RFDevice acknowledged; otherwise False.
+        """
+        self.logger.debug("Device switch for '%s' to '%s' requested", device, on_off)
+        code = code_for(on_off, device)
+        radio = getattr(device, 'radio', None)
+        self._route(radio)  # Fail before the resend policy reserves the frames
+        times = _times(self.resend_policy, device, on_off)
+        acknowledged = self.send_code(code, times=times, radio=radio, source=source,
+                                      device_name=device.device_name, timing=timing_of(device))
+        return _report(self.resend_policy, device, on_off, times, acknowledged)
+
+    def switch_devices(self, on_off, devices, source=None, group_name=None):
+        """
+        Switches all the given devices to on resp. off by using the radio of each device.
+        Devices that share a code and radio are switched by a single transmission.
+
+        Args:
+            on_off (bool): If True the devices will be set on; otherwise off.
+            devices (list): The devices (rpi433rc.business.devices.Device) to switch.
+            source (str): Where the request comes from (e.g. rest, mqtt)
+            group_name (str): The group the devices belong to (for the audit log)
+
+        Returns:
+            Returns a dictionary device name -> True if any underlying RFDevice acknowledged.
+        """
+        frames = plan_frames(on_off, devices)
+        for frame in frames:
+            self._route(frame.radio)  # Fail before anything is sent
+        futures = []
+        for frame in frames:
+            times = _times(self.resend_policy, frame, on_off)
+            futures.append((frame, times, [
+                rc433.submit_code(frame.code, times=times, source=source,
+                                  device_name=_frame_name(frame, group_name), timing=frame.timing)
+                for rc433 in self._route(frame.radio)
+            ]))
+        res = {}
+        for frame, times, radio_futures in futures:
+            acknowledged = _report(self.resend_policy, frame, on_off, times,
+                                   any([future.result() for future in radio_futures]))
+            for device_name in frame.device_names:
+                res[device_name] = acknowledged
+        return res
+
+    def resend_stats(self):
+        """Returns the per device delivery statistics of the resend policy (if any)."""
+        if self.resend_policy is None:
+            return {}
+        return self.resend_policy.stats()
 
-        raise UnsupportedDeviceError("The device type '{}' is not supported".format(type(device)))
+    def report_skipped(self, on_off, device):
+        """Tells the resend policy (if any) that a switch of the device was skipped, because it
+        already is in the requested state."""
+        if self.resend_policy is not None:
+            self.resend_policy.report_skipped(device, on_off)
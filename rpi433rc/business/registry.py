@@ -3,10 +3,14 @@ is the state handler to handle actual states for the devices and the rc433 is th
 interface to control the hardware to send 433mhz commands to the power sockets.
 """
 
+import logging
+import time
+
 import attr
 
-from .devices import DeviceStore, UnknownDeviceError, Device, device_validator
-from .rc433 import RC433
+from .devices import (DeviceStore, UnknownDeviceError, Device, DeviceGroup, device_validator,
+                      parse_switch_policy, SWITCH_SKIP_IF_SAME, SWITCH_SKIP_IF_SAME_WITHIN)
+from .rc433 import RC433, RadioPool
 from .state import DeviceState
 
 
@@ -26,6 +30,25 @@ class StatefulDevice:  # pylint: disable=too-few-public-methods
     state = attr.ib(validator=attr.validators.instance_of(bool))
 
 
+@attr.s
+class SwitchResult:  # pylint: disable=too-few-public-methods
+    """
+    The result of a switch request. Evaluates to the acknowledgement of the radio.
+    `transmitted` tells if the code was actually sent or if the transmission was skipped,
+    because the device was already in the requested state.
+
+    Example:
+
+        >>> bool(SwitchResult(result=True, transmitted=False))
+        True
+    """
+    result = attr.ib(converter=bool)
+    transmitted = attr.ib(converter=bool, default=True)
+
+    def __bool__(self):
+        return self.result
+
+
 @attr.s
 class DeviceRegistry(DeviceStore, DeviceState):
     """
@@ -60,7 +83,7 @@ class DeviceRegistry(DeviceStore, DeviceState):
         True
 
         >>> dut.switch(True, device_name='device1')
-        True
+        SwitchResult(result=True, transmitted=True)
 
         >>> (dut.lookup(device_name='device1') ==
         ...     StatefulDevice(device_name='device1', device=CodeDevice(device_name='device1',
@@ -71,7 +94,10 @@ class DeviceRegistry(DeviceStore, DeviceState):
 
     device_store = attr.ib(validator=attr.validators.instance_of(DeviceStore))
     device_state = attr.ib(validator=attr.validators.instance_of(DeviceState))
-    rc433 = attr.ib(validator=attr.validators.instance_of(RC433))
+    rc433 = attr.ib(validator=attr.validators.instance_of((RC433, RadioPool)))
+    clock = attr.ib(default=time.monotonic, repr=False, cmp=False)
+    _switched_at = attr.ib(default=attr.Factory(dict), repr=False, cmp=False, init=False)
+    _observers = attr.ib(default=attr.Factory(list), repr=False, cmp=False, init=False)
 
     def __attrs_post_init__(self):
         self._init_all_devices()
@@ -91,6 +117,43 @@ class DeviceRegistry(DeviceStore, DeviceState):
     def init_done(self):
         self.device_state.init_done()
 
+    def observe(self, observer):
+        """Registers an observer of devices that are added (`device_added(device)`) or removed
+        (`device_removed(device_name)`) at runtime."""
+        self._observers.append(observer)
+
+    def start(self):
+        """Arms the radio. Call it before serving requests."""
+        self.rc433.start()
+
+    def stop(self):
+        """Releases the radio. Pending states are published (or saved) afterwards."""
+        self.rc433.stop()
+        self.device_state.stop()
+
+    def readiness(self):
+        """
+        Reports whether the radio is armed and the device states are known.
+
+        Example:
+
+            >>> from rpi433rc.business.devices import DeviceDict
+            >>> from rpi433rc.business.state import MemoryState
+            >>> from rpi433rc.business.rc433 import RFDeviceMock, RC433
+            >>> rc433 = RC433()
+            >>> rc433.rf_device = RFDeviceMock()
+            >>> dut = DeviceRegistry(DeviceDict({'device1': {'code_on': 1, 'code_off': 2}}),
+            ...                      MemoryState(), rc433)
+            >>> dut.start()
+            >>> dut.readiness()
+            {'radio': True, 'state': True}
+        """
+        return {'radio': self.rc433.ready, 'state': self.device_state.ready}
+
+    def changes(self, since=0, epoch=None):
+        """Returns the state changes since the given version (see `state.StateJournal`)."""
+        return self.device_state.changes(since, epoch)
+
     @device_validator
     def lookup(self, device=None, device_name=None):
         if not device:
@@ -106,16 +169,170 @@ class DeviceRegistry(DeviceStore, DeviceState):
         )
 
     def list(self):
-        self.logger.debug("[list] using %s (%s)", self.device_state, hex(id(self.device_state)))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("[list] using %s (%s)",
+                              self.device_state, hex(id(self.device_state)))
         return [self.lookup(device=device) for device in self.device_store.list()]
 
+    def add(self, device):
+        """
+        Adds a device to the store (if the store supports it) and starts tracking its state.
+
+        Example:
+
+            >>> from rpi433rc.business.devices import CodeDevice
+            >>> from rpi433rc.business.sqlstore import SQLiteStore
+            >>> from rpi433rc.business.state import MemoryState
+            >>> from rpi433rc.business.rc433 import RFDeviceMock, RC433
+            >>> rc433 = RC433()
+            >>> rc433.rf_device = RFDeviceMock()
+            >>> dut = DeviceRegistry(SQLiteStore(':memory:'), MemoryState(), rc433)
+            >>> dut.add(CodeDevice('device1', code_on=1, code_off=2)).code_on
+            1
+            >>> dut.switch(True, device_name='device1')
+            SwitchResult(result=True, transmitted=True)
+            >>> dut.remove('device1')
+            >>> dut.list()
+            []
+
+        Returns:
+            Returns the added device.
+        """
+        device = self.device_store.add(device)
+        self.device_state.add_device(device)
+        for observer in self._observers:
+            observer.device_added(device)
+        self.logger.info("Added device %s", device.device_name)
+        return device
+
+    def remove(self, device_name):
+        """Removes a device from the store (if the store supports it) and forgets its state."""
+        self.device_store.remove(device_name)
+        self._switched_at.pop(device_name, None)
+        self.device_state.remove_device(device_name)
+        for observer in self._observers:
+            observer.device_removed(device_name)
+        self.logger.info("Removed device %s", device_name)
+
+    def find(self, device_type=None, code=None, group=None):
+        """Finds devices by their type, code (on or off) and / or group (with their state)."""
+        return [self.lookup(device=device)
+                for device in self.device_store.find(device_type, code, group)]
+
+    def groups_of(self, device_name):
+        return self.device_store.groups_of(device_name)
+
+    def _skip(self, state_device, on_off, now):
+        """Returns True if the switch policy of the device allows to skip the transmission."""
+        if state_device.state != on_off:
+            return False
+        policy, ttl = parse_switch_policy(getattr(state_device.device, 'switch_policy', None))
+        if policy == SWITCH_SKIP_IF_SAME:
+            return True
+        if policy == SWITCH_SKIP_IF_SAME_WITHIN:
+            switched_at = self._switched_at.get(state_device.device_name)
+            return switched_at is not None and now - switched_at <= ttl
+        return False
+
     @device_validator
-    def switch(self, on_off, device=None, device_name=None):
+    def switch(self, on_off, device=None, device_name=None, source=None):
+        """
+        Switches the device on resp. off. Depending on the switch policy of the device the
+        transmission is skipped if the device is already in the requested state.
+
+        Example:
+
+            >>> from rpi433rc.business.devices import DeviceDict
+            >>> from rpi433rc.business.state import MemoryState
+            >>> from rpi433rc.business.rc433 import RFDeviceMock, RC433
+            >>> rc433 = RC433()
+            >>> rc433.rf_device = RFDeviceMock()
+            >>> now = [0.0]
+            >>> dut = DeviceRegistry(DeviceDict({
+            ...     'device1': {'code_on': 1, 'code_off': 2, 'switch_policy': 'skip_if_same'},
+            ...     'device2': {'code_on': 3, 'code_off': 4,
+            ...                 'switch_policy': 'skip_if_same_within(60)'}
+            ... }), MemoryState(), rc433, clock=lambda: now[0])
+            >>> dut.switch(False, device_name='device1')
+            SwitchResult(result=True, transmitted=False)
+
+            >>> dut.switch(True, device_name='device2').transmitted
+            True
+            >>> now[0] = 30.0
+            >>> dut.switch(True, device_name='device2').transmitted
+            False
+            >>> now[0] = 120.0
+            >>> dut.switch(True, device_name='device2').transmitted
+            True
+
+        Returns:
+            Returns a `SwitchResult`.
+        """
         state_device = self.lookup(device=device, device_name=device_name)
+        now = self.clock()
+        if isinstance(state_device.device, DeviceGroup):
+            return self._switch_group(on_off, state_device, now, source)
+        if self._skip(state_device, on_off, now):
+            self.logger.info("Skipping switch of %s: Already %s", state_device.device_name, on_off)
+            self.rc433.report_skipped(on_off, state_device.device)
+            return SwitchResult(result=True, transmitted=False)
+
         self.logger.info("Switching %s from %s to %s",
                          state_device.device_name, state_device.state, on_off)
         # rc433 and state component do not know about StatefulDevices
-        res = self.rc433.switch_device(on_off, state_device.device)
+        res = self.rc433.switch_device(on_off, state_device.device, source=source)
         if res:
+            self._switched_at[state_device.device_name] = now
             self.device_state.switch(on_off, device=state_device.device, device_name=device_name)
-        return res
+        return SwitchResult(result=res, transmitted=True)
+
+    def _switch_group(self, on_off, state_group, now, source):
+        """
+        Switches all members of a group. Members that share a code are switched by a single
+        transmission. Members that may be skipped (see switch policy) are not sent at all.
+
+        Example:
+
+            >>> from rpi433rc.business.devices import DeviceDict
+            >>> from rpi433rc.business.state import MemoryState
+            >>> from rpi433rc.business.rc433 import RFDeviceMock, RC433
+            >>> rc433 = RC433()
+            >>> rc433.rf_device = RFDeviceMock()
+            >>> dut = DeviceRegistry(DeviceDict({
+            ...     'device1': {'code_on': 1, 'code_off': 2},
+            ...     'device2': {'code_on': 1, 'code_off': 2},
+            ...     'device3': {'code_on': 3, 'code_off': 4},
+            ...     'group1': {'members': ['device1', 'device2', 'device3']}
+            ... }), MemoryState(), rc433)
+            >>> dut.switch(True, device_name='group1')
+            SwitchResult(result=True, transmitted=True)
+            >>> [dut.lookup(device_name=name).state for name in ('device1', 'device2', 'group1')]
+            [True, True, True]
+        """
+        members = []
+        for member_name in state_group.device.members:
+            member = self.lookup(device_name=member_name)
+            if self._skip(member, on_off, now):
+                self.logger.info("Skipping switch of %s: Already %s", member.device_name, on_off)
+                self.rc433.report_skipped(on_off, member.device)
+                continue
+            members.append(member)
+
+        if members:
+            self.logger.info("Switching group %s (%s) to %s", state_group.device_name,
+                             ', '.join(member.device_name for member in members), on_off)
+            acknowledged = self.rc433.switch_devices(
+                on_off, [member.device for member in members], source=source,
+                group_name=state_group.device_name
+            )
+        else:
+            acknowledged = {}
+        for member in members:
+            if acknowledged.get(member.device_name):
+                self._switched_at[member.device_name] = now
+                self.device_state.switch(on_off, device=member.device)
+
+        res = all(acknowledged.values())
+        if res:
+            self.device_state.switch(on_off, device=state_group.device)
+        return SwitchResult(result=res, transmitted=bool(members))
@@ -0,0 +1,296 @@
+"""Resend policies. Decide how many times a code is repeated on air."""
+
+import threading
+import time
+
+import attr
+
+from ..util import LogMixin
+
+
+@attr.s
+class ResendStats:  # pylint: disable=too-few-public-methods
+    """
+    Delivery statistics of a single device.
+
+    Example:
+
+        >>> stats = ResendStats(times=3, transmissions=4, corrections=1)
+        >>> stats.success_rate
+        0.75
+        >>> stats.as_dict()['success_rate']
+        0.75
+    """
+    times = attr.ib(converter=int)
+    transmissions = attr.ib(converter=int, default=0)
+    corrections = attr.ib(converter=int, default=0)
+    echoes = attr.ib(converter=int, default=0)
+    frames = attr.ib(converter=int, default=0)
+    streak = attr.ib(converter=int, default=0)
+
+    @property
+    def success_rate(self):
+        """Returns the ratio of transmissions that did not need a correction."""
+        if self.transmissions == 0:
+            return 1.0
+        return 1.0 - float(self.corrections) / self.transmissions
+
+    def as_dict(self):
+        """Returns the statistics as a dictionary."""
+        res = attr.asdict(self)
+        del res['streak']
+        res['success_rate'] = self.success_rate
+        return res
+
+
+@attr.s
+class _Transmission:  # pylint: disable=too-few-public-methods
+    """The last transmission of a device (used to detect corrections)."""
+    on_off = attr.ib()
+    timestamp = attr.ib()
+    acknowledged = attr.ib(default=False)  # By the radio
+    echoed = attr.ib(default=False)  # Picked up by the receiver
+    corrected = attr.ib(default=False)
+
+
+@attr.s
+class AdaptiveResend(LogMixin):
+    """
+    Adaptive resend policy driven by delivery feedback.
+
+    A device starts with its configured `resend` count (clamped to `min_times` / `max_times`).
+    A transmission is confirmed when the radio acknowledged it or, with `echo_required`, when
+    the receiver picked it up (see `report_echo`). When the same state is requested again for a
+    device within the `correction_window` and the last transmission was not confirmed, it is
+    considered lost: the repeat count of that device is doubled. Requests that are skipped,
+    because the device already is in the state, are regarded as well (see `report_skipped`).
+    After `decrease_after` confirmed transmissions in a row that were not corrected the repeat
+    count is decreased by one.
+
+    If an `airtime_budget` is given (frames per second for all devices), the repeat count is
+    lowered when the budget is used up. A transmission always gets at least one frame.
+
+    `times` only reserves the frames. A transmission (and its airtime) counts once the radio
+    acknowledged it (see `report_sent`); the frames of a failed transmission are released.
+
+    Example:
+
+        >>> from rpi433rc.business.devices import CodeDevice
+        >>> now = [0.0]
+        >>> dut = AdaptiveResend(min_times=1, max_times=8, correction_window=10,
+        ...                      decrease_after=3, clock=lambda: now[0])
+        >>> dev = CodeDevice('device1', code_on=1, code_off=2, resend=2)
+        >>> def send(on_off, acknowledged=True):
+        ...     times = dut.times(dev, on_off)
+        ...     dut.report_sent(dev, on_off, times, acknowledged)
+        ...     return times
+        >>> send(True)
+        2
+
+        Requesting the state of a confirmed transmission again is no correction (e.g. a client
+        that polls by sending the state)
+
+        >>> now[0] = 5.0
+        >>> send(True)
+        2
+
+        Retrying a failed transmission within the window is a correction. Failed transmissions
+        are not counted.
+
+        >>> now[0] = 6.0
+        >>> send(False, acknowledged=False), send(False)
+        (2, 4)
+        >>> stats = dut.stats()['device1']
+        >>> stats['corrections'], stats['transmissions'], stats['frames']
+        (1, 3, 8)
+
+        Confirmed transmissions that are not corrected lower the repeat count again
+
+        >>> send(True), send(False), send(True), send(False)
+        (4, 4, 3, 3)
+
+        With a receiver only echoes confirm transmissions
+
+        >>> dut = AdaptiveResend(echo_required=True, clock=lambda: now[0])
+        >>> send(True)
+        2
+        >>> dut.report_echo('device1', True)
+        >>> send(True), send(True)
+        (2, 4)
+        >>> dut.report_skipped(dev, True)  # Not echoed either
+        >>> stats = dut.stats()['device1']
+        >>> stats['echoes'], stats['corrections'], stats['transmissions']
+        (1, 2, 3)
+
+        The airtime budget caps the number of frames per second. Frames of failed transmissions
+        are released again.
+
+        >>> dut = AdaptiveResend(airtime_budget=4, clock=lambda: now[0])
+        >>> dut.times(dev, True), dut.times(dev, False), dut.times(dev, True)
+        (2, 2, 1)
+        >>> dut.report_sent(dev, True, 2, acknowledged=False)
+        >>> dut.times(dev, True)
+        2
+    """
+    min_times = attr.ib(converter=int, default=1)
+    max_times = attr.ib(converter=int, default=10)
+    correction_window = attr.ib(converter=float, default=10.0)
+    decrease_after = attr.ib(converter=int, default=5)
+    airtime_budget = attr.ib(default=None)
+    echo_required = attr.ib(converter=bool, default=False)
+    clock = attr.ib(default=time.monotonic, repr=False, cmp=False)
+    _stats = attr.ib(default=attr.Factory(dict), repr=False, cmp=False, init=False)
+    _last = attr.ib(default=attr.Factory(dict), repr=False, cmp=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, init=False)
+    _tokens = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _refilled = attr.ib(default=None, repr=False, cmp=False, init=False)
+
+    def _clamp(self, times):
+        return max(self.min_times, min(self.max_times, int(times)))
+
+    def _consume_budget(self, times, now):
+        """Token bucket: Refills `airtime_budget` frames per second."""
+        if not self.airtime_budget:
+            return times
+        budget = float(self.airtime_budget)
+        if self._tokens is None:
+            self._tokens, self._refilled = budget, now
+        self._tokens = min(budget, self._tokens + (now - self._refilled) * budget)
+        self._refilled = now
+        granted = max(1, min(times, int(self._tokens)))
+        self._tokens = max(0.0, self._tokens - granted)
+        return granted
+
+    def _release_budget(self, times):
+        """Gives the frames of a failed transmission back to the token bucket."""
+        if self.airtime_budget and self._tokens is not None:
+            self._tokens = min(float(self.airtime_budget), self._tokens + times)
+
+    def _confirmed(self, last):
+        return last.echoed or (last.acknowledged and not self.echo_required)
+
+    def _lost(self, last, on_off, now):
+        """Returns True if the request of the given state corrects the last transmission."""
+        return (last is not None and not last.corrected and not self._confirmed(last)
+                and last.on_off == on_off and now - last.timestamp <= self.correction_window)
+
+    def _correct(self, stats, last):
+        last.corrected = True
+        stats.corrections += 1
+        stats.streak = 0
+        stats.times = self._clamp(stats.times * 2)
+        self.logger.debug("Correction detected. Increasing repeats to %s", stats.times)
+
+    def _stats_of(self, device):
+        stats = self._stats.get(device.device_name)
+        if stats is None:
+            stats = ResendStats(times=self._clamp(getattr(device, 'resend', self.min_times)))
+            self._stats[device.device_name] = stats
+        return stats
+
+    def times(self, device, on_off):
+        """
+        Returns how many times the code to switch the given device should be sent. The frames
+        are reserved from the airtime budget until the result is reported by `report_sent`.
+
+        Args:
+            device (rpi433rc.business.devices.Device): The device to switch.
+            on_off (bool): The requested state.
+
+        Returns:
+            The number of repeats to send.
+        """
+        now = self.clock()
+        with self._lock:
+            stats = self._stats_of(device)
+            last = self._last.get(device.device_name)
+            if self._lost(last, on_off, now):
+                self._correct(stats, last)
+            elif last is not None and self._confirmed(last):
+                stats.streak += 1
+                if stats.streak >= self.decrease_after:
+                    stats.streak = 0
+                    stats.times = self._clamp(stats.times - 1)
+            self._last[device.device_name] = _Transmission(on_off=on_off, timestamp=now)
+            return self._consume_budget(stats.times, now)
+
+    def report_sent(self, device, on_off, times, acknowledged):
+        """
+        Reports the result of a transmission that was planned by `times`. Only transmissions
+        the radio acknowledged are counted; the frames of failed ones are released.
+
+        Args:
+            device (rpi433rc.business.devices.Device): The switched device.
+            on_off (bool): The requested state.
+            times (int): The number of repeats returned by `times`.
+            acknowledged (bool): True if the radio acknowledged the transmission.
+        """
+        with self._lock:
+            last = self._last.get(device.device_name)
+            if last is not None and last.on_off == on_off:
+                last.acknowledged = bool(acknowledged)
+            if not acknowledged:
+                self._release_budget(times)
+                return
+            stats = self._stats_of(device)
+            stats.transmissions += 1
+            stats.frames += times
+
+    def report_echo(self, device_name, on_off):
+        """
+        Reports that the receiver picked up the code of the given device and state (see
+        `EchoFeedback`). Confirms the last transmission of the device if it is in the window.
+        """
+        now = self.clock()
+        with self._lock:
+            last = self._last.get(device_name)
+            if (last is None or last.echoed or last.on_off != on_off
+                    or now - last.timestamp > self.correction_window):
+                return
+            last.echoed = True
+            self._stats[device_name].echoes += 1
+
+    def report_skipped(self, device, on_off):
+        """
+        Reports a request that was not sent, because the device already is in the requested
+        state. It corrects the last transmission if that was not confirmed.
+        """
+        now = self.clock()
+        with self._lock:
+            last = self._last.get(device.device_name)
+            if self._lost(last, on_off, now):
+                self._correct(self._stats_of(device), last)
+
+    def stats(self):
+        """Returns the delivery statistics of all devices keyed by the device name."""
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+
+@attr.s
+class EchoFeedback:  # pylint: disable=too-few-public-methods
+    """
+    Reports the codes a receiver picked up (see `learn.Learner.listen`) as echoes of the own
+    transmissions to the resend policy.
+
+    Example:
+
+        >>> from rpi433rc.business.devices import DeviceDict
+        >>> from rpi433rc.business.learn import Decoded
+        >>> store = DeviceDict({'device1': {'code_on': 1, 'code_off': 2}})
+        >>> policy = AdaptiveResend(echo_required=True)
+        >>> policy.times(store.lookup(device_name='device1'), False)
+        3
+        >>> dut = EchoFeedback(store, policy)
+        >>> dut([Decoded(code=2, bit_length=24, protocol=1, pulse_length=350)] * 2)
+        >>> policy.stats()['device1']['echoes']
+        1
+    """
+    store = attr.ib(repr=False)
+    policy = attr.ib()
+
+    def __call__(self, decoded):
+        for code in {frame.code for frame in decoded}:
+            for device in self.store.find(code=code):
+                self.policy.report_echo(device.device_name,
+                                        code == getattr(device, 'code_on', None))
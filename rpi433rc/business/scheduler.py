@@ -0,0 +1,333 @@
+"""Scheduled and delayed switching of devices."""
+
+import datetime
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+import uuid
+
+import attr
+
+from .. import codec
+from ..util import LogMixin, safe_call, on_off_to_bool
+
+
+def next_daily(daily, now):
+    """
+    Returns the next point in time (epoch seconds) after `now` at the given local time of day.
+
+    Example:
+
+        >>> now = time.mktime((2019, 5, 1, 12, 0, 0, 0, 0, -1))
+        >>> next_daily('13:30', now) - now
+        5400.0
+        >>> next_daily('06:30', now) - now
+        66600.0
+    """
+    hour, minute = [int(part) for part in daily.split(':')]
+    current = datetime.datetime.fromtimestamp(now)
+    due = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if due <= current:
+        due += datetime.timedelta(days=1)
+    return time.mktime(due.timetuple())
+
+
+@attr.s
+class Schedule:  # pylint: disable=too-few-public-methods
+    """
+    A scheduled switch of a device. It fires once at `due` (epoch seconds) or repeatedly
+    `every` n seconds or `daily` at a given local time (HH:MM).
+
+    Example:
+
+        >>> Schedule.create('device1', 'on', now=100, delay=30, schedule_id='abc')
+        ... # doctest: +NORMALIZE_WHITESPACE
+        Schedule(schedule_id='abc', device_name='device1', on_off=True, due=130.0, every=None,
+                 daily=None)
+
+        >>> Schedule.create('device1', False, now=100)
+        Traceback (most recent call last):
+        ...
+        ValueError: One of the arguments 'at', 'delay', 'every' or 'daily' is required
+    """
+    schedule_id = attr.ib(converter=str)
+    device_name = attr.ib(converter=str)
+    on_off = attr.ib(converter=on_off_to_bool)
+    due = attr.ib(converter=float)
+    every = attr.ib(converter=attr.converters.optional(float), default=None)
+    daily = attr.ib(converter=attr.converters.optional(str), default=None)
+
+    @property
+    def repeating(self):
+        """Returns True if the schedule fires more than once."""
+        return self.every is not None or self.daily is not None
+
+    def next_due(self, now):
+        """
+        Returns the next due time after it has fired at `now`. Missed periods (e.g. while the
+        service was down) are skipped, so a late schedule fires only once.
+
+        Example:
+
+            >>> dut = Schedule.create('device1', 'on', now=0, every=60)
+            >>> dut.next_due(now=60), dut.next_due(now=61), dut.next_due(now=300)
+            (120.0, 120.0, 360.0)
+        """
+        if self.every is not None:
+            return self.due + self.every * (math.floor((now - self.due) / self.every) + 1)
+        return next_daily(self.daily, now)
+
+    @classmethod
+    def create(cls, device_name, on_off, now, at=None, delay=None, every=None, daily=None,
+               schedule_id=None):
+        """Creates a new schedule from the given timing arguments."""
+        # pylint: disable=too-many-arguments,invalid-name
+        if at is not None:
+            due = float(at)
+        elif delay is not None:
+            due = now + float(delay)
+        elif every is not None:
+            due = now + float(every)
+        elif daily is not None:
+            due = next_daily(daily, now)
+        else:
+            raise ValueError("One of the arguments 'at', 'delay', 'every' or 'daily' is required")
+        return cls(schedule_id=schedule_id or uuid.uuid4().hex, device_name=device_name,
+                   on_off=on_off, due=due, every=every, daily=daily)
+
+
+@attr.s
+class Scheduler(LogMixin):
+    """
+    Fires scheduled switches by using a `DeviceRegistry`. Pending schedules are kept in a heap
+    (O(log n) insertion); cancelled schedules are dropped lazily when they come up.
+    If a `file_name` is given, the schedules survive restarts: Every change is appended to a
+    journal (`<file_name>.journal`, one json line each). The journal is compacted into
+    `file_name` once it holds more entries than there are schedules.
+
+    Example:
+
+        >>> class Registry:
+        ...     def switch(self, on_off, device_name=None, source=None):
+        ...         print("Switch", device_name, on_off)
+        >>> now = [100.0]
+        >>> dut = Scheduler(Registry(), clock=lambda: now[0])
+        >>> once = dut.add(Schedule.create('device1', 'on', now=now[0], delay=10))
+        >>> periodic = dut.add(Schedule.create('device2', 'off', now=now[0], every=60))
+        >>> dut.cancel('unknown')
+        False
+        >>> now[0] = 115.0
+        >>> dut.run_pending()
+        Switch device1 True
+        >>> now[0] = 160.0
+        >>> dut.run_pending()
+        Switch device2 False
+        >>> [schedule.device_name for schedule in dut.list()]
+        ['device2']
+        >>> dut.stats()['fired'], dut.stats()['max_latency']
+        (2, 5.0)
+
+        A late repeating schedule fires once
+
+        >>> now[0] = 400.0
+        >>> dut.run_pending()
+        Switch device2 False
+        >>> dut.list()[0].due
+        460.0
+    """
+    registry = attr.ib()
+    file_name = attr.ib(default=None)
+    clock = attr.ib(default=time.time, repr=False, cmp=False)
+    _schedules = attr.ib(default=attr.Factory(dict), repr=False, cmp=False, init=False)
+    _heap = attr.ib(default=attr.Factory(list), repr=False, cmp=False, init=False)
+    _seq = attr.ib(default=attr.Factory(itertools.count), repr=False, cmp=False, init=False)
+    _cond = attr.ib(default=attr.Factory(threading.Condition), repr=False, cmp=False,
+                    init=False)
+    _worker = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _latency = attr.ib(default=attr.Factory(lambda: {'fired': 0, 'total': 0.0, 'max': 0.0}),
+                       repr=False, cmp=False, init=False)
+    _journaled = attr.ib(default=0, repr=False, cmp=False, init=False)
+
+    def _push(self, schedule):
+        self._schedules[schedule.schedule_id] = schedule
+        heapq.heappush(self._heap, (schedule.due, next(self._seq), schedule.schedule_id))
+
+    def _compact(self):
+        """Drops cancelled entries from the heap if they make up most of it."""
+        if len(self._heap) > 2 * len(self._schedules) + 64:
+            self._heap = [entry for entry in self._heap
+                          if entry[2] in self._schedules and
+                          self._schedules[entry[2]].due == entry[0]]
+            heapq.heapify(self._heap)
+
+    @property
+    def _journal_name(self):
+        return self.file_name + '.journal'
+
+    def _save(self):
+        """Writes all schedules to `file_name` and empties the journal."""
+        if self.file_name is None:
+            return
+        tmp_file = self.file_name + '.tmp'
+        with open(tmp_file, 'wb') as fpointer:
+            fpointer.write(codec.dumpb([attr.asdict(schedule)
+                                        for schedule in self._schedules.values()]))
+        os.replace(tmp_file, self.file_name)
+        with open(self._journal_name, 'wb'):
+            pass
+        self._journaled = 0
+
+    def _journal(self, schedule=None, removed=None):
+        """Appends an added (or rescheduled) resp. removed schedule to the journal."""
+        if self.file_name is None:
+            return
+        entry = {'add': attr.asdict(schedule)} if schedule is not None else {'remove': removed}
+        with open(self._journal_name, 'ab') as fpointer:
+            fpointer.write(codec.dumpb(entry) + b'\n')
+        self._journaled += 1
+        if self._journaled > len(self._schedules) + 64:
+            self._save()
+
+    def _replay(self, schedules):
+        """
+        Applies the journal to the loaded schedules (schedule id -> properties). Returns the
+        number of replayed entries.
+        """
+        if not os.path.exists(self._journal_name):
+            return 0
+        replayed = 0
+        with open(self._journal_name, 'rb') as fpointer:
+            for line in fpointer:
+                try:
+                    entry = codec.loads(line)
+                except ValueError:
+                    self.logger.warning("Skipping an incomplete journal entry in %s",
+                                        self._journal_name)
+                    continue
+                if 'add' in entry:
+                    schedules[entry['add']['schedule_id']] = entry['add']
+                else:
+                    schedules.pop(entry['remove'], None)
+                replayed += 1
+        return replayed
+
+    def load(self):
+        """Loads the persisted schedules (if any)."""
+        if self.file_name is None:
+            return
+        schedules = {}
+        if os.path.exists(self.file_name):
+            with open(self.file_name, 'r') as fpointer:
+                schedules = {props['schedule_id']: props for props in codec.load(fpointer)}
+        replayed = self._replay(schedules)
+        with self._cond:
+            for props in schedules.values():
+                self._push(Schedule(**props))
+            if replayed:
+                self._save()  # Compacts the journal
+            self._cond.notify()
+        self.logger.info("Loaded %s schedules from %s", len(schedules), self.file_name)
+
+    def add(self, schedule):
+        """Adds a schedule. Returns the schedule."""
+        with self._cond:
+            self._push(schedule)
+            self._journal(schedule)
+            self._cond.notify()
+        return schedule
+
+    def cancel(self, schedule_id):
+        """Cancels a schedule. Returns True if the schedule was pending; otherwise False."""
+        with self._cond:
+            if self._schedules.pop(schedule_id, None) is None:
+                return False
+            self._compact()
+            self._journal(removed=schedule_id)
+            self._cond.notify()
+        return True
+
+    def list(self):
+        """Lists all pending schedules ordered by their due time."""
+        with self._cond:
+            return sorted(self._schedules.values(), key=lambda schedule: schedule.due)
+
+    def stats(self):
+        """Returns the number of fired schedules and the firing latency in seconds."""
+        with self._cond:
+            fired = self._latency['fired']
+            return {
+                'pending': len(self._schedules),
+                'fired': fired,
+                'mean_latency': self._latency['total'] / fired if fired else 0.0,
+                'max_latency': self._latency['max']
+            }
+
+    @safe_call
+    def _fire(self, schedule):
+        self.registry.switch(schedule.on_off, device_name=schedule.device_name,
+                             source='internal')
+
+    def _pop_due(self, now):
+        """Pops the next due schedule. Returns None if nothing is due."""
+        while self._heap and self._heap[0][0] <= now:
+            due, _, schedule_id = heapq.heappop(self._heap)
+            schedule = self._schedules.get(schedule_id)
+            if schedule is None or schedule.due != due:
+                continue  # Cancelled or rescheduled
+            if schedule.repeating:
+                rescheduled = attr.evolve(schedule, due=schedule.next_due(now))
+                self._push(rescheduled)
+                self._journal(rescheduled)
+            else:
+                del self._schedules[schedule_id]
+                self._journal(removed=schedule_id)
+            return schedule
+        return None
+
+    def run_pending(self):
+        """Fires all schedules that are due."""
+        while True:
+            with self._cond:
+                now = self.clock()
+                schedule = self._pop_due(now)
+                if schedule is None:
+                    return
+                latency = max(0.0, now - schedule.due)
+                self._latency['fired'] += 1
+                self._latency['total'] += latency
+                self._latency['max'] = max(self._latency['max'], latency)
+            self.logger.info("Firing schedule %s (%s to %s) with a latency of %.3fs",
+                             schedule.schedule_id, schedule.device_name, schedule.on_off,
+                             latency)
+            self._fire(schedule)
+
+    def _run(self):
+        while True:
+            self.run_pending()
+            with self._cond:
+                timeout = None
+                if self._heap:
+                    timeout = max(0.0, self._heap[0][0] - self.clock())
+                self._cond.wait(timeout)
+
+    def run_async(self):
+        """Loads the persisted schedules and fires them on a background thread."""
+        self.load()
+        self._worker = threading.Thread(target=self._run, name='scheduler')
+        self._worker.daemon = True
+        self._worker.start()
+
+    @safe_call
+    def on_mqtt_message(self, device_name, message):
+        """
+        Adds a schedule from a mqtt message like `{"on_off": "off", "delay": 1800}`.
+        A message `cancel <schedule_id>` cancels a schedule.
+        """
+        if message.startswith('cancel '):
+            self.cancel(message[len('cancel '):].strip())
+            return
+        props = codec.loads(message)
+        self.add(Schedule.create(device_name, props.pop('on_off'), now=self.clock(), **props))
@@ -0,0 +1,320 @@
+"""Deterministic simulation of the 433mhz band. A `SimulatedRFDevice` stands in for the
+RFDevice of rpi_rf: Its frames take the airtime of the real protocol timing on a shared
+`RFMedium`, overlapping frames of different senders collide and the frames that got through
+are fed to `SimulatedReceiver`s. Time is virtual (see `VirtualClock`), so runs are reproducible
+and need no gpio at all."""
+
+import threading
+import time
+from collections import deque
+
+import attr
+
+from .learn import EdgeRing
+from .protocols import PROTOCOLS
+from ..util import LogMixin
+
+
+def waveform(code, protocol=1, pulse_length=None, code_length=24):
+    """
+    Returns the edge durations (us) of a single repeat of a code as rpi_rf sends it.
+
+    Example:
+
+        >>> waveform(5, code_length=3)
+        [1050, 350, 350, 1050, 1050, 350, 350, 10850]
+        >>> sum(waveform(5592405)) / 1000000  # Seconds per repeat (rpi_rf repeats 10 times)
+        0.0448
+    """
+    proto = PROTOCOLS[protocol]
+    pulse_length = pulse_length or proto.pulse_length
+    bits = format(code, '0{}b'.format(code_length))[:code_length]
+    res = []
+    if protocol == 6:  # Nexa: Each bit is sent as a pair of bits after an extra sync
+        bits = ''.join('10' if bit == '1' else '01' for bit in bits)
+        res.extend((proto.sync_high * pulse_length, proto.sync_low * pulse_length))
+    for bit in bits:
+        high, low = (proto.one_high, proto.one_low) if bit == '1' else (proto.zero_high,
+                                                                        proto.zero_low)
+        res.extend((high * pulse_length, low * pulse_length))
+    res.extend((proto.sync_high * pulse_length, proto.sync_low * pulse_length))
+    return res
+
+
+@attr.s
+class VirtualClock:
+    """
+    Simulated time in seconds. It only moves when it is advanced.
+
+    Example:
+
+        >>> dut = VirtualClock()
+        >>> dut.advance(1.5), dut.now()
+        (1.5, 1.5)
+    """
+    start = attr.ib(converter=float, default=0.0)
+    _now = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, init=False)
+
+    def __attrs_post_init__(self):
+        self._now = self.start
+
+    def now(self):
+        """Returns the current (virtual) time."""
+        return self._now
+
+    def advance(self, seconds):
+        """Moves the time forward. Returns the new time."""
+        with self._lock:
+            self._now += seconds
+            return self._now
+
+
+@attr.s
+class SimFrame:  # pylint: disable=too-few-public-methods
+    """A code on the air: All repeats of a single `tx_code` call."""
+    sender = attr.ib(repr=False, cmp=False)
+    code = attr.ib()
+    protocol = attr.ib()
+    pulse_length = attr.ib()
+    code_length = attr.ib()
+    start = attr.ib()
+    end = attr.ib()
+    durations = attr.ib(repr=False, cmp=False)
+    collided = attr.ib(default=False)
+
+    def overlaps(self, other):
+        """True if both frames are on the air at the same time."""
+        return self.start < other.end and other.start < self.end
+
+
+@attr.s
+class RFMedium(LogMixin):
+    """
+    The shared band. Frames of different senders that overlap in time collide and are lost.
+    A frame is delivered to the attached receivers once it is settled, i.e. once the clock
+    passed its end (no later frame can overlap it anymore).
+
+    Example:
+
+        >>> medium = RFMedium()
+        >>> radio1 = SimulatedRFDevice(17, medium, tx_repeat=1)
+        >>> radio2 = SimulatedRFDevice(27, medium, tx_repeat=1)
+        >>> radio1.enable_tx(), radio2.enable_tx()
+        (True, True)
+        >>> radio1.tx_code(1), radio2.tx_code(2)  # Both start right now
+        (True, True)
+        >>> medium.advance(1.0)
+        [SimFrame(code=1, protocol=1, pulse_length=350, code_length=24, start=0.0, end=0.0448, \
+collided=True), SimFrame(code=2, protocol=1, pulse_length=350, code_length=24, start=0.0, \
+end=0.0448, collided=True)]
+        >>> radio2.tx_code(3)
+        True
+        >>> [(frame.code, frame.start, frame.collided) for frame in medium.advance(1.0)]
+        [(3, 1.0, False)]
+        >>> medium.stats() == {'frames': 3, 'collisions': 2, 'airtime': 0.1344}
+        True
+
+        An instant medium advances its clock by the airtime of each frame (sending takes no
+        real time, so the clock must not run on its own)
+
+        >>> medium = RFMedium(instant=True)
+        >>> radio1 = SimulatedRFDevice(17, medium, tx_repeat=1)
+        >>> radio1.enable_tx() and radio1.tx_code(1) and radio1.tx_code(2)
+        True
+        >>> medium.clock.now(), [(frame.start, frame.collided) for frame in medium.history]
+        (0.0896, [(0.0, False), (0.0448, False)])
+    """
+    clock = attr.ib(default=attr.Factory(VirtualClock))
+    history_size = attr.ib(converter=int, default=1000)
+    instant = attr.ib(converter=bool, default=False)
+    frames = attr.ib(default=0, init=False)
+    collisions = attr.ib(default=0, init=False)
+    airtime = attr.ib(default=0.0, init=False)
+    history = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _active = attr.ib(default=attr.Factory(list), repr=False, cmp=False, init=False)
+    _receivers = attr.ib(default=attr.Factory(list), repr=False, cmp=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.RLock), repr=False, cmp=False, init=False)
+    _stopped = attr.ib(default=None, repr=False, cmp=False, init=False)
+
+    def __attrs_post_init__(self):
+        self.history = deque(maxlen=self.history_size)
+
+    def attach(self, receiver):
+        """Feeds the settled frames to the given receiver (see `SimulatedReceiver`)."""
+        with self._lock:
+            self._receivers.append(receiver)
+
+    def detach(self, receiver):
+        """Stops feeding the given receiver."""
+        with self._lock:
+            if receiver in self._receivers:
+                self._receivers.remove(receiver)
+
+    def transmit(self, frame):
+        """Puts the frame on the air. Marks it and any overlapping frame as collided."""
+        with self._lock:
+            for other in self._active:
+                if other.sender is not frame.sender and other.overlaps(frame):
+                    other.collided = frame.collided = True
+            self._active.append(frame)
+            self.history.append(frame)
+            self.frames += 1
+            self.airtime = round(self.airtime + frame.end - frame.start, 9)
+            if self.instant:
+                self.clock.advance(max(0.0, frame.end - self.clock.now()))
+                self.settle()
+
+    def settle(self, until=None):
+        """Delivers the frames that ended by the given time (default: now). Returns them."""
+        until = self.clock.now() if until is None else until
+        with self._lock:
+            done = sorted((frame for frame in self._active if frame.end <= until),
+                          key=lambda frame: frame.start)
+            self._active = [frame for frame in self._active if frame.end > until]
+            for frame in done:
+                if frame.collided:
+                    self.collisions += 1
+                    self.logger.info("Code '%s' collided at %.6f", frame.code, frame.start)
+                    continue
+                for receiver in self._receivers:
+                    receiver.receive(frame)
+        return done
+
+    def advance(self, seconds):
+        """Moves the clock forward and delivers the settled frames. Returns them."""
+        self.clock.advance(seconds)
+        return self.settle()
+
+    def stats(self):
+        """Returns the number of frames, the collided frames and the airtime in seconds."""
+        with self._lock:
+            return {'frames': self.frames, 'collisions': self.collisions,
+                    'airtime': self.airtime}
+
+    def _run(self, tick, scale):
+        while not self._stopped.wait(tick):
+            self.advance(tick / scale)
+
+    def run_async(self, tick=0.05, scale=1.0):
+        """Advances the clock in the background: `scale` real seconds per virtual second."""
+        self._stopped = threading.Event()
+        thread = threading.Thread(target=self._run, args=(tick, scale), name='rf-medium')
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """Stops advancing the clock."""
+        if self._stopped is not None:
+            self._stopped.set()
+
+
+@attr.s
+class SimulatedRFDevice(LogMixin):
+    """
+    Stands in for `rpi_rf.RFDevice`. Sending takes the airtime of the code (all repeats) on the
+    medium; with `realtime` > 0 the call blocks for `realtime` times the airtime as well. Like
+    rpi_rf the pulse length of the previous code is kept if none is given (even if the protocol
+    changes).
+
+    Example:
+
+        >>> medium = RFMedium()
+        >>> dut = SimulatedRFDevice(17, medium)
+        >>> dut.tx_code(1)  # Not enabled
+        False
+        >>> dut.enable_tx()
+        True
+        >>> dut.tx_code(1), dut.tx_code(2, tx_proto=2), dut.tx_code(3, tx_pulselength=300)
+        (True, True, True)
+        >>> [(frame.protocol, frame.pulse_length, frame.start) for frame in medium.history]
+        [(1, 350, 0.0), (2, 350, 0.448), (1, 300, 0.7385)]
+    """
+    gpio = attr.ib(converter=int)
+    medium = attr.ib(repr=False, cmp=False)
+    tx_proto = attr.ib(converter=int, default=1)
+    tx_pulselength = attr.ib(default=None)
+    tx_repeat = attr.ib(converter=int, default=10)
+    tx_length = attr.ib(converter=int, default=24)
+    realtime = attr.ib(converter=float, default=0.0)
+    tx_enabled = attr.ib(default=False, init=False)
+    _cursor = attr.ib(default=0.0, repr=False, cmp=False, init=False)
+
+    def __attrs_post_init__(self):
+        self.tx_pulselength = self.tx_pulselength or PROTOCOLS[self.tx_proto].pulse_length
+
+    def enable_tx(self):
+        """Enables sending."""
+        self.tx_enabled = True
+        return True
+
+    def cleanup(self):
+        """Disables sending."""
+        self.tx_enabled = False
+
+    def tx_code(self, code, tx_proto=None, tx_pulselength=None, tx_length=None):
+        """Sends a decimal code (same arguments as rpi_rf)."""
+        self.tx_proto = tx_proto or 1
+        if tx_pulselength:
+            self.tx_pulselength = tx_pulselength
+        if tx_length:
+            self.tx_length = tx_length
+        else:
+            self.tx_length = 32 if self.tx_proto == 6 or code > 16777216 else 24
+        if not self.tx_enabled or not 0 < self.tx_proto < len(PROTOCOLS):
+            self.logger.error("Can not send code '%s' on gpio %s", code, self.gpio)
+            return False
+        durations = waveform(code, self.tx_proto, self.tx_pulselength,
+                             self.tx_length) * self.tx_repeat
+        airtime = sum(durations) / 1000000
+        start = max(self.medium.clock.now(), self._cursor)  # Frames of one sender never overlap
+        self._cursor = round(start + airtime, 9)
+        self.medium.transmit(SimFrame(self, code, self.tx_proto, self.tx_pulselength,
+                                      self.tx_length, start, self._cursor, durations))
+        if self.realtime > 0:
+            time.sleep(airtime * self.realtime)
+        return True
+
+
+@attr.s
+class SimulatedReceiver:
+    """
+    Receives the settled frames of the medium. Like `learn.EdgeReceiver` it pushes the edges
+    to a ring buffer, so it can stand in for the receiver of the learn mode.
+
+    Example:
+
+        >>> from rpi433rc.business.learn import decode
+        >>> medium = RFMedium()
+        >>> dut = SimulatedReceiver(medium)
+        >>> dut.start()
+        >>> remote = SimulatedRFDevice(17, medium, tx_repeat=3)
+        >>> remote.enable_tx() and remote.tx_code(1234, tx_proto=2, tx_pulselength=650)
+        True
+        >>> [frame.code for frame in medium.advance(1.0)]
+        [1234]
+        >>> decode(dut.ring.drain())  # doctest: +NORMALIZE_WHITESPACE
+        [Decoded(code=1234, bit_length=24, protocol=2, pulse_length=650),
+         Decoded(code=1234, bit_length=24, protocol=2, pulse_length=650)]
+    """
+    medium = attr.ib(repr=False, cmp=False)
+    ring = attr.ib(default=attr.Factory(EdgeRing), repr=False, cmp=False)
+    frames = attr.ib(default=attr.Factory(lambda: deque(maxlen=1000)), repr=False, cmp=False)
+
+    def start(self):
+        """Attaches the receiver to the medium."""
+        self.medium.attach(self)
+        self.ring.drain()  # Forget anything before
+
+    def stop(self):
+        """Detaches the receiver."""
+        self.medium.detach(self)
+
+    def receive(self, frame):
+        """Pushes the edges of the given frame (called by the medium)."""
+        self.frames.append(frame)
+        timestamp = int(round(frame.start * 1000000))
+        self.ring.push(timestamp)
+        for duration in frame.durations:
+            timestamp += duration
+            self.ring.push(timestamp)
@@ -0,0 +1,189 @@
+"""Snapshot of the validated device configuration. Parsing and validating `devices.json` takes
+seconds for large inventories on slow sd cards. The snapshot keeps the result (the devices, their
+indexes, the state topics and the encoded discovery configurations) in a pickle file keyed by the
+sha256 of the devices file, the code (of the modules that load and shape the snapshot, e.g. the
+parser and the device classes) and the topic configuration. A restart with an unchanged
+configuration and code loads the snapshot instead.
+
+The snapshot is unpickled, so it must only be writable by the service (like `devices.json`)."""
+
+import functools
+import hashlib
+import os
+import pickle
+import sys
+
+import attr
+
+from . import devicefile as _devicefile, devices as _devices
+from .devicefile import format_of, read_devices
+from .devices import DeviceDict
+from .. import codec, model
+from ..config import VERSION
+from ..util import LogMixin
+
+SNAPSHOT_FORMAT = 1  # Bump if the layout of the snapshot file changes
+
+
+def _sha256(file_name, sha=None):
+    sha = sha or hashlib.sha256()
+    with open(file_name, 'rb') as fpointer:
+        for chunk in iter(lambda: fpointer.read(1 << 16), b''):
+            sha.update(chunk)
+    return sha
+
+
+@functools.lru_cache(maxsize=None)
+def code_fingerprint():
+    """
+    Returns the sha256 of the modules that load and shape the snapshot: The parser and validation
+    of the device file, the pickled device classes, the topics and discovery configurations and
+    the snapshot itself. Any change of them (e.g. a new field of a device class or a new check
+    of the loader) invalidates existing snapshots.
+
+    Example:
+
+        >>> len(code_fingerprint())
+        64
+    """
+    sha = hashlib.sha256()
+    for module in (_devicefile, _devices, model, codec, sys.modules[__name__]):
+        _sha256(module.__file__, sha)
+    return sha.hexdigest()
+
+
+def snapshot_key(file_name, topic_config=None):
+    """
+    Returns the key of a snapshot: The sha256 of the content of the device file, the code
+    version and fingerprint and the topic configuration (topics and payloads are derived
+    from it).
+
+    Example:
+
+        >>> import tempfile
+        >>> fn = tempfile.NamedTemporaryFile().name
+        >>> with open(fn, 'w') as fp:
+        ...     _ = fp.write('{"device1": {"code_on": 1, "code_off": 2}}')
+        >>> key = snapshot_key(fn)
+        >>> len(key), key == snapshot_key(fn)
+        (64, True)
+        >>> from rpi433rc.model import MQTTTopicConfig
+        >>> key == snapshot_key(fn, MQTTTopicConfig())
+        False
+    """
+    sha = _sha256(file_name)
+    sha.update('{}:{}:{}:{!r}'.format(VERSION, SNAPSHOT_FORMAT, code_fingerprint(),
+                                      topic_config).encode('utf-8'))
+    return sha.hexdigest()
+
+
+@attr.s
+class Snapshot:
+    """
+    The validated device configuration and everything derived from it.
+
+    Example:
+
+        >>> import io
+        >>> from rpi433rc.model import MQTTTopicConfig
+        >>> devices = read_devices(io.StringIO('{"device1": {"code_on": 1, "code_off": 2}}'))
+        >>> dut = Snapshot.build('key', devices, MQTTTopicConfig(discovery=True,
+        ...                                                      command_topic='set'))
+        >>> dut.state_topics
+        {'device1': 'rc433/switch/device1/state'}
+        >>> [device.device_name for device in dut.store.find(code=2)]
+        ['device1']
+        >>> dut.configs['device1'] == codec.dumpb(dut.topic_config.mk_discovery_config('device1'))
+        True
+    """
+    key = attr.ib(converter=str)
+    store = attr.ib(validator=attr.validators.instance_of(DeviceDict), repr=False)
+    topic_config = attr.ib(default=None)
+    state_topics = attr.ib(default=attr.Factory(dict), repr=False)
+    configs = attr.ib(default=attr.Factory(dict), repr=False)
+
+    @classmethod
+    def build(cls, key, devices, topic_config=None):
+        """Creates the snapshot of the given devices (device name -> device)."""
+        store = DeviceDict.from_devices(devices)
+        store.build_index()
+        res = cls(key, store, topic_config)
+        if topic_config is not None:
+            res.state_topics = {name: topic_config.mk_state_topic(name) for name in devices}
+            if topic_config.supports_commands():
+                res.configs = {name: codec.dumpb(topic_config.mk_discovery_config(name))
+                               for name in devices}
+        return res
+
+
+@attr.s
+class SnapshotFile(LogMixin):
+    """
+    Stores the snapshot of a device file. The snapshot is rebuilt when the device file, the code
+    version or the topic configuration changed.
+
+    Example:
+
+        >>> import tempfile
+        >>> fn = tempfile.NamedTemporaryFile().name
+        >>> snapshot_fn = tempfile.NamedTemporaryFile().name
+        >>> with open(fn, 'w') as fp:
+        ...     _ = fp.write('{"device1": {"code_on": 1, "code_off": 2}}')
+        >>> dut = SnapshotFile(snapshot_fn)
+        >>> dut.load(snapshot_key(fn)) is None  # No snapshot yet
+        True
+        >>> snapshot = dut.devices(fn)  # Reads the device file and writes the snapshot
+        >>> dut.load(snapshot.key).store.lookup(device_name='device1').code_off
+        2
+        >>> with open(fn, 'w') as fp:
+        ...     _ = fp.write('{"device1": {"code_on": 1, "code_off": 3}}')
+        >>> dut.devices(fn).store.lookup(device_name='device1').code_off  # Outdated
+        3
+    """
+    file_name = attr.ib(converter=str)
+
+    def load(self, key):
+        """Loads the snapshot. Returns None if there is none or its key does not match."""
+        try:
+            with open(self.file_name, 'rb') as fpointer:
+                fmt, stored_key = pickle.load(fpointer)
+                if (fmt, stored_key) != (SNAPSHOT_FORMAT, key):
+                    return None
+                return pickle.load(fpointer)
+        except FileNotFoundError:
+            return None
+        except Exception:  # pylint: disable=broad-except
+            self.logger.warning("Ignoring the unreadable snapshot '%s'", self.file_name,
+                                exc_info=True)
+            return None
+
+    def save(self, snapshot):
+        """Writes the snapshot. The file is replaced atomically."""
+        tmp_name = self.file_name + '.tmp'
+        with open(tmp_name, 'wb') as fpointer:
+            # The header comes first, so outdated snapshots are rejected without unpickling them
+            pickle.dump((SNAPSHOT_FORMAT, snapshot.key), fpointer,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(snapshot, fpointer, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, self.file_name)
+
+    def devices(self, file_name, topic_config=None):
+        """
+        Returns the snapshot of the given device file. Loads it if it is up to date; otherwise
+        the device file is read and a new snapshot is written.
+        """
+        key = snapshot_key(file_name, topic_config)
+        snapshot = self.load(key)
+        if snapshot is not None:
+            self.logger.info("Loaded %s devices from the snapshot '%s'",
+                             len(snapshot.store.devices), self.file_name)
+            return snapshot
+        with open(file_name, 'r', encoding='utf-8') as fpointer:
+            snapshot = Snapshot.build(key, read_devices(fpointer, format_of(file_name)),
+                                      topic_config)
+        try:
+            self.save(snapshot)
+        except OSError:
+            self.logger.warning("Could not write the snapshot '%s'", self.file_name,
+                                exc_info=True)
+        return snapshot
@@ -0,0 +1,258 @@
+"""Device store backed by a SQLite database. Devices can be added and removed at runtime and are
+looked up by indexed queries. Recently used devices are cached. The cache is dropped when another
+connection (e.g. another process) changed the database."""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import attr
+
+from .devices import (DeviceStore, DeviceGroup, UnknownDeviceError, check_group,
+                      device_from_json, device_validator)
+from .. import codec
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS devices ("
+    "  name TEXT PRIMARY KEY,"
+    "  type TEXT NOT NULL,"
+    "  code_on INTEGER,"
+    "  code_off INTEGER,"
+    "  configuration TEXT NOT NULL"
+    ")",
+    "CREATE INDEX IF NOT EXISTS devices_type ON devices (type)",
+    "CREATE INDEX IF NOT EXISTS devices_code_on ON devices (code_on)",
+    "CREATE INDEX IF NOT EXISTS devices_code_off ON devices (code_off)",
+    "CREATE TABLE IF NOT EXISTS members ("
+    "  group_name TEXT NOT NULL REFERENCES devices (name) ON DELETE CASCADE,"
+    "  member_name TEXT NOT NULL,"
+    "  PRIMARY KEY (group_name, member_name)"
+    ")",
+    "CREATE INDEX IF NOT EXISTS members_member ON members (member_name)",
+]
+
+# The statements are constant, so sqlite3 prepares each of them once (statement cache)
+_COLUMNS = "SELECT name, type, configuration FROM devices"
+_SELECT_ALL = _COLUMNS + " ORDER BY name"
+_SELECT_ONE = _COLUMNS + " WHERE name = ?"
+_SELECT_TYPE = _COLUMNS + " WHERE type = ? ORDER BY name"
+_SELECT_CODE = _COLUMNS + " WHERE code_on = ? UNION " + _COLUMNS + " WHERE code_off = ?"
+_SELECT_MEMBERS = (_COLUMNS + " WHERE name IN "
+                   "(SELECT member_name FROM members WHERE group_name = ?) ORDER BY name")
+_SELECT_GROUPS = "SELECT group_name FROM members WHERE member_name = ? ORDER BY group_name"
+_UPSERT = ("INSERT OR REPLACE INTO devices (name, type, code_on, code_off, configuration) "
+           "VALUES (?, ?, ?, ?, ?)")
+_DELETE = "DELETE FROM devices WHERE name = ?"
+_DELETE_MEMBERS = "DELETE FROM members WHERE group_name = ?"
+_INSERT_MEMBER = "INSERT INTO members (group_name, member_name) VALUES (?, ?)"
+
+
+def _hydrate(row):
+    name, device_type, configuration = row
+    return device_from_json(name, device_type, codec.loads(configuration))
+
+
+def _row(device):
+    return (device.device_name, type(device).__name__, getattr(device, 'code_on', None),
+            getattr(device, 'code_off', None), codec.dumps(device.configuration))
+
+
+@attr.s
+class SQLiteStore(DeviceStore):
+    """
+    Stores the devices in a SQLite database. Lookups hit a LRU cache of recently used
+    devices first. The cache is dropped if another connection committed a change
+    (`PRAGMA data_version`). That is checked at most every `sync_interval` seconds, so cache
+    hits do not query the database; call `refresh` to check right away.
+
+    Example:
+
+        >>> from rpi433rc.business.devices import CodeDevice
+        >>> dut = SQLiteStore(':memory:')
+        >>> dut.add(CodeDevice('device1', code_on=1, code_off=2)).device_name
+        'device1'
+        >>> dut.add(CodeDevice('device2', code_on=3, code_off=2)).device_name
+        'device2'
+        >>> dut.add(DeviceGroup('group1', members=['device1', 'device2']))
+        DeviceGroup(device_name='group1', members=['device1', 'device2'])
+        >>> dut.lookup(device_name='device1').code_on
+        1
+        >>> [device.device_name for device in dut.find(code=2)]
+        ['device1', 'device2']
+        >>> [device.device_name for device in dut.find(group='group1', code=3)]
+        ['device2']
+        >>> dut.groups_of('device2')
+        ['group1']
+        >>> dut.remove('device2')
+        Traceback (most recent call last):
+        ...
+        ValueError: The device 'device2' is a member of the groups group1
+        >>> dut.remove('group1')
+        >>> dut.remove('device2')
+        >>> [device.device_name for device in dut.list()]
+        ['device1']
+        >>> dut.find(group='unknown')
+        Traceback (most recent call last):
+        ...
+        rpi433rc.business.devices.UnknownDeviceError: The requested device 'unknown' is unknown
+
+        Changes of other connections are seen after `sync_interval` seconds
+
+        >>> import tempfile
+        >>> fn = tempfile.NamedTemporaryFile().name
+        >>> now = [0.0]
+        >>> dut, other = SQLiteStore(fn, clock=lambda: now[0]), SQLiteStore(fn)
+        >>> dut.add(CodeDevice('device1', code_on=1, code_off=2)).device_name
+        'device1'
+        >>> dut.lookup(device_name='device1').code_on
+        1
+        >>> other.add(CodeDevice('device1', code_on=5, code_off=6)).device_name
+        'device1'
+        >>> dut.lookup(device_name='device1').code_on  # Cached
+        1
+        >>> now[0] = 1.0
+        >>> dut.lookup(device_name='device1').code_on
+        5
+    """
+    file_name = attr.ib(converter=str)
+    cache_size = attr.ib(converter=int, default=1024)
+    sync_interval = attr.ib(converter=float, default=1.0)
+    clock = attr.ib(default=time.monotonic, repr=False, cmp=False)
+    _conn = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _cache = attr.ib(default=attr.Factory(OrderedDict), repr=False, cmp=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.RLock), repr=False, cmp=False, init=False)
+    _data_version = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _synced = attr.ib(default=None, repr=False, cmp=False, init=False)
+
+    def __attrs_post_init__(self):
+        self._conn = sqlite3.connect(self.file_name, check_same_thread=False,
+                                     cached_statements=32)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        with self._conn:
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+
+    def _sync(self, now):
+        """Drops the cache if another connection committed a change. Requires the lock."""
+        self._synced = now
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._cache.clear()
+            self._data_version = data_version
+
+    def refresh(self):
+        """Drops the cache right away if another connection committed a change."""
+        with self._lock:
+            self._sync(self.clock())
+
+    def _remember(self, device):
+        self._cache[device.device_name] = device
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)  # Forget the least recently used device
+        return device
+
+    def _query(self, statement, *args):
+        with self._lock:
+            return [_hydrate(row) for row in self._conn.execute(statement, args)]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM devices").fetchone()[0]
+
+    def list(self):
+        """
+        Lists all configured devices.
+
+        Returns:
+            Returns a list of all configured devices.
+        """
+        return self._query(_SELECT_ALL)
+
+    @device_validator
+    def lookup(self, device=None, device_name=None):
+        now = self.clock()
+        with self._lock:
+            if self._synced is None or now - self._synced >= self.sync_interval:
+                self._sync(now)
+            res = self._cache.get(device_name)
+            if res is not None:
+                self._cache.move_to_end(device_name)
+                return res
+            row = self._conn.execute(_SELECT_ONE, (device_name,)).fetchone()
+            if row is None:
+                raise UnknownDeviceError("The requested device '{}' is unknown"
+                                         .format(device_name))
+            return self._remember(_hydrate(row))
+
+    def _check_members(self, group):
+        known = {device.device_name: device for device in self._query(
+            _COLUMNS + " WHERE name IN ({})".format(', '.join('?' * len(group.members))),
+            *group.members)}
+        check_group(group, lambda member: not isinstance(known.get(member, group), DeviceGroup))
+
+    def add(self, device):
+        """Adds a device or replaces the device with the same name. Returns the device."""
+        return self.add_all([device])[0]
+
+    def add_all(self, devices):
+        """Adds (or replaces) many devices in a single transaction. Returns the devices."""
+        devices = list(devices)
+        with self._lock, self._conn:
+            self._conn.executemany(_UPSERT, (_row(device) for device in devices))
+            for device in devices:
+                self._cache.pop(device.device_name, None)
+                if isinstance(device, DeviceGroup):
+                    self._conn.execute(_DELETE_MEMBERS, (device.device_name,))
+                    self._conn.executemany(_INSERT_MEMBER, ((device.device_name, member)
+                                                            for member in device.members))
+            for device in devices:  # Raising rolls back the transaction
+                if isinstance(device, DeviceGroup):
+                    self._check_members(device)
+                    if self.groups_of(device.device_name):
+                        raise ValueError("Misconfigured device '{}': A member can not be a group"
+                                         .format(device.device_name))
+        return devices
+
+    def remove(self, device_name):
+        """Removes a device. Members of groups can not be removed."""
+        with self._lock:
+            groups = self.groups_of(device_name)
+            if groups:
+                raise ValueError("The device '{}' is a member of the groups {}"
+                                 .format(device_name, ', '.join(groups)))
+            with self._conn:
+                if self._conn.execute(_DELETE, (device_name,)).rowcount == 0:
+                    raise UnknownDeviceError("The requested device '{}' is unknown"
+                                             .format(device_name))
+            self._cache.pop(device_name, None)
+
+    def find(self, device_type=None, code=None, group=None):
+        """Finds devices by their type, code (on or off) and / or group (indexed)."""
+        if group is not None:
+            candidates = self._query(_SELECT_MEMBERS, group)
+            if not candidates:
+                self.lookup(device_name=group)  # Raises if the group is unknown
+        elif code is not None:
+            candidates = sorted(self._query(_SELECT_CODE, code, code),
+                                key=lambda device: device.device_name)
+        elif device_type is not None:
+            candidates = self._query(_SELECT_TYPE, device_type)
+        else:
+            candidates = self.list()
+        return [
+            device for device in candidates
+            if (device_type is None or type(device).__name__ == device_type) and
+            (code is None or code in (getattr(device, 'code_on', None),
+                                      getattr(device, 'code_off', None)))
+        ]
+
+    def groups_of(self, device_name):
+        """Returns the names of the groups the given device is a member of."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(_SELECT_GROUPS, (device_name,))]
+
+    def close(self):
+        """Closes the database."""
+        with self._lock:
+            self._conn.close()
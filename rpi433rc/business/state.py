@@ -1,12 +1,16 @@
 """Device state related components."""
+import threading
+import time
+import uuid
 from abc import abstractmethod
+from collections import deque
 
 import attr
 
 from .devices import device_validator
+from .. import codec
 from ..model import MQTTConfig, MQTTTopicConfig
-from ..util import (MQTTPublisher, safe_call, LogMixin, MQTTListener, on_off_to_bool,
-                    bool_to_on_off)
+from ..util import MQTTPublisher, safe_call, LogMixin, MQTTListener, on_off_to_bool
 
 
 @attr.s
@@ -22,6 +26,23 @@ class DeviceState(LogMixin):
         """The registry will call this method, when the initialization is done."""
         return
 
+    @property
+    def ready(self):  # pylint: disable=no-self-use
+        """True if the states are known (e.g. restored from the broker)."""
+        return True
+
+    def add_device(self, device):  # pylint: disable=unused-argument,no-self-use
+        """The registry will call this method when a device is added at runtime."""
+        return
+
+    def remove_device(self, device_name):  # pylint: disable=unused-argument,no-self-use
+        """The registry will call this method when a device is removed at runtime."""
+        return
+
+    def stop(self):  # pylint: disable=no-self-use
+        """The registry will call this method when it is stopped (after the radio)."""
+        return
+
     @abstractmethod
     def lookup(self, device=None, device_name=None):
         """
@@ -51,6 +72,120 @@ class DeviceState(LogMixin):
         """
         raise NotImplementedError()
 
+    def changes(self, since=0, epoch=None):
+        """
+        Returns the state changes since the given version (see `StateJournal.changes`).
+        """
+        raise NotImplementedError()
+
+
+@attr.s
+class StateChange:  # pylint: disable=too-few-public-methods
+    """The new state of a device (None if the device was removed) and the version of the
+    change."""
+    device_name = attr.ib(converter=str)
+    state = attr.ib()
+    version = attr.ib(converter=int)
+
+
+def _state_changes(changes):
+    return [change if isinstance(change, StateChange) else StateChange(**change)
+            for change in changes]
+
+
+@attr.s
+class Changes:  # pylint: disable=too-few-public-methods
+    """The state changes since a version. If `resync` is set, the journal did not reach back far
+    enough and `changes` holds the states of all devices instead."""
+    epoch = attr.ib(converter=str)
+    version = attr.ib(converter=int)
+    resync = attr.ib(converter=bool)
+    changes = attr.ib(converter=_state_changes)
+
+
+@attr.s
+class StateJournal:
+    """
+    Versions the device states. Every state change bumps the version and is appended to a
+    bounded journal, so clients that mirror the states only fetch the devices that changed since
+    the version they have seen last. The epoch identifies the journal: Versions of another epoch
+    (e.g. before a restart) are meaningless.
+
+    Example:
+
+        >>> dut = StateJournal(size=3)
+        >>> dut.record('device1', True), dut.record('device2', True), dut.record('device1', False)
+        (1, 2, 3)
+        >>> states = {'device1': False, 'device2': True, 'device3': True}
+        >>> dut.changes(1, states).changes  # Only the latest change of each device
+        [StateChange(device_name='device2', state=True, version=2), \
+StateChange(device_name='device1', state=False, version=3)]
+        >>> dut.changes(3, states).changes
+        []
+        >>> dut.record('device3', True), dut.record('device3', True)
+        (4, 5)
+        >>> dut.changes(1, states).resync  # Version 2 is gone
+        True
+        >>> dut.changes(0, states).resync  # Version 0 lists all devices
+        True
+        >>> [(change.device_name, change.version) for change in dut.changes(0, states).changes]
+        [('device1', 3), ('device2', 2), ('device3', 5)]
+        >>> dut.changes(3, states, epoch='unknown').resync
+        True
+    """
+    size = attr.ib(converter=int, default=1024)
+    epoch = attr.ib(default=attr.Factory(lambda: uuid.uuid4().hex), converter=str)
+    version = attr.ib(default=0, init=False)
+    _journal = attr.ib(default=None, repr=False, cmp=False, hash=False, init=False)
+    _versions = attr.ib(default=attr.Factory(dict), repr=False, cmp=False, hash=False,
+                        init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, hash=False,
+                    init=False)
+
+    def __attrs_post_init__(self):
+        self._journal = deque(maxlen=self.size)
+
+    def record(self, device_name, state):
+        """Records the new state of a device (None if removed). Returns the new version."""
+        with self._lock:
+            self.version += 1
+            self._journal.append(StateChange(device_name, state, self.version))
+            if state is None:
+                self._versions.pop(device_name, None)
+            else:
+                self._versions[device_name] = self.version
+            return self.version
+
+    def changes(self, since, states, epoch=None):
+        """
+        Returns the changes since the given version; each device at most once. The work depends
+        on the number of changes, not on the number of devices.
+
+        If the journal rolled over, the version is unknown (e.g. of a previous run) or the epoch
+        does not match, a resync with the current state of all devices is returned instead.
+        Version 0 always gets a resync.
+
+        Args:
+            since (int): The version the client has seen last (0 for all devices).
+            states (dict): The current states (device name -> state) for a resync.
+            epoch (str): The epoch the version belongs to. Optional.
+        """
+        with self._lock:
+            oldest = self._journal[0].version if self._journal else self.version + 1
+            if ((epoch is not None and epoch != self.epoch) or since <= 0 or
+                    since > self.version or since < oldest - 1):
+                return Changes(self.epoch, self.version, True, [
+                    StateChange(device_name, state, self._versions.get(device_name, 0))
+                    for device_name, state in list(states.items())
+                ])
+            latest = {}
+            for change in reversed(self._journal):
+                if change.version <= since:
+                    break
+                latest.setdefault(change.device_name, change)
+            return Changes(self.epoch, self.version, False,
+                           sorted(latest.values(), key=lambda change: change.version))
+
 
 @attr.s
 class MemoryState(DeviceState):
@@ -66,9 +201,33 @@ class MemoryState(DeviceState):
         >>> dut.switch(True, device=Device('device2'))
         >>> dut.lookup(device=Device('device1')), dut.lookup(device_name='device2')
         (False, True)
+
+        The states can be mirrored to a memory-mapped file (see `statefile.StateMirror`)
+
+        >>> import tempfile
+        >>> from rpi433rc.business.statefile import StateMirror, StateReader
+        >>> fn = tempfile.NamedTemporaryFile().name
+        >>> dut = MemoryState()
+        >>> dut.mirror = StateMirror(fn)
+        >>> dut.init_device(Device('device1'))
+        >>> dut.init_done()
+        >>> dut.switch(True, device_name='device1')
+        >>> StateReader(fn).lookup('device1')
+        True
+
+        State changes are versioned (see `StateJournal`)
+
+        >>> [(change.device_name, change.state) for change in dut.changes(since=0).changes]
+        [('device1', True)]
+        >>> dut.remove_device('device1')
+        >>> [(change.device_name, change.state) for change in dut.changes(since=1).changes]
+        [('device1', None)]
     """
 
     states = attr.ib(default=None, repr=True, cmp=False, hash=False, init=False)
+    mirror = attr.ib(default=None, repr=False, cmp=False, hash=False, init=False)
+    journal = attr.ib(default=attr.Factory(StateJournal), repr=False, cmp=False, hash=False,
+                      init=False)
 
     def __attrs_post_init__(self):
         if self.states is None:
@@ -78,31 +237,113 @@ class MemoryState(DeviceState):
         """The registry will call this method to initialize all known devices."""
         self.states[device.device_name] = False
 
+    def init_done(self):
+        """The registry will call this method, when the initialization is done."""
+        if self.mirror is not None:
+            self.mirror.init(self.states)
+
+    def add_device(self, device):
+        """The registry will call this method when a device is added at runtime."""
+        if device.device_name not in self.states:
+            self.states[device.device_name] = False
+            self.journal.record(device.device_name, False)
+        if self.mirror is not None:
+            self.mirror.init(self.states)
+
+    def remove_device(self, device_name):
+        """The registry will call this method when a device is removed at runtime."""
+        if self.states.pop(device_name, None) is not None:
+            self.journal.record(device_name, None)
+        if self.mirror is not None:
+            self.mirror.init(self.states)
+
     @device_validator
     def lookup(self, device=None, device_name=None):
         return self.states.get(device_name, False)
 
     @device_validator
     def switch(self, on_off, device=None, device_name=None):
-        self.logger.debug("Switching %s to %s", str(device_name), str(on_off))
+        self.logger.debug("Switching %s to %s", device_name, on_off)
+        previous = self.states.get(device_name)
         self.states[device_name] = on_off
+        if previous != on_off:  # E.g. our own state published by the broker
+            self.journal.record(device_name, on_off)
+        if self.mirror is not None:
+            self.mirror.switch(device_name, on_off)
+
+    def changes(self, since=0, epoch=None):
+        return self.journal.changes(since, self.states, epoch)
 
 
 @attr.s
 class MQTTState(MemoryState):
-    """MQTT state tracker implementation. Gets and publishes the state to a mqtt broker."""
+    """MQTT state tracker implementation. Gets and publishes the state to a mqtt broker. States
+    are published by an outbox (see `outbox.MQTTOutbox`), so switches do not wait for the
+    broker.
+
+    On startup the retained states are restored before `init_done` returns: They are collected
+    until an end marker arrives (see `MQTTListener.marker_topic`) or `bootstrap_timeout`
+    seconds passed, and are then applied at once. The state topic of each device is built once
+    (or taken from the config snapshot, see `snapshot.Snapshot`)."""
 
     config = attr.ib(validator=attr.validators.instance_of(MQTTConfig))
     topic = attr.ib(validator=attr.validators.instance_of(MQTTTopicConfig))
+    bootstrap_timeout = attr.ib(converter=float, default=10.0)
     state_listener = attr.ib(default=None, repr=False, cmp=False, hash=False, init=False)
+    outbox = attr.ib(default=None, repr=False, cmp=False, hash=False, init=False)
+    topics = attr.ib(default=attr.Factory(dict), repr=False, cmp=False, hash=False, init=False)
+    _retained = attr.ib(default=None, repr=False, cmp=False, hash=False, init=False)
+    _bootstrapped = attr.ib(default=attr.Factory(threading.Event), repr=False, cmp=False,
+                            hash=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, hash=False,
+                    init=False)
+
+    @property
+    def ready(self):
+        """True once the retained states are restored (or the bootstrap timed out)."""
+        return self._bootstrapped.is_set()
 
     def init_done(self):
+        super().init_done()
+        if self.outbox is None:
+            from .outbox import MQTTOutbox
+            self.outbox = MQTTOutbox(MQTTPublisher(self.config))
+        self.outbox.run_async()
+        self._retained = {}
         self.state_listener = MQTTListener(
             config=self.config,
             listen_topic=self.topic.mk_all_states_topic(),
-            message_callback=self._on_state_message
+            message_callback=self._on_state_message,
+            marker_topic=self.topic.mk_marker_topic(uuid.uuid4().hex),
+            marker_callback=self._end_bootstrap
         )
+        started = time.monotonic()
         self.state_listener.run_async()
+        if not self._bootstrapped.wait(self.bootstrap_timeout):
+            self.logger.warning("Retained states did not arrive within %s seconds",
+                                self.bootstrap_timeout)
+            self._end_bootstrap()
+        self.logger.info("Bootstrapped the state of %s devices in %.3f seconds",
+                         len(self.states), time.monotonic() - started)
+
+    def stop(self):
+        """Publishes (or saves) the pending states."""
+        if self.outbox is not None:
+            self.outbox.stop()
+
+    def _end_bootstrap(self):
+        """Applies the collected retained states at once."""
+        with self._lock:
+            if self._retained is None:
+                return  # Marker of a reconnect
+            for device_name, on_off in self._retained.items():
+                if self.states.get(device_name) != on_off:
+                    self.journal.record(device_name, on_off)
+            self.states.update(self._retained)
+            self._retained = None
+            if self.mirror is not None:
+                self.mirror.init(self.states)
+        self._bootstrapped.set()
 
     @safe_call
     def _on_state_message(self, topic, message):
@@ -111,20 +352,24 @@ class MQTTState(MemoryState):
         if device_name is None:
             self.logger.warning("Could not extract device_name from '%s'", topic)
             return
+        with self._lock:
+            if self._retained is not None:  # Bootstrapping
+                self._retained[device_name] = on_off_to_bool(message)
+                return
         super().switch(on_off_to_bool(message), device_name=device_name)
 
     @device_validator
     def switch(self, on_off, device=None, device_name=None):
-        real_topic = self.topic.mk_state_topic(device_name)
+        real_topic = self.topics.get(device_name)
+        if real_topic is None:
+            real_topic = self.topics[device_name] = self.topic.mk_state_topic(device_name)
 
         payload = on_off
         if isinstance(payload, bool):
-            payload = bool_to_on_off(payload)
-
-        try:
-            MQTTPublisher(self.config).publish(payload, real_topic, qos=0)
-        except Exception:  # pylint: disable=broad-except
-            import traceback
-            error = traceback.format_exc()
-            self.logger.error("Error when publishing state '%s' for device '%s' on mqtt:\n"
-                              "%s", on_off, device_name, error)
+            payload = codec.on_off_payload(payload)
+        else:
+            on_off = on_off_to_bool(on_off)
+
+        # Keep the local state right while the broker is unreachable
+        super().switch(on_off, device_name=device_name)
+        self.outbox.publish(payload, real_topic, qos=0)
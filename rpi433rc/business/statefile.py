@@ -0,0 +1,213 @@
+"""Shared-memory mirror of the device states. The states are written to a memory-mapped file
+(e.g. on /dev/shm), so any local process can read them without calling the rest api.
+
+Layout of the file:
+
+    header (64 bytes): magic, version, closed flag, sequence counter, device count, name size
+    index (count * 32 bytes): the device names (utf-8, zero padded)
+    states (count bytes): 1 if the device is on; otherwise 0
+
+Writes are guarded by a sequence lock: The writer increments the sequence counter before and
+after a change (odd while writing). Readers retry if the counter was odd or changed while they
+were reading. They give up after `MAX_RETRIES` (e.g. the writer crashed while writing). When the
+devices change, a new file replaces the old one and the old one is flagged as closed, so readers
+know they have to map the file again.
+
+Devices with names longer than 32 bytes (utf-8) are not mirrored.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+import attr
+
+from .devices import UnknownDeviceError
+from ..util import LogMixin
+
+MAGIC = b'RC433ST\0'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQII')  # magic, version, closed, sequence, count, name size
+HEADER_SIZE = 64
+NAME_SIZE = 32
+MAX_RETRIES = 1000
+_CLOSED = struct.Struct('<I')
+_CLOSED_OFFSET = 12
+_SEQ = struct.Struct('<Q')
+_SEQ_OFFSET = 16
+
+
+class StateFileError(Exception):
+    """Raised when the state file stays inconsistent (its writer crashed while writing)."""
+    pass  # pylint: disable=unnecessary-pass
+
+
+def _layout(device_names, states):
+    """Returns the file content for the given devices (names of up to `NAME_SIZE` bytes) and
+    states."""
+    names = b''.join(name.encode('utf-8').ljust(NAME_SIZE, b'\0') for name in device_names)
+    header = HEADER.pack(MAGIC, VERSION, 0, 0, len(device_names), NAME_SIZE)
+    return (header.ljust(HEADER_SIZE, b'\0') + names +
+            bytes(1 if states.get(name) else 0 for name in device_names))
+
+
+def _map(file_name, access):
+    with open(file_name, 'r+b' if access == mmap.ACCESS_WRITE else 'rb') as fpointer:
+        return mmap.mmap(fpointer.fileno(), 0, access=access)
+
+
+@attr.s
+class StateMirror(LogMixin):
+    """
+    Writes the device states to a memory-mapped file (see module docs for the layout).
+
+    Example:
+
+        >>> import tempfile
+        >>> fn = tempfile.NamedTemporaryFile().name
+        >>> dut = StateMirror(fn)
+        >>> dut.init({'device1': False, 'device2': True})
+        >>> reader = StateReader(fn)
+        >>> reader.lookup('device1'), reader.lookup('device2')
+        (False, True)
+        >>> dut.switch('device1', True)
+        >>> reader.lookup('device1')
+        True
+        >>> dut.init({'device3': True})  # Devices have changed
+        >>> reader.states()
+        {'device3': True}
+        >>> dut.init({'device3': True, 'kitchen_' * 4 + 'lamp': True})  # Name too long
+        >>> reader.states()
+        {'device3': True}
+    """
+    file_name = attr.ib(converter=str)
+    _mmap = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _offsets = attr.ib(default=attr.Factory(dict), repr=False, cmp=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, init=False)
+
+    def init(self, states):
+        """(Re-)creates the file with the given device states (device name -> bool). Devices with
+        names longer than `NAME_SIZE` bytes are left out."""
+        device_names = sorted(name for name in states
+                              if len(name.encode('utf-8')) <= NAME_SIZE)
+        if len(device_names) < len(states):
+            self.logger.warning("Not mirroring devices with names longer than %s bytes: %s",
+                                NAME_SIZE, ', '.join(sorted(set(states) - set(device_names))))
+        tmp_file = self.file_name + '.tmp'
+        with open(tmp_file, 'wb') as fpointer:
+            fpointer.write(_layout(device_names, states))
+        with self._lock:
+            os.replace(tmp_file, self.file_name)
+            if self._mmap is not None:
+                _CLOSED.pack_into(self._mmap, _CLOSED_OFFSET, 1)
+                self._mmap.close()
+            self._mmap = _map(self.file_name, mmap.ACCESS_WRITE)
+            base = HEADER_SIZE + len(device_names) * NAME_SIZE
+            self._offsets = {name: base + i for i, name in enumerate(device_names)}
+        self.logger.info("Mirroring the state of %s devices to %s", len(device_names),
+                         self.file_name)
+
+    def switch(self, device_name, on_off):
+        """Updates the state of a single device. Unknown devices are ignored."""
+        with self._lock:
+            offset = self._offsets.get(device_name)
+            if offset is None:
+                return
+            seq = _SEQ.unpack_from(self._mmap, _SEQ_OFFSET)[0]
+            _SEQ.pack_into(self._mmap, _SEQ_OFFSET, seq + 1)
+            self._mmap[offset] = 1 if on_off else 0
+            _SEQ.pack_into(self._mmap, _SEQ_OFFSET, seq + 2)
+
+    def close(self):
+        """Closes the mirror. The file is left behind for the readers."""
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+
+
+class StateReader:
+    """
+    Reads the device states of a `StateMirror`. After the file is mapped, reads do not need any
+    system call.
+    """
+    def __init__(self, file_name):
+        self.file_name = str(file_name)
+        self._mmap = None
+        self._offsets = {}
+        self._open()
+
+    def _open(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap = _map(self.file_name, mmap.ACCESS_READ)
+        magic, version, _, _, count, name_size = HEADER.unpack_from(self._mmap, 0)
+        if (magic, version) != (MAGIC, VERSION):
+            raise ValueError("'{}' is not a state file".format(self.file_name))
+        base = HEADER_SIZE + count * name_size
+        self._offsets = {}
+        for i in range(count):
+            start = HEADER_SIZE + i * name_size
+            name = self._mmap[start:start + name_size].rstrip(b'\0').decode('utf-8')
+            self._offsets[name] = base + i
+
+    def _offset(self, device_name):
+        offset = self._offsets.get(device_name)
+        if offset is None:
+            raise UnknownDeviceError("The requested device '{}' is unknown".format(device_name))
+        return offset
+
+    def _consistent(self, read):
+        """Calls `read` until no write interfered. Raises a `StateFileError` after
+        `MAX_RETRIES`."""
+        for _ in range(MAX_RETRIES):
+            if _CLOSED.unpack_from(self._mmap, _CLOSED_OFFSET)[0]:
+                self._open()  # Replaced by a new file
+            seq = _SEQ.unpack_from(self._mmap, _SEQ_OFFSET)[0]
+            if seq & 1:
+                time.sleep(0)  # Write in progress: Let the writer finish
+                continue
+            res = read()
+            if _SEQ.unpack_from(self._mmap, _SEQ_OFFSET)[0] == seq:
+                return res
+        raise StateFileError("'{}' is still being written after {} retries"
+                             .format(self.file_name, MAX_RETRIES))
+
+    def lookup(self, device_name):
+        """Returns True if the given device is on; otherwise False."""
+        return self._consistent(lambda: self._mmap[self._offset(device_name)] == 1)
+
+    def states(self):
+        """Returns the states of all devices (device name -> bool) as a consistent snapshot."""
+        return self._consistent(lambda: {name: self._mmap[offset] == 1
+                                         for name, offset in self._offsets.items()})
+
+    def close(self):
+        """Unmaps the file."""
+        self._mmap.close()
+
+
+def main(argv=None):
+    """
+    Command line interface. Prints the state (on / off) of a single device or of all devices.
+
+    Usage: python -m rpi433rc.business.statefile <state_file> [device_name]
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        sys.stderr.write("Usage: python -m rpi433rc.business.statefile <file> [device_name]\n")
+        return 2
+    reader = StateReader(argv[0])
+    if len(argv) > 1:
+        sys.stdout.write("{}\n".format('on' if reader.lookup(argv[1]) else 'off'))
+    else:
+        for device_name, state in sorted(reader.states().items()):
+            sys.stdout.write("{}\t{}\n".format(device_name, 'on' if state else 'off'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Json encoding and decoding. Uses orjson or ujson if installed; otherwise the json module of
+the standard library."""
+
+import json
+
+try:
+    import orjson
+
+    NAME = 'orjson'
+
+    def dumpb(obj):
+        """Encodes the given object to json bytes."""
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)  # pylint: disable=no-member
+
+    loads = orjson.loads  # pylint: disable=invalid-name,no-member
+except ImportError:
+    try:
+        import ujson
+
+        NAME = 'ujson'
+
+        def dumpb(obj):
+            """Encodes the given object to json bytes."""
+            return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+        loads = ujson.loads  # pylint: disable=invalid-name,c-extension-no-member
+    except ImportError:
+        NAME = 'json'
+        _ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+        def dumpb(obj):
+            """Encodes the given object to json bytes."""
+            return _ENCODER.encode(obj).encode('utf-8')
+
+        loads = json.loads  # pylint: disable=invalid-name
+
+
+# Pre-encoded payloads of the device states
+ON = b'on'
+OFF = b'off'
+
+
+def dumps(obj):
+    """
+    Encodes the given object to a json string.
+
+    Example:
+
+        >>> dumps({'state': 'on'})
+        '{"state":"on"}'
+    """
+    return dumpb(obj).decode('utf-8')
+
+
+def load(fpointer):
+    """
+    Decodes the json document of the given file.
+
+    Example:
+
+        >>> import io
+        >>> load(io.StringIO('{"device1": {"code_on": 1}}'))
+        {'device1': {'code_on': 1}}
+    """
+    return loads(fpointer.read())
+
+
+def on_off_payload(on_off):
+    """
+    Returns the pre-encoded payload of the given state.
+
+    Example:
+
+        >>> on_off_payload(True), on_off_payload(False)
+        (b'on', b'off')
+    """
+    return ON if on_off else OFF
+
+
+class Static:  # pylint: disable=too-few-public-methods
+    """
+    Caches the encoded form of payloads that do not change (e.g. the discovery configurations).
+
+    Example:
+
+        >>> dut = Static()
+        >>> dut.encode('device1', {'name': 'device1'})
+        b'{"name":"device1"}'
+        >>> dut.encode('device1', {'name': 'changed'})  # Cached by key
+        b'{"name":"device1"}'
+        >>> dut.discard('device1')  # Changed
+        >>> dut.encode('device1', {'name': 'changed'})
+        b'{"name":"changed"}'
+        >>> Static({'device2': b'{}'}).get('device2')  # Pre-encoded (e.g. by a snapshot)
+        b'{}'
+    """
+    def __init__(self, encoded=None):
+        self._cache = dict(encoded or {})
+
+    def get(self, key):
+        """Returns the encoded object of the given key or None if it is not encoded yet."""
+        return self._cache.get(key)
+
+    def encode(self, key, obj):
+        """Returns the encoded object. The object is encoded only once per key."""
+        res = self._cache.get(key)
+        if res is None:
+            res = dumpb(obj)
+            self._cache[key] = res
+        return res
+
+    def discard(self, key):
+        """Forgets the encoded object of the given key (e.g. the object has changed)."""
+        self._cache.pop(key, None)
@@ -7,11 +7,95 @@ VERSION = '1.1.1'
 
 # General
 CONFIG_DIR = os.environ.get('CONFIG_DIR', os.path.join(os.path.dirname(__file__), '../conf'))
+# The devices (relative to CONFIG_DIR). Files with the extension .jsonl are read as json lines
+DEVICES_FILE = os.environ.get('DEVICES_FILE', 'devices.json')
+# Device store: 'json' reads DEVICES_FILE once. 'sqlite' keeps the devices in SQLITE_FILE (relative
+# to CONFIG_DIR), so they can be added and removed at runtime. An empty database is filled from
+# DEVICES_FILE. STORE_CACHE_SIZE devices are cached in memory. Changes of other processes are seen
+# after STORE_SYNC_INTERVAL seconds
+DEVICE_STORE = os.environ.get('DEVICE_STORE', 'json')
+SQLITE_FILE = os.environ.get('SQLITE_FILE', 'devices.db')
+STORE_CACHE_SIZE = int(os.environ.get('STORE_CACHE_SIZE', 1024))
+STORE_SYNC_INTERVAL = float(os.environ.get('STORE_SYNC_INTERVAL', 1.0))
+# The validated devices of DEVICES_FILE are kept in this snapshot file (relative to CONFIG_DIR).
+# Restarts load the snapshot as long as DEVICES_FILE and the version did not change
+SNAPSHOT_FILE = os.environ.get('SNAPSHOT_FILE', None)
 PORT = 5000  # Do not change OR change the ./run.sh as well
 DEBUG = bool(os.environ.get('DEBUG', False))
 
+# Logging
+LOG_ASYNC = bool(os.environ.get('LOG_ASYNC', False))  # Write log records on a background thread
+LOG_JSON = bool(os.environ.get('LOG_JSON', False))  # Write log records as json lines
+
 # RC433 device
 GPIO_OUT = int(os.environ.get('GPIO_OUT', 17))
+# Multiple transmitters: Comma separated list of <name>:<gpio> (e.g. ground:17,upstairs:27)
+# Overrides GPIO_OUT if set
+RADIOS = os.environ.get('RADIOS', None)
+# Simulate the radios (and the receiver of the learn mode) instead of using the gpio. The value is
+# the time scale: 1 sends at real radio speed, 0.01 a hundred times faster and 0 instantly
+RF_SIMULATOR = os.environ.get('RF_SIMULATOR', None)
+
+# Learn mode
+# A 433mhz receiver on GPIO_IN captures the codes of a remote. Learning a device waits up to
+# LEARN_TIMEOUT seconds for the presses of the on and off button
+GPIO_IN = int(os.environ.get('GPIO_IN', 27))
+LEARN_TIMEOUT = float(os.environ.get('LEARN_TIMEOUT', 30))
+# Custom protocols besides the ones of rpi_rf (1 - 6). Semicolon separated list of
+# <number>=<pulse_length>,<sync_high>,<sync_low>,<zero_high>,<zero_low>,<one_high>,<one_low>
+RF_PROTOCOLS = os.environ.get('RF_PROTOCOLS', None)
+
+# Adaptive resend
+# The repeat count of each device adapts to delivery feedback. Set RESEND_ADAPTIVE to enable it
+RESEND_ADAPTIVE = bool(os.environ.get('RESEND_ADAPTIVE', False))
+RESEND_MIN = int(os.environ.get('RESEND_MIN', 1))
+RESEND_MAX = int(os.environ.get('RESEND_MAX', 10))
+RESEND_CORRECTION_WINDOW = float(os.environ.get('RESEND_CORRECTION_WINDOW', 10.0))
+AIRTIME_BUDGET = int(os.environ.get('AIRTIME_BUDGET', 0))  # Frames per second; 0 = unlimited
+# Listen for the echoes of the own transmissions on the receiver of the learn mode (GPIO_IN).
+# Only echoes confirm a transmission then
+RESEND_ECHO = bool(os.environ.get('RESEND_ECHO', False))
+
+# Rate limiting
+# Requests per second (and burst) per client and source. 0 disables the limit
+RATE_LIMIT_REST = float(os.environ.get('RATE_LIMIT_REST', 0))
+RATE_LIMIT_REST_BURST = int(os.environ.get('RATE_LIMIT_REST_BURST', 10))
+RATE_LIMIT_MQTT = float(os.environ.get('RATE_LIMIT_MQTT', 0))
+RATE_LIMIT_MQTT_BURST = int(os.environ.get('RATE_LIMIT_MQTT_BURST', 10))
+# Weights of the sources when transmissions wait for the radio (e.g. mqtt:2,rest:1)
+FAIR_WEIGHTS = os.environ.get('FAIR_WEIGHTS', 'mqtt:2,rest:1,internal:1')
+
+# Seconds to remember the response of a request with an Idempotency-Key header
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', 300))
+
+# Schedules are persisted in this file (relative to CONFIG_DIR)
+SCHEDULES_FILE = os.environ.get('SCHEDULES_FILE', 'schedules.json')
+
+# Multiple http workers
+# With WORKERS > 1 (or mqtt commands enabled) a single owner process holds the state and the
+# radio. The http workers talk to it via the unix domain socket OWNER_SOCKET
+WORKERS = int(os.environ.get('WORKERS', 1))
+OWNER_SOCKET = os.environ.get('OWNER_SOCKET', '/tmp/rpi433rc.sock')
+
+# State file
+# The device states are mirrored to this memory-mapped file (e.g. /dev/shm/rpi433rc.state), so
+# local processes can read them without calling the api
+STATE_FILE = os.environ.get('STATE_FILE', None)
+
+# State journal
+# The last JOURNAL_SIZE state changes are kept, so clients can fetch the changes since the version
+# they have seen last (GET /state/changes?since=<version>)
+JOURNAL_SIZE = int(os.environ.get('JOURNAL_SIZE', 1024))
+
+# Audit log
+# Every transmission is recorded in a ring buffer file (relative to CONFIG_DIR). Set AUDIT_FILE
+# to enable it. The file takes 64 bytes per record
+AUDIT_FILE = os.environ.get('AUDIT_FILE', None)
+AUDIT_CAPACITY = int(os.environ.get('AUDIT_CAPACITY', 1000000))
+
+# Cluster mode
+# Set CLUSTER_CONFIG to a json file (relative to CONFIG_DIR) that routes devices to remote nodes
+CLUSTER_CONFIG = os.environ.get('CLUSTER_CONFIG', None)
 
 # Authentication
 # Basic Auth is disabled by default. Set the AUTH_USER envvar to enable it
@@ -27,3 +111,12 @@ MQTT_ROOT = os.environ.get('MQTT_ROOT', 'rc433')
 MQTT_STATE_TOPIC = os.environ.get('MQTT_STATE_TOPIC', 'state')
 MQTT_DISCOVERY = bool(os.environ.get('MQTT_DISCOVERY', False))
 MQTT_COMMAND_TOPIC = os.environ.get('MQTT_COMMAND_TOPIC', 'set')
+# Seconds to wait for the retained states on startup before serving requests
+MQTT_BOOTSTRAP_TIMEOUT = float(os.environ.get('MQTT_BOOTSTRAP_TIMEOUT', 10))
+# States are published in the background. After MQTT_BREAKER_THRESHOLD failed attempts no
+# connection is tried for MQTT_BREAKER_RESET seconds. Up to MQTT_OUTBOX_SIZE unpublished states
+# are kept; set MQTT_OUTBOX_FILE (relative to CONFIG_DIR) to keep them across restarts
+MQTT_BREAKER_THRESHOLD = int(os.environ.get('MQTT_BREAKER_THRESHOLD', 3))
+MQTT_BREAKER_RESET = float(os.environ.get('MQTT_BREAKER_RESET', 30))
+MQTT_OUTBOX_SIZE = int(os.environ.get('MQTT_OUTBOX_SIZE', 10000))
+MQTT_OUTBOX_FILE = os.environ.get('MQTT_OUTBOX_FILE', None)
@@ -2,6 +2,7 @@
 
 import functools
 import logging
+import threading
 
 
 def log(entity_type):
@@ -16,58 +17,357 @@ def log(entity_type):
     return wraps
 
 
+class Lazy:
+    """Stand-in of a component that is created on first use. Importing the api does not create
+    components with side effects (e.g. the scheduler and its schedules file) until they are used
+    or the server starts them."""
+    def __init__(self, factory, *args):
+        self._factory = functools.partial(factory, *args)
+        self._component = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the component. Creates it on the first call."""
+        with self._lock:
+            if self._component is None:
+                self._component = self._factory()
+            return self._component
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def mqtt_commands_enabled():
+    """Returns True if devices are switched by mqtt commands (mqtt discovery is configured)"""
+    from .model import make_mqtt_config, make_mqtt_topic_config
+    return make_mqtt_config().is_valid() and make_mqtt_topic_config().supports_commands()
+
+
+def use_owner():
+    """Returns True if the gunicorn master owns the state and the radio: With multiple http
+    workers or if the master switches devices by mqtt commands, too. Then all sources share a
+    single radio queue."""
+    from .config import WORKERS
+    return WORKERS > 1 or mqtt_commands_enabled()
+
+
 @log("store")
 def create_store():
     """Create a device store based on your configuration"""
     import os
-    from .config import CONFIG_DIR
+    from .config import (CONFIG_DIR, DEVICES_FILE, DEVICE_STORE, SQLITE_FILE, STORE_CACHE_SIZE,
+                         STORE_SYNC_INTERVAL)
     from .business.devices import DeviceDict
-    config_file = os.path.join(CONFIG_DIR, 'devices.json')
+    config_file = os.path.join(CONFIG_DIR, DEVICES_FILE)
+    if DEVICE_STORE == 'sqlite':
+        from .business.devicefile import read_devices, format_of
+        from .business.sqlstore import SQLiteStore
+        store = SQLiteStore(os.path.join(CONFIG_DIR, SQLITE_FILE), cache_size=STORE_CACHE_SIZE,
+                            sync_interval=STORE_SYNC_INTERVAL)
+        if len(store) == 0 and os.path.exists(config_file):
+            with open(config_file, 'r', encoding='utf-8') as fpointer:
+                store.add_all(read_devices(fpointer, format_of(config_file)).values())
+        return store
+    snapshot = create_snapshot()
+    if snapshot is not None:
+        return snapshot.store
     store = DeviceDict.from_json(config_file)
     return store
 
 
+@functools.lru_cache(maxsize=None)
+def create_snapshot():
+    """Load (or build) the snapshot of the device file. Returns None if disabled. Created once,
+    so the store, the state and the discovery share it."""
+    import os
+    from .config import CONFIG_DIR, DEVICES_FILE, DEVICE_STORE, MQTT_HOST, SNAPSHOT_FILE
+    if not SNAPSHOT_FILE or DEVICE_STORE == 'sqlite':
+        return None
+    from .business.snapshot import SnapshotFile
+    from .model import make_mqtt_topic_config
+    topic_config = make_mqtt_topic_config() if MQTT_HOST is not None else None
+    return SnapshotFile(os.path.join(CONFIG_DIR, SNAPSHOT_FILE)).devices(
+        os.path.join(CONFIG_DIR, DEVICES_FILE), topic_config)
+
+
 @log("state")
-def create_state():
-    """Create a device state service based on your configuration"""
-    from .config import MQTT_HOST
+def create_state(mirror=False):
+    """Create a device state service based on your configuration. Pass mirror=True to mirror
+    the states to the configured state file (if any)"""
+    from .config import JOURNAL_SIZE, MQTT_HOST, MQTT_BOOTSTRAP_TIMEOUT, STATE_FILE
+    from .business.state import StateJournal
     if MQTT_HOST is not None:
         from .business.state import MQTTState
         from .model import make_mqtt_config, make_mqtt_topic_config
-        return MQTTState(
+        state = MQTTState(
             config=make_mqtt_config(),
-            topic=make_mqtt_topic_config()
+            topic=make_mqtt_topic_config(),
+            bootstrap_timeout=MQTT_BOOTSTRAP_TIMEOUT
         )
-    from .business.state import MemoryState
-    return MemoryState()
+        state.outbox = create_mqtt_outbox(state.config)
+        snapshot = create_snapshot()
+        if snapshot is not None:
+            state.topics.update(snapshot.state_topics)
+    else:
+        from .business.state import MemoryState
+        state = MemoryState()
+    state.journal = StateJournal(size=JOURNAL_SIZE)
+    if mirror and STATE_FILE:
+        from .business.statefile import StateMirror
+        state.mirror = StateMirror(STATE_FILE)
+    return state
+
+
+def create_mqtt_outbox(mqtt_config):
+    """Create the outbox that publishes mqtt messages in the background"""
+    import os
+    from .config import (CONFIG_DIR, MQTT_BREAKER_THRESHOLD, MQTT_BREAKER_RESET,
+                         MQTT_OUTBOX_SIZE, MQTT_OUTBOX_FILE)
+    from .business.outbox import CircuitBreaker, MQTTOutbox
+    from .util import MQTTPublisher
+    return MQTTOutbox(
+        MQTTPublisher(mqtt_config),
+        breaker=CircuitBreaker(threshold=MQTT_BREAKER_THRESHOLD,
+                               reset_timeout=MQTT_BREAKER_RESET),
+        file_name=os.path.join(CONFIG_DIR, MQTT_OUTBOX_FILE) if MQTT_OUTBOX_FILE else None,
+        max_size=MQTT_OUTBOX_SIZE
+    )
 
 
 @log("registry")
-def create_registry():
-    """Create a device registry based on your configuration"""
+def create_registry(mirror=False):
+    """Create a device registry based on your configuration. Pass mirror=True to mirror the
+    states to the configured state file (if any)"""
     from .business.registry import DeviceRegistry
     device_store = create_store()
-    device_state = create_state()
+    device_state = create_state(mirror)
     rc433 = create_rc433()
     return DeviceRegistry(device_store, device_state, rc433)
 
 
+@log("rate_limiter")
+def create_rate_limiter():
+    """Create a rate limiter based on your configuration"""
+    from .config import (RATE_LIMIT_REST, RATE_LIMIT_REST_BURST, RATE_LIMIT_MQTT,
+                         RATE_LIMIT_MQTT_BURST)
+    from .business.ratelimit import RateLimiter
+    limits = {}
+    if RATE_LIMIT_REST > 0:
+        limits['rest'] = (RATE_LIMIT_REST, RATE_LIMIT_REST_BURST)
+    if RATE_LIMIT_MQTT > 0:
+        limits['mqtt'] = (RATE_LIMIT_MQTT, RATE_LIMIT_MQTT_BURST)
+    return RateLimiter(limits)
+
+
+def create_idempotency_cache():
+    """Create the cache of the results of requests with an idempotency key"""
+    from .config import IDEMPOTENCY_TTL
+    from .business.idempotency import IdempotencyCache
+    return IdempotencyCache(ttl=IDEMPOTENCY_TTL)
+
+
+@log("cluster")
+def create_cluster():
+    """Create the device registry of the api. If cluster mode is configured, devices of remote
+    nodes are forwarded to them."""
+    import os
+    from .config import CLUSTER_CONFIG, CONFIG_DIR
+    registry = create_registry(mirror=True)
+    if not CLUSTER_CONFIG:
+        return registry
+    from .business.cluster import ClusterRegistry
+    return ClusterRegistry.from_json(registry, os.path.join(CONFIG_DIR, CLUSTER_CONFIG))
+
+
 @log("rc433")
 def create_rc433():
     """Create a 433mhz controller based on your configuration"""
-    from .config import GPIO_OUT
-    from .business.rc433 import RC433
-    return RC433(gpio_out=GPIO_OUT)
+    from .config import GPIO_OUT, RADIOS, FAIR_WEIGHTS, RF_SIMULATOR
+    from .business.rc433 import RC433, RadioPool
+    weights = {}
+    for weight in FAIR_WEIGHTS.split(','):
+        source, value = weight.split(':')
+        weights[source.strip()] = float(value)
+    audit_log = create_audit_log()
+    rf_factory = None
+    if RF_SIMULATOR:
+        from .business.simulator import SimulatedRFDevice
+        rf_factory = functools.partial(SimulatedRFDevice, medium=create_rf_medium(),
+                                       realtime=float(RF_SIMULATOR))
+    if RADIOS:
+        radios = {}
+        for radio in RADIOS.split(','):
+            name, gpio_out = radio.split(':')
+            radios[name.strip()] = RC433(gpio_out=gpio_out, weights=weights,
+                                         audit_log=audit_log, rf_factory=rf_factory)
+        return RadioPool(radios, resend_policy=create_resend_policy(), audit_log=audit_log)
+    return RC433(gpio_out=GPIO_OUT, resend_policy=create_resend_policy(), weights=weights,
+                 audit_log=audit_log, rf_factory=rf_factory)
+
+
+@functools.lru_cache(maxsize=None)
+def create_rf_medium():
+    """Create the simulated band that is shared by all simulated radios and receivers of the
+    process (the owner process serves rest, mqtt and the learn mode, see `use_owner`). Its clock
+    follows the time scale of the simulator; with scale 0 it advances by the airtime of each
+    code"""
+    from .config import RF_SIMULATOR
+    from .business.simulator import RFMedium
+    scale = float(RF_SIMULATOR)
+    medium = RFMedium(instant=not scale)
+    if scale:
+        medium.run_async(scale=scale)
+    logging.info("Simulating the radio (time scale %s)", RF_SIMULATOR)
+    return medium
+
+
+def create_audit_log():
+    """Create the transmission audit log based on your configuration. Returns None if disabled."""
+    import os
+    from .config import CONFIG_DIR, AUDIT_FILE, AUDIT_CAPACITY
+    if not AUDIT_FILE:
+        return None
+    from .business.audit import AuditLog
+    return AuditLog(os.path.join(CONFIG_DIR, AUDIT_FILE), capacity=AUDIT_CAPACITY)
+
+
+def create_resend_policy():
+    """Create a resend policy based on your configuration. Returns None if disabled."""
+    from .config import (RESEND_ADAPTIVE, RESEND_MIN, RESEND_MAX, RESEND_CORRECTION_WINDOW,
+                         RESEND_ECHO, AIRTIME_BUDGET)
+    if not RESEND_ADAPTIVE:
+        return None
+    from .business.resend import AdaptiveResend
+    return AdaptiveResend(
+        min_times=RESEND_MIN,
+        max_times=RESEND_MAX,
+        correction_window=RESEND_CORRECTION_WINDOW,
+        airtime_budget=AIRTIME_BUDGET or None,
+        echo_required=RESEND_ECHO
+    )
+
+
+@log("scheduler")
+def create_scheduler(registry):
+    """Create and start a scheduler that switches the devices of the given registry"""
+    import os
+    from .config import CONFIG_DIR, SCHEDULES_FILE
+    from .business.scheduler import Scheduler
+    from .model import make_mqtt_config, make_mqtt_topic_config
+    scheduler = Scheduler(registry, file_name=os.path.join(CONFIG_DIR, SCHEDULES_FILE))
+    scheduler.run_async()
+
+    mqtt_config = make_mqtt_config()
+    topic_config = make_mqtt_topic_config()
+    if mqtt_config.is_valid() and topic_config.supports_commands():
+        from .util import MQTTListener
+
+        def _on_message(topic, message):
+            device_name = topic_config.extract_device_from_topic(topic, pattern='schedule')
+            if device_name:
+                scheduler.on_mqtt_message(device_name, message)
+
+        MQTTListener(
+            config=mqtt_config,
+            listen_topic=topic_config.mk_schedule_topic('+'),
+            message_callback=_on_message
+        ).run_async()
+    return scheduler
+
+
+@log("learner")
+def create_learner(registry):
+    """Create the learn mode of the given registry. Learning can be started by mqtt as well if
+    commands are supported. Its receiver passes the echoes of the own transmissions to the
+    resend policy if configured"""
+    from .config import GPIO_IN, LEARN_TIMEOUT, RESEND_ECHO, RF_PROTOCOLS, RF_SIMULATOR
+    from .business.learn import EdgeReceiver, LearnError, Learner, decode
+    from .business.protocols import known_protocols, parse_protocols
+    from .model import make_mqtt_config, make_mqtt_topic_config
+    protocols = known_protocols(parse_protocols(RF_PROTOCOLS))
+    try:
+        from .business.decoder import DecoderBank
+        decoder = DecoderBank(protocols).decode
+    except ImportError:  # No numpy
+        decoder = functools.partial(decode, protocols=protocols)
+    if RF_SIMULATOR:
+        from .business.simulator import SimulatedReceiver
+        receiver = SimulatedReceiver(create_rf_medium())
+    else:
+        receiver = EdgeReceiver(GPIO_IN)
+    learner = Learner(registry, receiver, timeout=LEARN_TIMEOUT, decoder=decoder)
+    resend_policy = getattr(registry.rc433, 'resend_policy', None)
+    if RESEND_ECHO and resend_policy is not None:
+        from .business.resend import EchoFeedback
+        store = getattr(registry, 'local', registry).device_store
+        try:
+            learner.listen(EchoFeedback(store, resend_policy))
+        except LearnError as exc:
+            logging.warning("Not listening for echoes: %s", exc)
+
+    mqtt_config = make_mqtt_config()
+    topic_config = make_mqtt_topic_config()
+    if mqtt_config.is_valid() and topic_config.supports_commands():
+        from .util import MQTTListener
+
+        def _on_message(topic, message):  # pylint: disable=unused-argument
+            device_name = topic_config.extract_device_from_topic(topic, pattern='learn')
+            if not device_name:
+                return
+            try:
+                learner.start(device_name)
+            except LearnError as exc:
+                logging.warning("Learning %s failed: %s", device_name, exc)
+
+        MQTTListener(
+            config=mqtt_config,
+            listen_topic=topic_config.mk_learn_topic('+'),
+            message_callback=_on_message
+        ).run_async()
+    return learner
 
 
 @log("mqtt_discovery")
-def create_mqtt_discovery():
-    """Create a mqtt discovery component based on your configuration"""
+def create_mqtt_discovery(registry=None):
+    """Create a mqtt discovery component based on your configuration. Pass a registry to
+    share it with the api; otherwise a new one is created."""
     from .model import make_mqtt_config, make_mqtt_topic_config
     mqtt_config = make_mqtt_config()
     topic_config = make_mqtt_topic_config()
     if not mqtt_config.is_valid() or not topic_config.supports_commands():
         return None  # Disable mqtt discovery
     from .business.discovery import MQTTDiscovery
-    registry = create_registry()
-    return MQTTDiscovery(mqtt_config=mqtt_config, topic_config=topic_config, registry=registry)
+    from .codec import Static
+    snapshot = create_snapshot()
+    return MQTTDiscovery(mqtt_config=mqtt_config, topic_config=topic_config,
+                         registry=registry or create_registry(),
+                         rate_limiter=create_rate_limiter(),
+                         configs=Static(snapshot.configs if snapshot is not None else None))
+
+
+@log("owner")
+def create_owner():
+    """Create the owner process components (registry, radio, scheduler) and serve them to the
+    http workers"""
+    from .config import OWNER_SOCKET
+    from .business.owner import RegistryServer
+    registry = create_cluster()
+    registry.start()
+    server = RegistryServer(registry, OWNER_SOCKET, scheduler=create_scheduler(registry),
+                            rate_limiter=create_rate_limiter(),
+                            idempotency_cache=create_idempotency_cache(),
+                            learner=create_learner(registry))
+    server.run_async()
+    return server
+
+
+@log("owner_client")
+def create_owner_client():
+    """Create the stand-in for the registry of the owner process (used by the http workers). With
+    a state file the workers read the devices and their states on their own (unless remote
+    cluster nodes have to be asked)"""
+    from .config import CLUSTER_CONFIG, OWNER_SOCKET, STATE_FILE
+    from .business.owner import RegistryClient
+    if STATE_FILE and not CLUSTER_CONFIG:
+        return RegistryClient(OWNER_SOCKET, store=create_store(), state_file=STATE_FILE)
+    return RegistryClient(OWNER_SOCKET)
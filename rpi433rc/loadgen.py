@@ -0,0 +1,460 @@
+"""Load generator for a running instance. Drives the rest endpoints (switch, list, send) and the
+mqtt command topics with a configurable number of concurrent clients and reports latency
+percentiles, throughput and error rates. Reports are json files that can be compared across
+versions.
+
+    python -m rpi433rc.loadgen http://raspi:5000 --devices device1,device2 --concurrency 4
+    python -m rpi433rc.loadgen http://raspi:5000 --devices device1 --ramp --slo 200
+"""
+
+import argparse
+import base64
+import http.client
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import attr
+
+from .config import VERSION
+from .util import LogMixin
+
+OP_SWITCH = 'switch'
+OP_LIST = 'list'
+OP_SEND = 'send'
+OP_MQTT = 'mqtt'
+OPERATIONS = (OP_SWITCH, OP_LIST, OP_SEND, OP_MQTT)
+
+
+def percentile(values, fraction):
+    """
+    Returns the percentile of the given sorted values (nearest rank).
+
+    Example:
+
+        >>> percentile(list(range(1, 101)), 0.99), percentile([5.0], 0.5), percentile([], 0.5)
+        (99, 5.0, None)
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+@attr.s
+class Stats:
+    """
+    Collects the latencies (seconds) and errors of an operation.
+
+    Example:
+
+        >>> dut = Stats()
+        >>> for latency in (0.010, 0.020, 0.030, 0.040):
+        ...     dut.record(latency)
+        >>> dut.record(0.5, error='HTTP 503')
+        >>> summary = dut.summary(elapsed=2.0)
+        >>> summary['count'], summary['throughput'], summary['error_rate'], summary['p50']
+        (5, 2.5, 0.2, 20.0)
+        >>> summary['errors']
+        {'HTTP 503': 1}
+    """
+    latencies = attr.ib(default=attr.Factory(list), repr=False)
+    errors = attr.ib(default=attr.Factory(dict))
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, init=False)
+
+    def record(self, latency, error=None):
+        """Records a request. Failed requests count as errors."""
+        with self._lock:
+            if error is None:
+                self.latencies.append(latency)
+            else:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+    def summary(self, elapsed):
+        """Returns the throughput (requests per second) and latency percentiles (ms)."""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            errors = dict(self.errors)
+        failed = sum(errors.values())
+        count = len(latencies) + failed
+
+        def _ms(value):
+            return None if value is None else round(value * 1000, 3)
+
+        return {
+            'count': count,
+            'throughput': round(count / elapsed, 3) if elapsed > 0 else None,
+            'error_rate': round(failed / count, 4) if count else 0.0,
+            'errors': errors,
+            'mean': _ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': _ms(percentile(latencies, 0.50)),
+            'p90': _ms(percentile(latencies, 0.90)),
+            'p99': _ms(percentile(latencies, 0.99)),
+            'max': _ms(latencies[-1] if latencies else None),
+        }
+
+
+@attr.s
+class HttpDriver:
+    """Sends GET requests. With keep-alive every client thread reuses its own connection."""
+    base_url = attr.ib(converter=str)
+    user = attr.ib(default=None)
+    password = attr.ib(default=None)
+    keep_alive = attr.ib(converter=bool, default=True)
+    timeout = attr.ib(converter=float, default=10.0)
+    _local = attr.ib(default=attr.Factory(threading.local), repr=False, cmp=False, init=False)
+    _headers = attr.ib(default=None, repr=False, cmp=False, init=False)
+
+    def __attrs_post_init__(self):
+        self._headers = {'Accept': 'application/json'}
+        if self.user:
+            token = '{}:{}'.format(self.user, self.password or '').encode('utf-8')
+            self._headers['Authorization'] = 'Basic ' + base64.b64encode(token).decode('ascii')
+        if not self.keep_alive:
+            self._headers['Connection'] = 'close'
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            url = urlparse(self.base_url)
+            factory = (http.client.HTTPSConnection if url.scheme == 'https'
+                       else http.client.HTTPConnection)
+            conn = factory(url.hostname, url.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def get(self, path):
+        """Sends a request. Returns the status code; raises on connection errors."""
+        conn = self._connection()
+        try:
+            conn.request('GET', urlparse(self.base_url).path.rstrip('/') + path,
+                         headers=self._headers)
+            response = conn.getresponse()
+            response.read()
+        except Exception:
+            conn.close()
+            self._local.conn = None
+            raise
+        if not self.keep_alive or response.getheader('Connection', '').lower() == 'close':
+            conn.close()
+            self._local.conn = None
+        return response.status
+
+    def close(self):
+        """Closes the connection of the calling thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+@attr.s
+class MQTTDriver(LogMixin):
+    """
+    Switches devices by their mqtt command topic. A switch is complete when the new state of
+    the device is published on its state topic (round trip through the service).
+    """
+    config = attr.ib()
+    topic_config = attr.ib()
+    timeout = attr.ib(converter=float, default=10.0)
+    _client = attr.ib(default=None, repr=False, cmp=False, init=False)
+    _waiting = attr.ib(default=attr.Factory(dict), repr=False, cmp=False, init=False)
+    _lock = attr.ib(default=attr.Factory(threading.Lock), repr=False, cmp=False, init=False)
+
+    def connect(self):
+        """Connects to the broker and subscribes to the state topics."""
+        import paho.mqtt.client as paho
+        self._client = paho.Client()
+        self._client.on_message = self._on_message
+        self._client.connect(self.config.host, self.config.port)
+        self._client.subscribe(self.topic_config.mk_all_states_topic())
+        self._client.loop_start()
+
+    def _on_message(self, client, userdata, message):  # pylint: disable=unused-argument
+        device_name = self.topic_config.extract_device_from_topic(message.topic)
+        with self._lock:
+            waiting = self._waiting.get(device_name)
+        if waiting is not None and message.payload.decode('utf-8').lower() == waiting[0]:
+            waiting[1].set()
+
+    def switch(self, device_name, on_off):
+        """Publishes the command and waits for the state. Raises on timeout."""
+        done = threading.Event()
+        with self._lock:
+            if device_name in self._waiting:
+                raise RuntimeError("A switch of '{}' is pending".format(device_name))
+            self._waiting[device_name] = (on_off, done)
+        try:
+            self._client.publish(self.topic_config.mk_command_topic(device_name), on_off)
+            if not done.wait(self.timeout):
+                raise TimeoutError("No state of '{}' within {}s".format(device_name,
+                                                                         self.timeout))
+        finally:
+            with self._lock:
+                self._waiting.pop(device_name, None)
+
+    def close(self):
+        """Disconnects from the broker."""
+        if self._client is not None:
+            self._client.loop_stop()
+            self._client.disconnect()
+
+
+def parse_mix(spec):
+    """
+    Parses the operation mix: Comma separated <operation>:<weight>.
+
+    Example:
+
+        >>> parse_mix('switch:8,list:1,send:1')
+        [('switch', 8.0), ('list', 1.0), ('send', 1.0)]
+        >>> parse_mix('ping:1')
+        Traceback (most recent call last):
+        ...
+        ValueError: Unknown operation 'ping' (switch, list, send, mqtt)
+    """
+    res = []
+    for item in spec.split(','):
+        name, weight = item.split(':') if ':' in item else (item, 1)
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError("Unknown operation '{}' ({})".format(name, ', '.join(OPERATIONS)))
+        res.append((name, float(weight)))
+    return res
+
+
+@attr.s
+class LoadGenerator(LogMixin):
+    """
+    Runs the operation mix with `concurrency` client threads (closed loop: each client sends
+    its next request when the previous one is done) for `duration` seconds or until `requests`
+    requests are sent. Devices are toggled on and off, so every switch changes the state.
+    """
+    http = attr.ib()
+    devices = attr.ib(converter=list)
+    mix = attr.ib(converter=list)
+    mqtt = attr.ib(default=None)
+    codes = attr.ib(default=(12345,), converter=list)
+    seed = attr.ib(converter=int, default=433)
+
+    def _operation(self, name, device_name, on_off, code):
+        if name == OP_SWITCH:
+            return self.http.get('/devices/{}/{}'.format(device_name, on_off))
+        if name == OP_LIST:
+            return self.http.get('/devices/list')
+        if name == OP_SEND:
+            return self.http.get('/send/{}'.format(code))
+        self.mqtt.switch(device_name, on_off)
+        return 200
+
+    def _client(self, index, concurrency, stats, deadline, take):
+        rand = random.Random(self.seed + index)
+        names = [name for name, _ in self.mix]
+        weights = [weight for _, weight in self.mix]
+        # Devices are split among the clients, so no device is switched concurrently
+        devices = self.devices[index::concurrency] or self.devices
+        states = {device_name: False for device_name in devices}
+        for device_name in itertools.cycle(devices):
+            if time.monotonic() >= deadline or not take():
+                return
+            name = rand.choices(names, weights)[0]
+            if name in (OP_SWITCH, OP_MQTT):
+                states[device_name] = not states[device_name]
+            started = time.perf_counter()
+            try:
+                status = self._operation(name, device_name,
+                                         'on' if states[device_name] else 'off',
+                                         rand.choice(self.codes))
+                error = None if 200 <= status < 300 else 'HTTP {}'.format(status)
+            except Exception as exc:  # pylint: disable=broad-except
+                error = type(exc).__name__
+            stats[name].record(time.perf_counter() - started, error)
+
+    def run(self, concurrency=1, duration=10.0, requests=None):
+        """Runs the load. Returns the summary of each operation and of all of them."""
+        stats = {name: Stats() for name, _ in self.mix}
+        counter = itertools.count() if requests is None else iter(range(requests))
+        lock = threading.Lock()
+
+        def _take():
+            with lock:
+                return next(counter, None) is not None
+
+        deadline = time.monotonic() + duration if duration else float('inf')
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._client,
+                                    args=(i, concurrency, stats, deadline, _take),
+                                    name='loadgen-{}'.format(i))
+                   for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        total = Stats()
+        for stat in stats.values():
+            total.latencies.extend(stat.latencies)
+            for error, count in stat.errors.items():
+                total.errors[error] = total.errors.get(error, 0) + count
+        return {
+            'concurrency': concurrency,
+            'elapsed': round(elapsed, 3),
+            'operations': {name: stat.summary(elapsed) for name, stat in stats.items()},
+            'total': total.summary(elapsed),
+        }
+
+
+def ramp(generator, slo, max_concurrency=64, duration=10.0, max_error_rate=0.01):
+    """
+    Doubles the concurrency until the p99 latency exceeds `slo` (ms) or too many requests fail.
+    Returns the steps and the best throughput within the slo.
+    """
+    steps = []
+    sustainable = None
+    concurrency = 1
+    while concurrency <= max_concurrency:
+        step = generator.run(concurrency=concurrency, duration=duration)
+        steps.append(step)
+        total = step['total']
+        within = (total['p99'] is not None and total['p99'] <= slo and
+                  total['error_rate'] <= max_error_rate)
+        if not within:
+            break
+        sustainable = step
+        concurrency *= 2
+    return {
+        'steps': steps,
+        'slo': slo,
+        'sustainable': None if sustainable is None else {
+            'concurrency': sustainable['concurrency'],
+            'throughput': sustainable['total']['throughput'],
+            'p99': sustainable['total']['p99'],
+        }
+    }
+
+
+_COMPARED = (('throughput', 1), ('p50', -1), ('p99', -1), ('error_rate', -1))
+
+
+def compare(report, baseline):
+    """
+    Returns the relative change of throughput, latencies and error rate per operation. Positive
+    values are improvements.
+
+    Example:
+
+        >>> old = {'operations': {'switch': {'throughput': 10.0, 'p50': 20.0, 'p99': 50.0,
+        ...                                  'error_rate': 0.0}}}
+        >>> new = {'operations': {'switch': {'throughput': 12.0, 'p50': 25.0, 'p99': 50.0,
+        ...                                  'error_rate': 0.0}}}
+        >>> compare(new, old)
+        {'switch': {'throughput': 0.2, 'p50': -0.25, 'p99': 0.0, 'error_rate': 0.0}}
+    """
+    res = {}
+    for name, summary in report['operations'].items():
+        before = baseline.get('operations', {}).get(name)
+        if before is None:
+            continue
+        res[name] = {}
+        for key, direction in _COMPARED:
+            old, new = before.get(key), summary.get(key)
+            if old is None or new is None:
+                res[name][key] = None
+            elif old == 0:
+                res[name][key] = 0.0 if new == 0 else -direction * 1.0
+            else:
+                res[name][key] = round(direction * (new - old) / old, 4) + 0.0  # No -0.0
+    return res
+
+
+def _print_summary(out, result):
+    out.write("{:<8} {:>8} {:>10} {:>8} {:>9} {:>9} {:>9} {:>9}\n".format(
+        'op', 'count', 'req/s', 'errors', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    rows = sorted(result['operations'].items()) + [('total', result['total'])]
+    for name, summary in rows:
+        cells = [summary[key] for key in ('count', 'throughput')]
+        cells.append('{:.2%}'.format(summary['error_rate']))
+        cells.extend(summary[key] for key in ('p50', 'p90', 'p99', 'max'))
+        out.write("{:<8} {:>8} {:>10} {:>8} {:>9} {:>9} {:>9} {:>9}\n".format(
+            name, *('-' if cell is None else str(cell) for cell in cells)))
+
+
+def main(argv=None, out=sys.stdout):
+    """Command line interface of the load generator."""
+    parser = argparse.ArgumentParser(description='Generate load against a running instance.')
+    parser.add_argument('url', help='Base url of the instance (e.g. http://raspi:5000)')
+    parser.add_argument('--devices', required=True, help='Comma separated device names')
+    parser.add_argument('--mix', default='switch:8,list:1,send:1',
+                        help='Operations and weights: switch, list, send and mqtt')
+    parser.add_argument('--codes', default='12345', help='Comma separated codes for send')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=None,
+                        help='Seconds (per step; default 10 unless --requests is given)')
+    parser.add_argument('--requests', type=int, default=None, help='Stop after n requests')
+    parser.add_argument('--no-keep-alive', action='store_true', help='New connection per request')
+    parser.add_argument('--user', default=None, help='Basic auth user')
+    parser.add_argument('--password', default=None, help='Basic auth password')
+    parser.add_argument('--mqtt-host', default=None, help='Broker for the mqtt operation')
+    parser.add_argument('--mqtt-port', type=int, default=1883)
+    parser.add_argument('--mqtt-root', default='rc433', help='Root topic of the instance')
+    parser.add_argument('--ramp', action='store_true',
+                        help='Double the concurrency until the p99 latency exceeds --slo')
+    parser.add_argument('--slo', type=float, default=200.0, help='p99 latency limit in ms')
+    parser.add_argument('--report', default=None, help='Write the json report to this file')
+    parser.add_argument('--compare', default=None, help='Compare with this json report')
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    mqtt = None
+    if any(name == OP_MQTT for name, _ in mix):
+        if not args.mqtt_host:
+            parser.error("The mqtt operation needs --mqtt-host")
+        from .model import MQTTConfig, MQTTTopicConfig
+        mqtt = MQTTDriver(MQTTConfig(host=args.mqtt_host, port=args.mqtt_port),
+                          MQTTTopicConfig(discovery=True, root_topic=args.mqtt_root,
+                                          command_topic='set'))
+        mqtt.connect()
+    generator = LoadGenerator(
+        HttpDriver(args.url, user=args.user, password=args.password,
+                   keep_alive=not args.no_keep_alive),
+        devices=[name.strip() for name in args.devices.split(',')], mix=mix, mqtt=mqtt,
+        codes=[int(code) for code in args.codes.split(',')]
+    )
+    report = {'version': VERSION, 'url': args.url, 'started': time.time(), 'mix': args.mix,
+              'keep_alive': not args.no_keep_alive}
+    try:
+        if args.ramp:
+            report.update(ramp(generator, args.slo, duration=args.duration or 10.0))
+            for step in report['steps']:
+                out.write("concurrency {}\n".format(step['concurrency']))
+                _print_summary(out, step)
+            out.write("sustainable within {}ms: {}\n".format(args.slo, report['sustainable']))
+        else:
+            duration = args.duration or (None if args.requests else 10.0)
+            report.update(generator.run(args.concurrency, duration, args.requests))
+            _print_summary(out, report)
+    finally:
+        if mqtt is not None:
+            mqtt.close()
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as fpointer:
+            baseline = json.load(fpointer)
+        last = report['steps'][-1] if args.ramp else report
+        base = baseline['steps'][-1] if 'steps' in baseline else baseline
+        out.write("compared with {} ({}):\n".format(args.compare, baseline.get('version')))
+        for name, changes in sorted(compare(last, base).items()):
+            out.write("{:<8} {}\n".format(name, ' '.join(
+                '{} {:+.1%}'.format(key, value) for key, value in changes.items()
+                if value is not None)))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as fpointer:
+            json.dump(report, fpointer, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
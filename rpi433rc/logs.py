@@ -0,0 +1,111 @@
+"""Logging setup. Optionally structured (json) and asynchronous, so writing log records to
+stdout or disk never blocks the switch path."""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+from . import codec
+
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as json lines.
+
+    Example:
+
+        >>> record = logging.LogRecord('RC433', logging.INFO, __file__, 1, "Sent %s", (12345,),
+        ...                            None)
+        >>> record.created = 0
+        >>> JsonFormatter().format(record)
+        '{"time":0,"logger":"RC433","level":"INFO","message":"Sent 12345"}'
+    """
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'logger': record.name,
+            'level': record.levelname,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return codec.dumps(entry)
+
+
+class AsyncHandler(logging.handlers.QueueHandler):
+    """
+    Hands log records over to a queue. A background thread formats them and passes them to the
+    actual handler. The background thread is (re-)started lazily in each process, so it
+    survives forking (e.g. gunicorn workers). Call `stop` before the process exits by
+    `os._exit` (like gunicorn workers do); `atexit` handlers do not run then.
+    """
+    def __init__(self, handler):
+        super().__init__(queue.Queue(-1))
+        self.handler = handler
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(-1)
+            self._listener = logging.handlers.QueueListener(self.queue, self.handler,
+                                                            respect_handler_level=True)
+            self._listener.start()
+            atexit.register(self.stop)
+            self._pid = os.getpid()
+
+    def stop(self):
+        """Writes the queued records and stops the background thread of this process."""
+        with self._start_lock:
+            if self._pid != os.getpid():
+                return  # Not started in this process (or stopped already)
+            self._listener.stop()
+            self._pid = None
+
+    def prepare(self, record):
+        # The queue does not leave the process: The record is formatted by the background
+        # thread, not by the caller (the base class merges the message and drops exc_info)
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super().enqueue(record)
+
+
+def stop_logging():
+    """Flushes and stops the asynchronous handlers of the root logger (if any)."""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, AsyncHandler):
+            handler.stop()
+
+
+def setup_logging(level=logging.INFO, structured=False, async_mode=False):
+    """
+    Configures the root logger.
+
+    Args:
+        level: The log level.
+        structured (bool): If True records are written as json lines.
+        async_mode (bool): If True records are handed over to a queue. A background thread
+            writes them to stdout.
+
+    Returns:
+        None.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if structured else logging.Formatter(FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    if async_mode:
+        handler = AsyncHandler(handler)
+    root.addHandler(handler)
@@ -59,6 +59,10 @@ class MQTTTopicConfig:
         """Returns a pattern to listen on all state topics (for all devices)."""
         return self.mk_state_topic('+')
 
+    def mk_marker_topic(self, token):
+        """Returns the topic to mark the end of the retained states of a single subscriber."""
+        return os.path.join(self._root(), "bootstrap", token)
+
     def supports_commands(self):
         """Returns True if the topic configuration supports command topics, too."""
         return self.discovery and self.command_topic is not None
@@ -75,16 +79,56 @@ class MQTTTopicConfig:
         """Returns a pattern to listen on all command topics (for all devices)."""
         return self.mk_command_topic('+')
 
+    def mk_schedule_topic(self, device_name):
+        """Returns the topic to schedule switches of the given device."""
+        if not self.supports_commands():
+            raise TypeError("No command topic is configured")
+        root = self._root()
+        topic = os.path.join(root, "{device_name}", "schedule")
+        return topic.format(device_name=device_name)
+
+    def mk_learn_topic(self, device_name):
+        """Returns the topic to start learning the codes of the given device."""
+        if not self.supports_commands():
+            raise TypeError("No command topic is configured")
+        root = self._root()
+        topic = os.path.join(root, "{device_name}", "learn")
+        return topic.format(device_name=device_name)
+
     def mk_config_topic(self, device_name):
         """Returns the configuration topic for the given device."""
         root = self._root()
         topic = os.path.join(root, "{device_name}", "config")
         return topic.format(device_name=device_name)
 
+    def mk_discovery_config(self, device_name):
+        """
+        Returns the mqtt discovery configuration of the given device.
+
+        Example:
+
+            >>> dut = MQTTTopicConfig(discovery=True, command_topic='set')
+            >>> dut.mk_discovery_config('device1')['command_topic']
+            'rc433/switch/device1/set'
+        """
+        return {
+            'command_topic': self.mk_command_topic(device_name),
+            'state_topic': self.mk_state_topic(device_name),
+            'name': device_name,
+            'state_on': 'on',
+            'state_off': 'off',
+            'payload_on': 'on',
+            'payload_off': 'off'
+        }
+
     def extract_device_from_topic(self, topic, pattern='state'):
         """Extracts the device name from a given topic string."""
         if pattern == 'command':
             pattern = self.mk_command_topic(r'(\w+)')  # Replace device_name by pattern to extract
+        elif pattern == 'schedule':
+            pattern = self.mk_schedule_topic(r'(\w+)')
+        elif pattern == 'learn':
+            pattern = self.mk_learn_topic(r'(\w+)')
         else:
             pattern = self.mk_state_topic(r'(\w+)')  # Replace device_name by pattern to extract
         match = re.match(pattern, topic)
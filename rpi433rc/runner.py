@@ -1,21 +1,30 @@
 """Main entrypoint to run the webserver and the mqtt discovery component."""
 
 import logging
+import sys
 
 from gunicorn.app.base import Application
 
-from rpi433rc.config import DEBUG
-from rpi433rc.factories import create_mqtt_discovery
+from rpi433rc.config import DEBUG, LOG_ASYNC, LOG_JSON
+from rpi433rc.factories import Lazy, create_mqtt_discovery, create_owner, use_owner
+from rpi433rc.logs import setup_logging, stop_logging
 
 
 LEVEL = logging.DEBUG if DEBUG else logging.INFO
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=LEVEL)
+setup_logging(level=LEVEL, structured=LOG_JSON, async_mode=LOG_ASYNC)
 
 
-def run_discovery(async_mode=False):
+# Registries owned by this (master) process. Their radios are released on exit
+REGISTRIES = []
+
+
+def run_discovery(async_mode=False, registry=None):
     """Runs the discovery component. Whether threaded (async) or non-threaded (sync and blocking)"""
-    discovery = create_mqtt_discovery()
+    discovery = create_mqtt_discovery(registry)
     if discovery:
+        if registry is None:
+            discovery.registry.start()
+            REGISTRIES.append(discovery.registry)
         discovery.run(async_mode)
     else:
         logging.warning("MQTT Discovery mode disabled."
@@ -23,15 +32,34 @@ def run_discovery(async_mode=False):
                         " AND `MQTT_HOST=<mqtt_host>`")
 
 
+def _worker_exit(server, worker):  # pylint: disable=unused-argument
+    """Gunicorn hook: Releases the radio of a http worker."""
+    api = sys.modules.get('rpi433rc.api')
+    stop = getattr(getattr(api, 'device_db', None), 'stop', None)
+    if stop is not None:  # Workers of an owner process do not have a radio
+        stop()
+    stop_logging()  # The worker exits by os._exit: atexit handlers do not run
+
+
+def _on_exit(server):  # pylint: disable=unused-argument
+    """Gunicorn hook: Releases the radios of the master process."""
+    for registry in REGISTRIES:
+        registry.stop()
+    stop_logging()
+
+
 def run_server():
     """Runs the gunicorn backed webserver."""
     class WSGIServer(Application):
         """Wrapper around flask app to make it gunicorn compatible."""
         def init(self, parser, opts, args):
-            pass
+            return {'worker_exit': _worker_exit, 'on_exit': _on_exit}
 
         def load(self):
+            from rpi433rc.api import scheduler
             from rpi433rc.api.app import app
+            if isinstance(scheduler, Lazy):
+                scheduler.get()  # Fires the persisted schedules right from the start
             return app
 
     WSGIServer().run()
@@ -39,7 +67,16 @@ def run_server():
 
 def main():
     """Main entry point."""
-    run_discovery(async_mode=True)
+    if use_owner():
+        # The gunicorn master is the owner of the state and the radio, so rest, mqtt and the
+        # scheduler share one radio queue. The workers are forked from it and talk to it via a
+        # unix domain socket
+        owner = create_owner()
+        REGISTRIES.append(owner.registry)
+        # Remote cluster nodes publish (and listen for) their own devices
+        run_discovery(async_mode=True, registry=getattr(owner.registry, 'local', owner.registry))
+    else:
+        run_discovery(async_mode=True)
     run_server()
 
 
@@ -1,12 +1,12 @@
 """A place for utility functions, decorators, classes..."""
 
 import functools
-import json
 import logging
 from threading import Thread
 
 import attr
 
+from . import codec
 from .model import MQTTConfig
 
 
@@ -75,6 +75,7 @@ def safe_call(fun):
 class LogMixin:  # pylint: disable=too-few-public-methods
     """
     Provides a logger property to any class where this class is mixed-in.
+    The logger is looked up once per class.
 
     Example:
 
@@ -83,11 +84,19 @@ class LogMixin:  # pylint: disable=too-few-public-methods
         ...         self.logger.info("Begin")
         ...         # ...
         ...         self.logger.info("End")
+
+        >>> Dummy().logger is Dummy().logger, Dummy().logger.name
+        (True, 'Dummy')
     """
     @property
     def logger(self):
         """Returns the configured logging instance."""
-        return logging.getLogger(self.__class__.__name__)
+        cls = self.__class__
+        logger = cls.__dict__.get('_logger')
+        if logger is None:
+            logger = logging.getLogger(cls.__name__)
+            cls._logger = logger
+        return logger
 
 
 @attr.s
@@ -124,7 +133,7 @@ class MQTTPublisher(LogMixin):
         qos = self._qos(qos)
 
         if isinstance(payload, dict):
-            payload = json.dumps(payload)
+            payload = codec.dumpb(payload)
 
         auth = None
         if self.config.user is not None:
@@ -142,6 +151,32 @@ class MQTTPublisher(LogMixin):
         self.logger.info("Published '%s' on '%s' @ %s:%s with qos=%s.",
                          payload, topic, self.config.host, self.config.port, qos)
 
+    def publish_many(self, messages):
+        """
+        Publishes many messages over a single connection.
+
+        Args:
+            messages: List of (payload, topic, retain, qos).
+
+        Returns:
+            None.
+        """
+        import paho.mqtt.publish as publish
+        auth = None
+        if self.config.user is not None:
+            auth = dict(username=self.config.user, password=self.config.password)
+
+        publish.multiple(
+            [dict(topic=topic, payload=codec.dumpb(payload) if isinstance(payload, dict)
+                  else payload, retain=bool(retain), qos=self._qos(qos))
+             for payload, topic, retain, qos in messages],
+            hostname=self.config.host,
+            port=self.config.port,
+            auth=auth
+        )
+        self.logger.info("Published %s messages @ %s:%s.", len(messages), self.config.host,
+                         self.config.port)
+
 
 @attr.s
 class MQTTListener(LogMixin):
@@ -149,6 +184,10 @@ class MQTTListener(LogMixin):
     config = attr.ib(validator=attr.validators.instance_of(MQTTConfig))
     listen_topic = attr.ib(converter=str)
     message_callback = attr.ib(validator=lambda inst, attr, value: callable(value))
+    # After subscribing, a message is sent to the marker topic. It arrives after all retained
+    # messages of the listen topic, so `marker_callback` tells that they are all delivered
+    marker_topic = attr.ib(default=None)
+    marker_callback = attr.ib(default=None)
     _client = attr.ib(default=None, init=False)
 
     def _on_connect(self, client, userdata, flags, rc):  # pylint: disable=invalid-name,unused-argument
@@ -158,6 +197,9 @@ class MQTTListener(LogMixin):
         if rc == 0:
             # Subscribe to all device related state topics
             client.subscribe(topic)  # Subscribe to all device topics
+            if self.marker_topic is not None:
+                client.subscribe(self.marker_topic, qos=1)
+                client.publish(self.marker_topic, b'', qos=1)
             self.logger.info("Connected with result code '%s' to %s @ %s:%s",
                              rc, topic, self.config.host, self.config.port)
         else:
@@ -172,6 +214,9 @@ class MQTTListener(LogMixin):
     @safe_call
     def _on_message(self, client, obj, msg):  # pylint: disable=unused-argument
         topic = msg.topic
+        if topic == self.marker_topic:
+            self.marker_callback()
+            return
         message = msg.payload.decode('utf-8')
         self.logger.info("Got message from broker on topic '%s'. Payload='%s'",
                          topic, message)
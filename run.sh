@@ -2,4 +2,4 @@
 
 BASEDIR=$(dirname "$0")
 export PYTHONPATH=${BASEDIR}
-python ${BASEDIR}/rpi433rc/runner.py --workers 1 --bind 0.0.0.0:5000
\ No newline at end of file
+python ${BASEDIR}/rpi433rc/runner.py --workers ${WORKERS:-1} --bind 0.0.0.0:5000
\ No newline at end of file
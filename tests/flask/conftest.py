@@ -44,18 +44,28 @@ def mocked_device_db(mocker):
     mocker.patch.object(api.device_db, 'switch')
 
     from rpi433rc.business.devices import CodeDevice, SystemDevice
-    from rpi433rc.business.registry import StatefulDevice
+    from rpi433rc.business.registry import StatefulDevice, SwitchResult
     api.device_db.list.return_value = [
         StatefulDevice(device_name='device1', device=CodeDevice('device1', code_on=12345, code_off=23456), state=False),
         StatefulDevice(device_name='device2', device=CodeDevice('device2', code_on=12345, code_off=23456), state=True),
         StatefulDevice(device_name='device3', device=SystemDevice('device3', system_code="00001", device_code=4), state=True),
     ]
     api.device_db.lookup.return_value = StatefulDevice(device_name='device1', device=CodeDevice('device1', code_on=12345, code_off=23456), state=False)
-    api.device_db.switch.return_value = True
+    api.device_db.switch.return_value = SwitchResult(result=True, transmitted=True)
 
     yield api.device_db
 
 
+@pytest.fixture(scope='function')
+def scheduler(mocker, tmpdir):
+    import rpi433rc.api as api
+    from rpi433rc.business.scheduler import Scheduler
+    res = Scheduler(api.device_db, file_name=str(tmpdir.join('schedules.json')))
+    mocker.patch.object(api, 'scheduler', res)
+
+    yield res
+
+
 # @pytest.yield_fixture(scope='function')
 # def mocked_publisher(mocker):
 #     import rpi433rc.api as api
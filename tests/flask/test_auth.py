@@ -8,6 +8,8 @@ import pytest
     ('/devices/device1', 200, 401),
     ('/devices/device1/on', 200, 401),
     ('/send/12345', 200, 401),
+    ('/radio/stats', 200, 401),
+    ('/schedules/', 200, 401),
     ('/version/', 200, 200)
 ])
 def test_send_code_with_auth(path, auth_code, non_auth_code, flask_client_with_auth, mocked_rfdevice, mocked_device_db):
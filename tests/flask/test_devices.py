@@ -60,7 +60,7 @@ def test_switch_on(flask_client, mocked_device_db, mocked_rfdevice):
     assert resp.status_code == 200
     assert resp.content_type == 'application/json'
 
-    assert {"state": "on", "result": True} == json.loads(resp.data.decode("utf-8"))
+    assert {"state": "on", "result": True, "transmitted": True} == json.loads(resp.data.decode("utf-8"))
 
     assert mocked_device_db.switch.call_count >= 1
 
@@ -70,6 +70,20 @@ def test_switch_off(flask_client, mocked_device_db, mocked_rfdevice):
     assert resp.status_code == 200
     assert resp.content_type == 'application/json'
 
-    assert {"state": "off", "result": True} == json.loads(resp.data.decode("utf-8"))
+    assert {"state": "off", "result": True, "transmitted": True} == json.loads(resp.data.decode("utf-8"))
 
     assert mocked_device_db.switch.call_count >= 1
+
+
+def test_switch_idempotency_key(flask_client, mocked_device_db):
+    headers = {'Accept': 'application/json', 'Idempotency-Key': 'retry-1'}
+    for _ in range(3):
+        resp = flask_client.get('/devices/device1/on', headers=headers)
+        assert resp.status_code == 200
+        assert {"state": "on", "result": True, "transmitted": True} == json.loads(resp.data.decode("utf-8"))
+
+    assert mocked_device_db.switch.call_count == 1
+
+    resp = flask_client.get('/devices/device1/on', headers={'Idempotency-Key': 'retry-2'})
+    assert resp.status_code == 200
+    assert mocked_device_db.switch.call_count == 2
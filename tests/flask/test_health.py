@@ -0,0 +1,15 @@
+import json
+
+
+def test_ready(flask_client, mocker):
+    import rpi433rc.api as api
+    mocker.patch.object(api.device_db, 'readiness')
+    api.device_db.readiness.return_value = {'radio': True, 'state': True}
+    resp = flask_client.get('/health/ready', headers={'Accept': 'application/json'})
+    assert resp.status_code == 200
+    assert {'ready': True, 'radio': True, 'state': True} == json.loads(resp.data.decode('utf-8'))
+
+    api.device_db.readiness.return_value = {'radio': False, 'state': True}
+    resp = flask_client.get('/health/ready', headers={'Accept': 'application/json'})
+    assert resp.status_code == 503
+    assert not json.loads(resp.data.decode('utf-8'))['ready']
@@ -0,0 +1,23 @@
+import json
+
+
+def test_learn(flask_client, mocker):
+    import rpi433rc.api as api
+    from rpi433rc.business.learn import LearnError, LearnSession
+    mocker.patch.object(api.learner, 'start')
+    mocker.patch.object(api.learner, 'status')
+    api.learner.start.return_value = LearnSession('lamp')
+    resp = flask_client.post('/learn/lamp?timeout=10', headers={'Accept': 'application/json'})
+    assert resp.status_code == 202
+    assert json.loads(resp.data.decode('utf-8'))['state'] == 'waiting_on'
+    api.learner.start.assert_called_with('lamp', timeout=10.0)
+
+    api.learner.status.return_value = LearnSession('lamp', state='done', code_on=1, code_off=2,
+                                                   protocol=1, pulse_length=350)
+    resp = flask_client.get('/learn/lamp', headers={'Accept': 'application/json'})
+    assert resp.status_code == 200
+    assert json.loads(resp.data.decode('utf-8'))['pulse_length'] == 350
+
+    api.learner.start.side_effect = LearnError("Device 'lamp' is being learned")
+    resp = flask_client.post('/learn/other', headers={'Accept': 'application/json'})
+    assert resp.status_code == 409
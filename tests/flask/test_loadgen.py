@@ -0,0 +1,83 @@
+import json
+import threading
+
+import pytest
+
+
+@pytest.yield_fixture(scope='function')
+def live_server(flask_client, mocked_device_db, mocked_rfdevice):
+    from werkzeug.serving import make_server
+    from rpi433rc.api.app import app
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_port)
+    server.shutdown()
+
+
+def test_loadgen_run(live_server):
+    from rpi433rc.loadgen import HttpDriver, LoadGenerator, parse_mix
+
+    dut = LoadGenerator(HttpDriver(live_server), devices=['device1', 'device2'],
+                        mix=parse_mix('switch:2,list:1,send:1'))
+    res = dut.run(concurrency=2, duration=None, requests=40)
+
+    assert res['total']['count'] == 40
+    assert res['total']['error_rate'] == 0.0
+    assert set(res['operations']) == {'switch', 'list', 'send'}
+    assert res['total']['p50'] <= res['total']['p99'] <= res['total']['max']
+
+
+def test_loadgen_counts_errors(live_server):
+    from rpi433rc.loadgen import HttpDriver, LoadGenerator, parse_mix
+
+    dut = LoadGenerator(HttpDriver(live_server, keep_alive=False), devices=['device1'],
+                        mix=parse_mix('switch'))
+    res = dut.run(concurrency=1, duration=None, requests=4)
+    assert res['total']['error_rate'] == 0.0
+
+    dut = LoadGenerator(HttpDriver(live_server), devices=['unknown'], mix=parse_mix('switch'))
+    dut.http.get = lambda path: 404
+    res = dut.run(concurrency=1, duration=None, requests=3)
+    assert res['total']['errors'] == {'HTTP 404': 3}
+    assert res['total']['error_rate'] == 1.0
+
+
+def test_loadgen_cli_report(live_server, tmpdir):
+    from rpi433rc.config import VERSION
+    from rpi433rc.loadgen import main
+
+    import io
+    out = io.StringIO()
+    baseline = str(tmpdir.join('baseline.json'))
+    report = str(tmpdir.join('report.json'))
+    main([live_server, '--devices', 'device1', '--requests', '10', '--concurrency', '1',
+          '--report', baseline], out=out)
+    res = main([live_server, '--devices', 'device1', '--requests', '10', '--compare', baseline,
+                '--report', report], out=out)
+
+    with open(report) as fpointer:
+        assert json.load(fpointer)['total']['count'] == 10
+    assert res['version'] == VERSION
+    assert 'compared with' in out.getvalue()
+
+
+def test_loadgen_toggles_each_device():
+    from rpi433rc.loadgen import LoadGenerator, parse_mix
+
+    class Http:
+        paths = []
+
+        def get(self, path):
+            self.paths.append(path)
+            return 200
+
+    http = Http()
+    dut = LoadGenerator(http, devices=['device1', 'device2'], mix=parse_mix('switch:1,list:1'))
+    dut.run(concurrency=1, duration=None, requests=40)
+    for device_name in ('device1', 'device2'):
+        switches = [path.rsplit('/', 1)[1] for path in http.paths
+                    if path.startswith('/devices/{}/'.format(device_name))]
+        assert switches[:4] == ['on', 'off', 'on', 'off']
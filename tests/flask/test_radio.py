@@ -0,0 +1,48 @@
+import json
+
+
+def test_stats(flask_client, mocked_rfdevice):
+    resp = flask_client.get('/radio/stats', headers={'Accept': 'application/json'})
+    assert resp.status_code == 200
+    assert resp.content_type == 'application/json'
+    assert {} == json.loads(resp.data.decode("utf-8"))
+
+
+def test_stats_adaptive(flask_client, mocked_rfdevice, mocker):
+    import rpi433rc.api as api
+    from rpi433rc.business.devices import CodeDevice
+    from rpi433rc.business.resend import AdaptiveResend
+    mocker.patch.object(api.device_db.rc433, 'resend_policy', AdaptiveResend())
+
+    api.device_db.rc433.switch_device(True, CodeDevice('device1', code_on=1, code_off=2))
+    resp = flask_client.get('/radio/stats', headers={'Accept': 'application/json'})
+    assert resp.status_code == 200
+    stats = json.loads(resp.data.decode("utf-8"))
+    assert stats['device1']['transmissions'] == 1
+    assert stats['device1']['frames'] == 3
+
+
+def test_history(flask_client, mocked_rfdevice, mocker, tmpdir):
+    import rpi433rc.api as api
+    from rpi433rc.business.audit import AuditLog
+    from rpi433rc.business.devices import CodeDevice
+    resp = flask_client.get('/radio/history', headers={'Accept': 'application/json'})
+    assert resp.status_code == 404
+
+    mocker.patch.object(api.device_db.rc433, 'audit_log', AuditLog(str(tmpdir.join('audit.bin')),
+                                                                   capacity=10))
+    api.device_db.rc433.switch_device(True, CodeDevice('device1', code_on=1, code_off=2),
+                                      source='rest')
+    api.device_db.rc433.switch_device(False, CodeDevice('device2', code_on=3, code_off=4))
+    resp = flask_client.get('/radio/history?device=device1',
+                            headers={'Accept': 'application/json'})
+    assert resp.status_code == 200
+    history = json.loads(resp.data.decode("utf-8"))
+    assert len(history) == 1
+    assert history[0]['code'] == 1
+    assert history[0]['source'] == 'rest'
+    assert history[0]['repeats'] == 3
+    assert history[0]['result'] is True
+
+    resp = flask_client.get('/radio/history?limit=1', headers={'Accept': 'application/json'})
+    assert [item['device_name'] for item in json.loads(resp.data.decode("utf-8"))] == ['device2']
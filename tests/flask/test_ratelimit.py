@@ -0,0 +1,38 @@
+import json
+
+
+def test_rate_limited(flask_client, mocked_device_db, mocker):
+    import rpi433rc.api as api
+    mocker.patch.object(api.rate_limiter, 'limits', {'rest': (0.1, 2)})
+    api.rate_limiter._buckets.clear()
+
+    for _ in range(2):
+        resp = flask_client.get('/devices/device1/on', headers={'Accept': 'application/json'})
+        assert resp.status_code == 200
+        assert {"state": "on", "result": True, "transmitted": True} == json.loads(resp.data.decode("utf-8"))
+
+    resp = flask_client.get('/send/12345', headers={'Accept': 'application/json'})
+    assert resp.status_code == 429
+    assert int(resp.headers['Retry-After']) > 0
+    assert mocked_device_db.switch.call_count == 2
+
+    resp = flask_client.get('/devices/list', headers={'Accept': 'application/json'})
+    assert resp.status_code == 200
+    api.rate_limiter._buckets.clear()
+
+
+def test_unchecked_user_is_ignored(flask_client, mocked_device_db, mocker):
+    import base64
+    import rpi433rc.api as api
+    mocker.patch.object(api.rate_limiter, 'limits', {'rest': (0.1, 2)})
+    api.rate_limiter._buckets.clear()
+
+    # Auth is disabled: Random user names must not get a fresh limit each
+    statuses = []
+    for i in range(3):
+        token = base64.b64encode('user{}:pw'.format(i).encode()).decode()
+        resp = flask_client.get('/devices/device1/on', headers={
+            'Accept': 'application/json', 'Authorization': 'Basic ' + token})
+        statuses.append(resp.status_code)
+    assert statuses == [200, 200, 429]
+    api.rate_limiter._buckets.clear()
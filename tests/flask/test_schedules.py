@@ -0,0 +1,55 @@
+import json
+
+
+def _persisted(registry, file_name):
+    from rpi433rc.business.scheduler import Scheduler
+    restarted = Scheduler(registry, file_name=file_name)
+    restarted.load()
+    return restarted.list()
+
+
+def test_schedules(flask_client, mocked_device_db, scheduler, tmpdir):
+    file_name = scheduler.file_name
+
+    resp = flask_client.post('/schedules/', data=json.dumps({
+        'device_name': 'device1', 'on_off': 'off', 'delay': 1800
+    }), headers={'Accept': 'application/json', 'Content-Type': 'application/json'})
+    assert resp.status_code == 201
+    schedule = json.loads(resp.data.decode("utf-8"))
+    assert schedule['device_name'] == 'device1'
+    assert schedule['on_off'] == 'off'
+
+    resp = flask_client.get('/schedules/', headers={'Accept': 'application/json'})
+    assert resp.status_code == 200
+    assert [schedule] == json.loads(resp.data.decode("utf-8"))
+    assert [s.schedule_id for s in _persisted(scheduler.registry, file_name)] == \
+        [schedule['schedule_id']]
+
+    resp = flask_client.delete('/schedules/' + schedule['schedule_id'])
+    assert resp.status_code == 204
+    resp = flask_client.delete('/schedules/' + schedule['schedule_id'])
+    assert resp.status_code == 404
+    assert _persisted(scheduler.registry, file_name) == []
+    assert json.loads(tmpdir.join('schedules.json').read()) == []  # Compacted by the restart
+
+
+def test_bad_schedule(flask_client, mocked_device_db, scheduler):
+    resp = flask_client.post('/schedules/', data=json.dumps({
+        'device_name': 'device1', 'on_off': 'off'
+    }), headers={'Accept': 'application/json', 'Content-Type': 'application/json'})
+    assert resp.status_code == 400
+
+
+def test_scheduler_is_created_on_first_use(tmpdir):
+    import rpi433rc.api as api
+    from rpi433rc.business.scheduler import Scheduler
+    from rpi433rc.factories import Lazy
+
+    assert isinstance(api.scheduler, Lazy)  # Importing the api creates no schedules file
+    created = []
+    dut = Lazy(lambda registry: created.append(registry) or
+               Scheduler(registry, file_name=str(tmpdir.join('schedules.json'))), api.device_db)
+    assert created == []
+    assert dut.list() == []
+    assert dut.get() is dut.get()
+    assert created == [api.device_db]
@@ -10,3 +10,20 @@ def test_send_code(flask_client, mocked_rfdevice):
     # mocked_rfdevice.enable_tx.assert_called()
     mocked_rfdevice.tx_code.assert_called_with(12345)
 
+
+
+def test_send_code_with_timing(flask_client, mocked_rfdevice):
+    resp = flask_client.get('/send/12345?protocol=2&code_length=32',
+                            headers={'Accept': 'application/json'})
+    assert resp.status_code == 200
+    mocked_rfdevice.tx_code.assert_called_with(12345, tx_proto=2, tx_pulselength=650,
+                                               tx_length=32)
+
+    # The next code without timing resets the sticky pulse length of rpi_rf
+    flask_client.get('/send/12345', headers={'Accept': 'application/json'})
+    mocked_rfdevice.tx_code.assert_called_with(12345, tx_proto=1, tx_pulselength=350)
+    flask_client.get('/send/12345', headers={'Accept': 'application/json'})
+    mocked_rfdevice.tx_code.assert_called_with(12345)
+
+    resp = flask_client.get('/send/12345?protocol=9', headers={'Accept': 'application/json'})
+    assert resp.status_code == 400
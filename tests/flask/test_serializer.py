@@ -0,0 +1,51 @@
+import json
+
+
+def test_same_as_marshal(flask_client, mocked_device_db):
+    from flask_restplus import marshal
+    from rpi433rc.api.devices import DEVICE
+    from rpi433rc.api.flaskutil.serializer import compile_model
+
+    serialize = compile_model(DEVICE)
+    devices = mocked_device_db.list.return_value
+    assert [serialize(dev) for dev in devices] == json.loads(json.dumps(marshal(devices, DEVICE)))
+
+
+def test_field_mask(flask_client, mocked_device_db):
+    resp = flask_client.get('/devices/device1', headers={'Accept': 'application/json',
+                                                         'X-Fields': 'device_name,state'})
+    assert resp.status_code == 200
+    assert {"device_name": "device1", "state": "off"} == json.loads(resp.data.decode("utf-8"))
+
+
+def test_swagger_unchanged(flask_client):
+    resp = flask_client.get('/swagger.json')
+    assert resp.status_code == 200
+    spec = json.loads(resp.data.decode("utf-8"))
+    response = spec['paths']['/devices/list']['get']['responses']['200']
+    assert response['schema'] == {'$ref': '#/definitions/Device'}
+    assert 'Device' in spec['definitions']
+    assert any(param['name'] == 'X-Fields' for param in spec['paths']['/devices/list']['get']['parameters'])
+
+
+def test_response_tuple(flask_client):
+    from collections import namedtuple
+    from flask_restplus import Model, fields
+    from rpi433rc.api.flaskutil.serializer import marshal_fast
+
+    model = Model('Named', {'name': fields.String})
+    Named = namedtuple('Named', ['name'])
+
+    @marshal_fast(None, model)
+    def created():
+        return Named('device1'), 201, {'Location': '/devices/device1'}
+
+    @marshal_fast(None, model)
+    def named():
+        return Named('device2')
+
+    with flask_client.application.test_request_context():
+        resp = created()
+        assert (resp.status_code, resp.headers['Location']) == (201, '/devices/device1')
+        assert json.loads(resp.data.decode('utf-8')) == {'name': 'device1'}
+        assert json.loads(named().data.decode('utf-8')) == {'name': 'device2'}
@@ -0,0 +1,35 @@
+import json
+
+
+def test_changes(flask_client, mocker):
+    import rpi433rc.api as api
+    from rpi433rc.business.state import Changes, StateChange
+    mocker.patch.object(api.device_db, 'changes')
+    api.device_db.changes.return_value = Changes('abc', 7, False, [
+        StateChange('device1', True, 5), StateChange('device2', None, 7)])
+
+    resp = flask_client.get('/state/changes?since=4&epoch=abc')
+    assert resp.status_code == 200
+    assert json.loads(resp.data.decode("utf-8")) == {
+        'epoch': 'abc', 'version': 7, 'resync': False,
+        'changes': [{'device_name': 'device1', 'state': 'on', 'version': 5},
+                    {'device_name': 'device2', 'state': None, 'version': 7}]}
+    api.device_db.changes.assert_called_with(since=4, epoch='abc')
+
+    assert flask_client.get('/state/changes?since=x').status_code == 400
+
+
+def test_changes_since_0_lists_all_devices(flask_client):
+    import rpi433rc.api as api
+    resp = flask_client.get('/state/changes?since=0')
+    assert resp.status_code == 200
+    res = json.loads(resp.data.decode("utf-8"))
+    assert res['resync']
+    assert sorted(change['device_name'] for change in res['changes']) == \
+        sorted(dev.device_name for dev in api.device_db.list())
+
+
+def test_device_named_changes(flask_client, mocked_device_db):
+    resp = flask_client.get('/devices/changes')
+    assert resp.status_code == 200
+    mocked_device_db.lookup.assert_called_with(device_name='changes')
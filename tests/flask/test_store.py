@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+
+@pytest.fixture(scope='function')
+def sqlite_registry(mocker):
+    import rpi433rc.api as api
+    from rpi433rc.business.rc433 import RC433, RFDeviceMock
+    from rpi433rc.business.registry import DeviceRegistry
+    from rpi433rc.business.sqlstore import SQLiteStore
+    from rpi433rc.business.state import MemoryState
+    rc433 = RC433()
+    rc433.rf_device = RFDeviceMock()
+    registry = DeviceRegistry(SQLiteStore(':memory:'), MemoryState(), rc433)
+    mocker.patch.object(api, 'device_db', registry)
+    yield registry
+
+
+def _send(method, url, payload):
+    return method(url, data=json.dumps(payload),
+                  headers={'Accept': 'application/json', 'Content-Type': 'application/json'})
+
+
+def test_crud(flask_client, sqlite_registry):
+    resp = _send(flask_client.post, '/store/devices', {
+        'device_name': 'device1', 'configuration': {'code_on': 1, 'code_off': 2}
+    })
+    assert resp.status_code == 201
+    assert json.loads(resp.data.decode('utf-8'))['configuration']['code_on'] == 1
+    resp = _send(flask_client.post, '/store/devices', {
+        'device_name': 'device1', 'configuration': {'code_on': 1, 'code_off': 2}
+    })
+    assert resp.status_code == 409
+
+    resp = _send(flask_client.put, '/store/devices/device1', {
+        'configuration': {'code_on': 3, 'code_off': 4}
+    })
+    assert resp.status_code == 200
+    resp = flask_client.get('/devices/device1/on')
+    assert resp.status_code == 200
+
+    resp = flask_client.get('/store/devices?code=4', headers={'Accept': 'application/json'})
+    assert [(device['device_name'], device['state'])
+            for device in json.loads(resp.data.decode('utf-8'))] == [('device1', 'on')]
+
+    resp = flask_client.delete('/store/devices/device1')
+    assert resp.status_code == 204
+    resp = flask_client.delete('/store/devices/device1')
+    assert resp.status_code == 404
+    assert flask_client.get('/devices/list').data.strip() == b'[]'
+
+
+def test_invalid(flask_client, sqlite_registry):
+    resp = _send(flask_client.put, '/store/devices/device1', {'configuration': {'code_on': 1}})
+    assert resp.status_code == 400
+    resp = _send(flask_client.put, '/store/devices/group1', {
+        'configuration': {'members': ['device1']}
+    })
+    assert resp.status_code == 400
+    for payload in ({'configuration': {'code_on': 1, 'code_off': 2}},
+                    {'device_name': '', 'configuration': {'code_on': 1, 'code_off': 2}}):
+        resp = _send(flask_client.post, '/store/devices', payload)
+        assert resp.status_code == 400
+    assert flask_client.get('/devices/list').data.strip() == b'[]'
+
+
+def test_unknown_group(flask_client, sqlite_registry, mocker):
+    import rpi433rc.api as api
+    from rpi433rc.business.devices import DeviceDict
+    from rpi433rc.business.registry import DeviceRegistry
+    dict_registry = DeviceRegistry(DeviceDict({'device1': {'code_on': 1, 'code_off': 2}}),
+                                   sqlite_registry.device_state, sqlite_registry.rc433)
+    for registry in (sqlite_registry, dict_registry):
+        mocker.patch.object(api, 'device_db', registry)
+        resp = flask_client.get('/store/devices?group=unknown',
+                                headers={'Accept': 'application/json'})
+        assert resp.status_code == 404
+
+
+def test_read_only(flask_client, mocked_device_db):
+    resp = flask_client.delete('/store/devices/device1')
+    assert resp.status_code == 405
+
+
+def test_export(flask_client, mocked_device_db, mocker):
+    import rpi433rc.api as api
+    mocker.patch.object(api.device_db, 'find', return_value=mocked_device_db.list.return_value)
+    resp = flask_client.get('/store/export')
+    assert resp.status_code == 200
+    assert json.loads(resp.data.decode("utf-8"))['device3'] == {
+        'system_code': '00001', 'device_code': 4, 'resend': 3}
+
+    resp = flask_client.get('/store/export?format=jsonl')
+    assert resp.status_code == 200
+    assert resp.content_type == 'application/x-ndjson'
+    lines = resp.data.decode("utf-8").splitlines()
+    assert [json.loads(line)['device_name'] for line in lines] == ['device1', 'device2', 'device3']
+
+    assert flask_client.get('/store/export?format=xml').status_code == 400
+
+    # A device may be called 'export'
+    mocked_device_db.lookup.return_value = mocked_device_db.list.return_value[0]
+    assert flask_client.get('/devices/export').status_code == 200
+    mocked_device_db.lookup.assert_called_with(device_name='export')
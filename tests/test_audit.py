@@ -0,0 +1,41 @@
+import multiprocessing
+
+
+def _append(file_name, source, count):
+    from rpi433rc.business.audit import AuditLog, AuditRecord
+    audit_log = AuditLog(file_name, capacity=1000)
+    for i in range(count):
+        audit_log.append(AuditRecord(float(i), i, 'device1', source))
+    audit_log.close()
+
+
+def test_processes_share_the_log(tmpdir):
+    from rpi433rc.business.audit import AuditLog
+
+    file_name = str(tmpdir.join('audit.bin'))
+    dut = AuditLog(file_name, capacity=1000)  # E.g. the master process
+    processes = [multiprocessing.Process(target=_append, args=(file_name, source, 200))
+                 for source in ('mqtt', 'rest')]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    records = dut.query()
+    assert len(dut) == len(records) == 400
+    assert sorted(record.code for record in records if record.source == 'mqtt') == \
+        list(range(200))
+    dut.close()
+
+
+def test_query_since_unordered_timestamps(tmpdir):
+    from rpi433rc.business.audit import AuditLog, AuditRecord
+
+    dut = AuditLog(str(tmpdir.join('audit.bin')), capacity=10)
+    # The clock jumps forward (ntp sync) and a radio of a pool appends late
+    for timestamp in (100.0, 1600000000.0, 1600000002.0, 1600000001.0, 1600000003.0):
+        dut.append(AuditRecord(timestamp, 1))
+    assert [record.timestamp for record in dut.query(since=1600000001.0)] == \
+        [1600000003.0, 1600000001.0, 1600000002.0]
+    assert [record.timestamp for record in dut.query(until=200.0)] == [100.0]
+    dut.close()
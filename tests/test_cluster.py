@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+
+def _local_registry(devices):
+    from rpi433rc.business.devices import DeviceDict
+    from rpi433rc.business.rc433 import RC433, RFDeviceMock
+    from rpi433rc.business.registry import DeviceRegistry
+    from rpi433rc.business.state import MemoryState
+
+    rc433 = RC433()
+    rc433.rf_device = RFDeviceMock()
+    return DeviceRegistry(DeviceDict(devices), MemoryState(), rc433)
+
+
+@pytest.fixture
+def node():
+    """Serves a local registry like a remote rpi433rc instance would do."""
+    registry = _local_registry({'pump': {'code_on': 1, 'code_off': 2}})
+
+    def _to_json(dev):
+        return {'device_name': dev.device_name, 'type': dev.device.__class__.__name__,
+                'configuration': dev.device.configuration, 'state': 'on' if dev.state else 'off'}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            parts = self.path.strip('/').split('/')
+            if parts == ['devices', 'list']:
+                res = [_to_json(dev) for dev in registry.list()]
+            elif len(parts) == 3:
+                res = {'state': parts[2], 'result': bool(registry.switch(parts[2] == 'on',
+                                                                         device_name=parts[1]))}
+            else:
+                res = _to_json(registry.lookup(device_name=parts[1]))
+            body = json.dumps(res).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_forwarding(node):
+    from rpi433rc.business.cluster import ClusterRegistry, RemoteNode
+
+    local = _local_registry({'lamp': {'code_on': 3, 'code_off': 4}})
+    dut = ClusterRegistry(local, nodes={'garden': RemoteNode('garden', node)},
+                          routes={'pump': 'garden'})
+
+    assert dut.switch(True, device_name='pump')
+    assert dut.lookup(device_name='pump').state is True
+    assert not local.device_state.lookup(device_name='pump')
+
+    assert dut.switch(True, device_name='lamp')
+    assert sorted((dev.device_name, dev.state) for dev in dut.list()) == [
+        ('lamp', True), ('pump', True)
+    ]
+    # All requests were served by one kept-alive connection
+    assert len(dut.nodes['garden']._idle) == 1
+
+
+def test_unreachable_node():
+    from rpi433rc.business.cluster import ClusterRegistry, RemoteNode, RemoteNodeError
+
+    local = _local_registry({'lamp': {'code_on': 3, 'code_off': 4}})
+    dut = ClusterRegistry(local, nodes={'garden': RemoteNode('garden', 'http://127.0.0.1:1',
+                                                             timeout=0.5)},
+                          routes={'pump': 'garden'})
+
+    assert [dev.device_name for dev in dut.list()] == ['lamp']
+    with pytest.raises(RemoteNodeError):
+        dut.switch(True, device_name='pump')
+
+
+@pytest.fixture
+def flaky_node():
+    """A node that closes idle connections and answers slowly on request."""
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            calls.append(self.path)
+            if self.path.endswith('/slow/on'):
+                time.sleep(0.6)
+            body = json.dumps({'state': 'on', 'result': True}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            # Like a node that drops idle keep-alive connections
+            self.close_connection = '/pump/' in self.path
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1]), calls
+    server.shutdown()
+    server.server_close()
+
+
+def test_retry_only_unsent_requests(flaky_node):
+    from rpi433rc.business.cluster import RemoteNode, RemoteNodeError
+
+    url, calls = flaky_node
+    dut = RemoteNode('garden', url, timeout=0.3)
+    assert dut.switch(True, device_name='pump').result
+    time.sleep(0.1)  # The node has closed the idle connection by now
+    assert dut.switch(True, device_name='pump').result  # Retried on a new connection
+    assert calls == ['/devices/pump/on'] * 2
+
+    # The node got the request on a reused connection but answers too late: Must not be sent twice
+    assert dut.switch(True, device_name='lamp').result
+    with pytest.raises(RemoteNodeError):
+        dut.switch(True, device_name='slow')
+    time.sleep(0.5)
+    assert calls.count('/devices/slow/on') == 1
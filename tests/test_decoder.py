@@ -0,0 +1,40 @@
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+CAPTURES = os.path.join(os.path.dirname(__file__), 'data', 'captures.jsonl')
+
+
+def _captures():
+    with open(CAPTURES, 'r', encoding='utf-8') as fpointer:
+        return [json.loads(line) for line in fpointer]
+
+
+@pytest.mark.parametrize('capture', _captures(), ids=lambda capture: capture['name'])
+def test_corpus(capture):
+    from rpi433rc.business.decoder import DecoderBank
+    from rpi433rc.business.learn import decode
+    from rpi433rc.business.protocols import known_protocols, parse_protocols
+
+    protocols = known_protocols(parse_protocols(capture.get('protocols')))
+    dut = DecoderBank(protocols)
+    presses = dut.presses(capture['durations'])
+    assert [[press.code, press.bit_length, press.protocol] for press in presses] == \
+        capture['expected']
+    # Same frames as the plain python decoder
+    assert dut.decode(capture['durations']) == decode(capture['durations'], protocols)
+
+
+def test_large_batches():
+    from rpi433rc.business.decoder import DecoderBank
+    from rpi433rc.business.learn import encode
+
+    capture = [10850] + encode(5592405) * 5000 + encode(77, bit_length=12, protocol=4) * 5000
+    frames = DecoderBank().decode(np.array(capture))
+    assert len(frames) == 10000
+    # The first frame of protocol 4 is preceded by the sync of protocol 1
+    assert {(frame.code, frame.protocol) for frame in frames[5001:]} == {(77, 4)}
+    assert DecoderBank().decode([]) == []
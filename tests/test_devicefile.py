@@ -0,0 +1,51 @@
+import io
+
+import pytest
+
+
+def _inventory(count):
+    for i in range(count):
+        yield '{{"device_name": "socket{0}", "code_on": {0}, "code_off": {1}}}\n'.format(i, i + 1)
+
+
+def test_roundtrip():
+    from rpi433rc.business.devicefile import read_devices, write_devices
+
+    devices = read_devices(io.StringIO(''.join(_inventory(1000))), fmt='jsonl')
+    assert len(devices) == 1000
+
+    for fmt in ('json', 'jsonl'):
+        out = io.StringIO()
+        write_devices(devices.values(), out, fmt)
+        out.seek(0)
+        assert read_devices(out, fmt) == devices
+
+
+def test_small_chunks():
+    from rpi433rc.business.devicefile import iter_json
+
+    text = '{\n  "device1": {"code_on": 12345, "code_off": 23456, "radio": "ground"},\n' \
+           '  "device2": {"system_code": "00010", "device_code": 2}\n}\n'
+    entries = list(iter_json(io.StringIO(text), chunk_size=3))
+    assert [(line, name) for line, name, _ in entries] == [(2, 'device1'), (3, 'device2')]
+    assert entries[0][2]['code_on'] == 12345
+
+
+def test_errors_by_line():
+    from rpi433rc.business.devicefile import read_devices, DeviceImportError
+
+    with pytest.raises(DeviceImportError) as exc:
+        read_devices(io.StringIO('{\n"device1": {"code_on": 1, "code_off": 2},\n'
+                                 '"device2": {"code_on": 1},\n"device3": {"code_on": 1,}\n}'))
+    assert [line for line, _ in exc.value.errors] == [3, 4]
+    assert 'Invalid json' in exc.value.errors[1][1]
+
+    with pytest.raises(DeviceImportError) as exc:
+        read_devices(io.StringIO('{\n"device1": {"code_on": 1, "code_off": 2},\n'
+                                 '"device2": {"code_on": 1}\n}'))
+    assert exc.value.errors == [(3, "Misconfigured device 'device2'")]
+
+    with pytest.raises(DeviceImportError) as exc:
+        read_devices(io.StringIO('{"device_name": "device1"}\nnot json\n'), fmt='jsonl',
+                     max_errors=1)
+    assert [line for line, _ in exc.value.errors] == [1]
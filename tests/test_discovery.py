@@ -0,0 +1,30 @@
+def test_runtime_devices_are_published(mocker):
+    import rpi433rc.business.discovery as discovery
+    from rpi433rc.business.devices import CodeDevice
+    from rpi433rc.business.rc433 import RC433, RFDeviceMock
+    from rpi433rc.business.registry import DeviceRegistry
+    from rpi433rc.business.sqlstore import SQLiteStore
+    from rpi433rc.business.state import MemoryState
+    from rpi433rc.model import MQTTConfig, MQTTTopicConfig
+
+    mocker.patch.object(discovery, 'MQTTListener')
+    publisher = mocker.patch.object(discovery, 'MQTTPublisher').return_value
+    rc433 = RC433()
+    rc433.rf_device = RFDeviceMock()
+    registry = DeviceRegistry(SQLiteStore(':memory:'), MemoryState(), rc433)
+    registry.add(CodeDevice('device1', code_on=1, code_off=2))
+    topic_config = MQTTTopicConfig(discovery=True, command_topic='set')
+    dut = discovery.MQTTDiscovery(mqtt_config=MQTTConfig(host='localhost'),
+                                  topic_config=topic_config, registry=registry)
+    dut.run(async_mode=True)
+    assert [call[0][1] for call in publisher.publish.call_args_list] == \
+        [topic_config.mk_config_topic('device1')]
+
+    publisher.publish.reset_mock()
+    registry.add(CodeDevice('device2', code_on=3, code_off=4))  # E.g. learned
+    registry.remove('device1')
+    assert [call[0] for call in publisher.publish.call_args_list] == [
+        (dut.configs.get('device2'), topic_config.mk_config_topic('device2')),
+        ('', topic_config.mk_config_topic('device1'))
+    ]
+    assert dut.configs.get('device1') is None
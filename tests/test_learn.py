@@ -0,0 +1,86 @@
+import random
+import time
+
+import pytest
+
+
+class FakeReceiver:
+    """Replays a capture as if it was received by the gpio interrupt."""
+    def __init__(self, capture):
+        from rpi433rc.business.learn import EdgeRing
+        self.ring = EdgeRing()
+        self.capture = capture
+        self.stopped = False
+
+    def start(self):
+        timestamp = 0
+        for duration in self.capture:
+            timestamp += duration
+            self.ring.push(timestamp)
+
+    def stop(self):
+        self.stopped = True
+
+
+def _noisy(durations, jitter=0.15, seed=42):
+    rand = random.Random(seed)
+    return [int(duration * rand.uniform(1 - jitter, 1 + jitter)) for duration in durations]
+
+
+@pytest.fixture
+def registry():
+    from rpi433rc.business.rc433 import RC433, RFDeviceMock
+    from rpi433rc.business.registry import DeviceRegistry
+    from rpi433rc.business.sqlstore import SQLiteStore
+    from rpi433rc.business.state import MemoryState
+    rc433 = RC433()
+    rc433.rf_device = RFDeviceMock()
+    return DeviceRegistry(SQLiteStore(':memory:'), MemoryState(), rc433)
+
+
+def _wait(session, timeout=5):
+    deadline = time.monotonic() + timeout
+    while session.active and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_decode_tolerates_jitter_and_noise():
+    from rpi433rc.business.learn import decode, encode
+    rand = random.Random(1)
+    noise = [rand.randint(50, 900) for _ in range(101)]
+    capture = noise + _noisy(encode(1361, protocol=4) * 3) + noise
+    assert {(frame.code, frame.protocol) for frame in decode(capture)} == {(1361, 4)}
+
+
+def test_learns_noisy_presses(registry):
+    from rpi433rc.business.devices import CodeDevice
+    from rpi433rc.business.learn import Learner, encode
+
+    registry.add(CodeDevice('lamp', code_on=1, code_off=2, resend=5))
+    capture = [300, 20000] + _noisy(encode(5592401) * 4 + encode(5592404) * 4) + [5000]
+    receiver = FakeReceiver(capture)
+    dut = Learner(registry, receiver)
+    session = dut.start('lamp', timeout=5)
+    _wait(session)
+
+    assert dut.status('lamp').state == 'done'
+    assert receiver.stopped
+    device = registry.lookup(device_name='lamp').device
+    assert (device.code_on, device.code_off, device.protocol, device.resend) == \
+        (5592401, 5592404, 1, 5)
+    assert 300 < device.pulse_length < 400
+
+
+def test_times_out_and_rejects_concurrent_sessions(registry):
+    from rpi433rc.business.devices import UnknownDeviceError
+    from rpi433rc.business.learn import LearnError, Learner
+
+    dut = Learner(registry, FakeReceiver([]))
+    session = dut.start('lamp', timeout=0.2)
+    with pytest.raises(LearnError):
+        dut.start('other')
+    with pytest.raises(UnknownDeviceError):
+        dut.status('other')
+    _wait(session)
+    assert session.state == 'timeout'
+    assert dut.start('other', timeout=0.1).device_name == 'other'
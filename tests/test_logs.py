@@ -0,0 +1,33 @@
+import logging
+import threading
+
+
+def test_async_handler_formats_in_background():
+    from rpi433rc.logs import AsyncHandler
+
+    formatted = []
+
+    class Formatter(logging.Formatter):
+        def format(self, record):
+            formatted.append((record.getMessage(), threading.current_thread().name))
+            return super().format(record)
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            self.format(record)
+
+    target = Handler()
+    target.setFormatter(Formatter())
+    dut = AsyncHandler(target)
+    logger = logging.getLogger('test_async_handler')
+    logger.propagate = False
+    logger.addHandler(dut)
+    try:
+        logger.warning("Sent %s", 12345)
+        dut.stop()  # Like the worker_exit hook: Writes the queued records
+    finally:
+        logger.removeHandler(dut)
+    assert len(formatted) == 1
+    message, thread_name = formatted[0]
+    assert message == 'Sent 12345'
+    assert thread_name != threading.current_thread().name
@@ -0,0 +1,104 @@
+import threading
+
+from rpi433rc.business.outbox import CircuitBreaker, MQTTOutbox
+
+
+class Publisher:
+    def __init__(self):
+        self.broker_up = False
+        self.published = []
+        self.attempts = 0
+        self.event = threading.Event()
+
+    def publish_many(self, messages):
+        self.attempts += 1
+        if not self.broker_up:
+            raise OSError('Connection refused')
+        self.published.extend(messages)
+        self.event.set()
+
+
+def test_survives_restart(tmpdir):
+    fn = str(tmpdir.join('outbox.json'))
+    dut = MQTTOutbox(Publisher(), CircuitBreaker(threshold=1, reset_timeout=3600), file_name=fn)
+    dut.publish(b'on', 'rc433/device1/state')
+    dut.flush()
+    dut.stop()
+
+    publisher = Publisher()
+    publisher.broker_up = True
+    dut = MQTTOutbox(publisher, file_name=fn)
+    assert len(dut) == 1
+    assert dut.flush()
+    dut.save()
+    assert publisher.published == [('on', 'rc433/device1/state', True, 0)]
+    dut.stop()
+    assert len(MQTTOutbox(Publisher(), file_name=fn)) == 0
+
+
+def test_one_process_per_file(tmpdir):
+    fn = str(tmpdir.join('outbox.json'))
+    dut = MQTTOutbox(Publisher(), file_name=fn)
+    other = MQTTOutbox(Publisher(), file_name=fn)  # E.g. a second process
+    assert (dut.file_name, other.file_name) == (fn, None)
+    dut.stop()
+    assert MQTTOutbox(Publisher(), file_name=fn).file_name == fn
+
+
+def test_fails_fast_while_open():
+    publisher = Publisher()
+    dut = MQTTOutbox(publisher, CircuitBreaker(threshold=2, reset_timeout=3600), max_size=2)
+    dut.run_async()
+    for i in range(10):
+        dut.publish('on', 'rc433/device{}/state'.format(i))
+    assert not publisher.event.wait(0.2)
+    assert publisher.attempts <= 2  # No connection attempts while the breaker is open
+    assert len(dut) == 2  # Only the latest topics are kept
+    dut.stop()
+
+
+def test_flushes_when_closed():
+    publisher = Publisher()
+    publisher.broker_up = True
+    dut = MQTTOutbox(publisher)
+    dut.run_async()
+    dut.publish('on', 'rc433/device1/state')
+    assert publisher.event.wait(5)
+    dut.stop()
+    assert publisher.published == [('on', 'rc433/device1/state', True, 0)]
+
+
+def test_no_writes_while_the_broker_is_up(tmpdir):
+    fn = str(tmpdir.join('outbox.json'))
+    publisher = Publisher()
+    publisher.broker_up = True
+    dut = MQTTOutbox(publisher, file_name=fn)
+    for i in range(3):
+        dut.publish('on', 'rc433/device{}/state'.format(i))
+        assert dut.flush()
+        dut.save()
+    dut.stop()
+    assert not tmpdir.join('outbox.json').exists()
+
+    publisher.broker_up = False
+    dut = MQTTOutbox(publisher, CircuitBreaker(threshold=1, reset_timeout=3600), file_name=fn)
+    dut.publish('on', 'rc433/device1/state')
+    assert not dut.flush()
+    dut.save()
+    assert tmpdir.join('outbox.json').read() == '{"rc433/device1/state":["on",true,0]}'
+    publisher.broker_up = True
+    assert dut.flush(force=True)
+    dut.save()  # The file still held the message
+    dut.stop()
+    assert tmpdir.join('outbox.json').read() == '{}'
+
+
+def test_stop_does_not_hang_on_a_stuck_publish():
+    publisher = Publisher()
+    release = threading.Event()
+    publisher.publish_many = lambda messages: release.wait(10)
+    dut = MQTTOutbox(publisher, stop_timeout=0.1)
+    dut.run_async()
+    dut.publish('on', 'rc433/device1/state')
+    dut.stop()
+    release.set()
@@ -0,0 +1,172 @@
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def owner(tmpdir):
+    from rpi433rc.business.audit import AuditLog
+    from rpi433rc.business.devices import DeviceDict
+    from rpi433rc.business.idempotency import IdempotencyCache
+    from rpi433rc.business.learn import EdgeReceiver, Learner
+    from rpi433rc.business.owner import RegistryServer
+    from rpi433rc.business.ratelimit import RateLimiter
+    from rpi433rc.business.rc433 import RC433, RFDeviceMock
+    from rpi433rc.business.registry import DeviceRegistry
+    from rpi433rc.business.scheduler import Scheduler
+    from rpi433rc.business.state import MemoryState
+
+    rc433 = RC433(audit_log=AuditLog(str(tmpdir.join('audit.bin')), capacity=100))
+    rc433.rf_device = RFDeviceMock()
+    registry = DeviceRegistry(DeviceDict({'device1': {'code_on': 1, 'code_off': 2},
+                                          'device2': {'code_on': 3, 'code_off': 4},
+                                          'device3': {'system_code': '00001', 'device_code': 2}}),
+                              MemoryState(), rc433)
+    server = RegistryServer(registry, str(tmpdir.join('owner.sock')),
+                            scheduler=Scheduler(registry),
+                            rate_limiter=RateLimiter({'rest': (1, 1)}),
+                            idempotency_cache=IdempotencyCache(),
+                            learner=Learner(registry, EdgeReceiver(27)))
+    server.run_async()
+    yield server
+    server.stop()
+
+
+def test_workers_share_state(owner):
+    from rpi433rc.business.owner import RegistryClient
+
+    worker1, worker2 = RegistryClient(owner.path), RegistryClient(owner.path)
+    assert worker1.switch(True, device_name='device2', source='rest').transmitted
+    assert worker2.lookup(device_name='device2').state
+    assert [dev.state for dev in sorted(worker2.list(), key=lambda dev: dev.device_name)] == \
+        [False, True, False]
+    assert owner.registry.lookup(device_name='device2').state
+
+    history = worker2.rc433.audit_log.query(device_name='device2')
+    assert [(record.code, record.source) for record in history] == [(3, 'rest')]
+
+    # The rate limit is shared by all workers
+    assert worker1.rate_limiter.acquire('rest', 'alice') == 0.0
+    assert worker2.rate_limiter.acquire('rest', 'alice') > 0.0
+
+    # So are the idempotency keys: A retry on another worker is not sent again
+    key = ('alice', '/devices/device1/on', 'retry-1')
+    assert worker1.idempotency_cache.claim(key) == (True, None)
+    worker1.idempotency_cache.complete(key, {'state': True, 'transmitted': True})
+    assert worker2.idempotency_cache.claim(key) == (False, {'state': True, 'transmitted': True})
+
+
+def test_scheduler_and_errors(owner):
+    from rpi433rc.business.owner import RegistryClient, OwnerError
+    from rpi433rc.business.scheduler import Schedule
+    from rpi433rc.business.rc433 import UnsupportedDeviceError
+    from rpi433rc.business.learn import LearnError
+
+    worker = RegistryClient(owner.path)
+    schedule = worker.scheduler.add(Schedule.create('device1', 'on', now=0, at=4102444800))
+    assert [s.schedule_id for s in worker.scheduler.list()] == [schedule.schedule_id]
+    assert worker.scheduler.cancel(schedule.schedule_id)
+    assert worker.scheduler.stats()['pending'] == 0
+
+    with pytest.raises(UnsupportedDeviceError):
+        worker.switch(True, device_name='device3')
+    with pytest.raises(LearnError):  # No gpio here
+        worker.learner.start('device1')
+    assert worker.learner.status('device1').state == 'failed'
+    with pytest.raises(OwnerError):
+        RegistryClient(owner.path + '.missing').list()
+
+
+def test_concurrent_workers(owner):
+    from rpi433rc.business.owner import RegistryClient
+
+    client = RegistryClient(owner.path)
+    errors = []
+
+    def _switch(on_off):
+        try:
+            for _ in range(20):
+                assert client.switch(on_off, device_name='device1').result
+        except Exception as exc:  # pragma: no cover
+            errors.append(exc)
+
+    threads = [threading.Thread(target=_switch, args=(i % 2 == 0,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(owner.registry.rc433.audit_log) == 80
+
+
+def test_changes(owner):
+    from rpi433rc.business.owner import RegistryClient
+
+    worker = RegistryClient(owner.path)
+    worker.switch(True, device_name='device1')
+    first = worker.changes()  # All devices
+    assert (first.version, first.resync) == (1, True)
+    assert sorted((change.device_name, change.state) for change in first.changes) == \
+        [('device1', True), ('device2', False), ('device3', False)]
+    worker.switch(True, device_name='device2')
+    worker.switch(False, device_name='device1')
+    changes = worker.changes(since=first.version, epoch=first.epoch)
+    assert not changes.resync
+    assert [(change.device_name, change.version) for change in changes.changes] == \
+        [('device2', 2), ('device1', 3)]
+    assert worker.changes(since=changes.version, epoch='restarted').resync
+
+
+def test_workers_read_from_state_file(tmpdir, mocker):
+    from rpi433rc.business.devices import CodeDevice
+    from rpi433rc.business.owner import RegistryClient, RegistryServer
+    from rpi433rc.business.rc433 import RC433, RFDeviceMock
+    from rpi433rc.business.registry import DeviceRegistry
+    from rpi433rc.business.sqlstore import SQLiteStore
+    from rpi433rc.business.state import MemoryState
+    from rpi433rc.business.statefile import StateMirror
+
+    db_file, state_file = str(tmpdir.join('devices.db')), str(tmpdir.join('rpi433rc.state'))
+    rc433 = RC433()
+    rc433.rf_device = RFDeviceMock()
+    store = SQLiteStore(db_file)
+    store.add(CodeDevice('device1', code_on=1, code_off=2))
+    state = MemoryState()
+    state.mirror = StateMirror(state_file)
+    server = RegistryServer(DeviceRegistry(store, state, rc433), str(tmpdir.join('owner.sock')))
+    server.run_async()
+    try:
+        worker = RegistryClient(server.path, store=SQLiteStore(db_file), state_file=state_file)
+        assert worker.switch(True, device_name='device1').transmitted  # Forwarded
+        worker.add(CodeDevice('device2', code_on=3, code_off=4))
+        worker.add(CodeDevice('device3_' + 'x' * 32, code_on=5, code_off=6))  # Not mirrored
+
+        call = mocker.spy(worker, 'call')
+        assert worker.lookup(device_name='device1').state
+        assert not worker.lookup(device_name='device2').state
+        assert not call.called  # Served by the worker itself
+        assert worker.lookup(device_name='device3_' + 'x' * 32).device.code_on == 5
+        assert [dev.device_name for dev in worker.list()][:2] == ['device1', 'device2']
+        assert [args[0] for args, _ in call.call_args_list] == ['lookup', 'list']
+
+        worker.add(CodeDevice('device1', code_on=7, code_off=8))  # Its own change is seen
+        assert worker.lookup(device_name='device1').device.code_on == 7
+    finally:
+        server.stop()
+
+
+def test_idempotency_key_waits_for_first_request(owner):
+    import time
+    from rpi433rc.business.owner import RegistryClient
+
+    worker1, worker2 = RegistryClient(owner.path), RegistryClient(owner.path)
+    key = ('bob', '/devices/device2/off', 'retry-1')
+    assert worker1.idempotency_cache.claim(key) == (True, None)
+    res = []
+    retry = threading.Thread(target=lambda: res.append(worker2.idempotency_cache.claim(key)))
+    retry.start()
+    time.sleep(0.1)
+    assert res == []  # The retry waits while the first request is sent
+    worker1.idempotency_cache.complete(key, {'result': True})
+    retry.join(5)
+    assert res == [(False, {'result': True})]
@@ -15,6 +15,21 @@ class RFDeviceDummy(object):
         return True
 
 
+def test_stop_in_forked_child(mocker):
+    import os
+    from rpi433rc.business.rc433 import RC433
+    dut = RC433(gpio_out=17, rf_factory=lambda gpio_out: mocker.Mock())
+    dut.start()
+    rf_device = dut.rf_device
+
+    mocker.patch.object(os, 'getpid', return_value=os.getpid() + 1)  # E.g. a gunicorn worker
+    dut.stop()
+    assert not rf_device.cleanup.called
+    mocker.stopall()
+    dut.stop()
+    assert rf_device.cleanup.called
+
+
 def test_send_code():
     from rpi433rc.business.rc433 import RC433
     dut = RC433(gpio_out=17)
@@ -37,3 +52,141 @@ def test_switch_device():
 
     with pytest.raises(UnsupportedDeviceError):
         dut.switch_device(True, SystemDevice('device2', system_code="01010", device_code=4))
+
+
+def test_radio_pool_routing():
+    from rpi433rc.business.devices import CodeDevice
+    from rpi433rc.business.rc433 import RC433, RadioPool
+
+    sent = []
+
+    class RecordingDummy(RFDeviceDummy):
+        def __init__(self, name):
+            self.name = name
+
+        def tx_code(self, code, **kwargs):
+            sent.append((self.name, code))
+            return True
+
+    radios = {'ground': RC433(gpio_out=17), 'upstairs': RC433(gpio_out=27)}
+    for name, radio in radios.items():
+        radio.rf_device = RecordingDummy(name)
+    dut = RadioPool(radios)
+
+    assert dut.switch_device(True, CodeDevice('device1', code_on=1, code_off=2, resend=1,
+                                              radio='upstairs'))
+    assert sent == [('upstairs', 1)]
+
+    del sent[:]
+    assert dut.switch_device(False, CodeDevice('device2', code_on=1, code_off=2, resend=1))
+    assert sorted(sent) == [('ground', 2), ('upstairs', 2)]
+
+
+def test_switch_group_shares_transmissions():
+    from rpi433rc.business.devices import DeviceDict
+    from rpi433rc.business.rc433 import RC433
+    from rpi433rc.business.registry import DeviceRegistry
+    from rpi433rc.business.state import MemoryState
+
+    sent = []
+
+    class RecordingDummy(RFDeviceDummy):
+        def tx_code(self, code, **kwargs):
+            sent.append(code)
+            return True
+
+    devices = {'socket{}'.format(i): {'code_on': 1, 'code_off': 2, 'resend': 1}
+               for i in range(10)}
+    devices['lamp'] = {'code_on': 3, 'code_off': 4, 'resend': 2}
+    members = sorted(devices)
+    devices['all'] = {'members': members}
+    rc433 = RC433(gpio_out=17)
+    rc433.rf_device = RecordingDummy()
+    dut = DeviceRegistry(DeviceDict(devices), MemoryState(), rc433)
+
+    res = dut.switch(True, device_name='all')
+    assert res and res.transmitted
+    assert sent == [3, 3, 1]  # 'lamp' comes first in the group (sorted)
+    assert all(stateful.state for stateful in dut.list())
+    assert dut.lookup(device_name='all').device.configuration == {'members': members}
+
+
+def test_switch_with_device_timing():
+    from rpi433rc.business.devices import CodeDevice
+    from rpi433rc.business.rc433 import RC433, RadioPool
+
+    sent = []
+
+    class RecordingDummy(RFDeviceDummy):
+        def tx_code(self, code, **kwargs):
+            sent.append((code, kwargs))
+            return True
+
+    rc433 = RC433(gpio_out=17)
+    rc433.rf_device = RecordingDummy()
+    plain = CodeDevice('plain', code_on=1, code_off=2, resend=1)
+    remote = CodeDevice('remote', code_on=1, code_off=2, resend=1, protocol=2, code_length=32)
+    assert rc433.switch_devices(True, [plain, remote]) == {'plain': True, 'remote': True}
+    assert rc433.switch_device(True, plain)
+    assert RadioPool({'ground': rc433}).switch_device(True, plain)
+    assert sent == [
+        (1, {}),
+        (1, {'tx_proto': 2, 'tx_pulselength': 650, 'tx_length': 32}),  # Timing splits frames
+        (1, {'tx_proto': 1, 'tx_pulselength': 350}),  # Reset of rpi_rf's sticky pulse length
+        (1, {}),
+    ]
+
+
+def test_recovers_from_gpio_errors(mocker):
+    import time
+    import rpi433rc.business.rc433 as rc433
+
+    class FailingRFDevice(RFDeviceDummy):
+        fail = True
+
+        def tx_code(self, code, **kwargs):
+            if FailingRFDevice.fail:
+                raise RuntimeError('GPIO not set up')
+            return True
+
+    mocker.patch.object(rc433, 'RFDevice', FailingRFDevice)
+    dut = rc433.RC433(gpio_out=17, recover_delay=0.05)
+    dut.start()
+    assert dut.ready
+    assert not dut.send_code(12345)
+    assert not dut.ready
+    assert not dut.send_code(12345)  # Fails fast while recovering
+
+    FailingRFDevice.fail = False
+    deadline = time.time() + 5
+    while not dut.ready and time.time() < deadline:
+        time.sleep(0.01)
+    assert dut.ready
+    assert dut.send_code(12345)
+    dut.stop()
+    assert dut.rf_device is None
+
+
+def test_resend_counts_acknowledged_transmissions_only(mocker):
+    from rpi433rc.business.devices import CodeDevice
+    from rpi433rc.business.rc433 import RC433, RadioPool
+    from rpi433rc.business.resend import AdaptiveResend
+
+    device = CodeDevice('device1', code_on=1, code_off=2, resend=2)
+    for dut in (RC433(gpio_out=17), RadioPool({'ground': RC433(gpio_out=17)})):
+        dut.resend_policy = AdaptiveResend(airtime_budget=2)
+        rf_device = mocker.Mock()
+        rf_device.tx_code.return_value = False
+        for rc433 in getattr(dut, 'radios', {'': dut}).values():
+            rc433.rf_device = rf_device
+
+        assert not dut.switch_device(True, device)
+        assert not dut.switch_devices(True, [device])['device1']
+        assert dut.resend_stats()['device1']['transmissions'] == 0
+        assert dut.resend_stats()['device1']['frames'] == 0
+
+        rf_device.tx_code.return_value = True  # The airtime of the failed sends was released
+        assert dut.switch_device(True, device)
+        assert rf_device.tx_code.call_count == 6
+        assert dut.resend_stats()['device1']['transmissions'] == 1
+        assert dut.resend_stats()['device1']['frames'] == 2
@@ -0,0 +1,72 @@
+import functools
+import time
+
+
+def _registry(devices, policy, rf_device=None, rf_factory=None):
+    from rpi433rc.business.devices import DeviceDict
+    from rpi433rc.business.rc433 import RC433, RFDeviceMock
+    from rpi433rc.business.registry import DeviceRegistry
+    from rpi433rc.business.state import MemoryState
+
+    rc433 = RC433(resend_policy=policy, rf_factory=rf_factory)
+    if rf_factory is None:
+        rc433.rf_device = rf_device or RFDeviceMock()
+    else:
+        rc433.start()
+    return DeviceRegistry(DeviceDict(devices), MemoryState(), rc433)
+
+
+def test_polling_is_no_correction(mocker):
+    from rpi433rc.business.resend import AdaptiveResend
+
+    policy = AdaptiveResend()
+    rf_device = mocker.Mock()
+    rf_device.tx_code.return_value = True
+    dut = _registry({'device1': {'code_on': 1, 'code_off': 2}}, policy, rf_device)
+    for _ in range(3):  # A client that polls by sending the state
+        assert dut.switch(True, device_name='device1').transmitted
+    assert policy.stats()['device1']['corrections'] == 0
+    assert rf_device.tx_code.call_count == 9
+
+    rf_device.tx_code.return_value = False  # Lost: The retry is a correction
+    assert not dut.switch(False, device_name='device1').result
+    dut.switch(False, device_name='device1')
+    assert policy.stats()['device1']['corrections'] == 1
+    assert rf_device.tx_code.call_count == 9 + 3 + 6
+
+
+def test_skipped_switch_is_a_correction():
+    from rpi433rc.business.resend import AdaptiveResend
+
+    policy = AdaptiveResend(echo_required=True)
+    dut = _registry({'device1': {'code_on': 1, 'code_off': 2, 'switch_policy': 'skip_if_same'}},
+                    policy)
+    assert dut.switch(True, device_name='device1').transmitted
+    assert not dut.switch(True, device_name='device1').transmitted  # No echo was received
+    assert not dut.switch(True, device_name='device1').transmitted
+    assert policy.stats()['device1']['corrections'] == 1
+    assert policy.stats()['device1']['transmissions'] == 1
+
+
+def test_echoes_of_the_receiver():
+    from rpi433rc.business.learn import Learner, decode
+    from rpi433rc.business.resend import AdaptiveResend, EchoFeedback
+    from rpi433rc.business.simulator import RFMedium, SimulatedReceiver, SimulatedRFDevice
+
+    medium = RFMedium(instant=True)
+    policy = AdaptiveResend(echo_required=True)
+    dut = _registry({'device1': {'code_on': 1, 'code_off': 2},
+                     'device2': {'code_on': 3, 'code_off': 4}}, policy,
+                    rf_factory=functools.partial(SimulatedRFDevice, medium=medium))
+    learner = Learner(dut, SimulatedReceiver(medium), decoder=decode)
+    learner.listen(EchoFeedback(dut.device_store, policy))
+
+    dut.switch(True, device_name='device1')
+    deadline = time.time() + 5
+    while not policy.stats()['device1']['echoes'] and time.time() < deadline:
+        time.sleep(0.01)
+    dut.switch(True, device_name='device1')  # Confirmed by the echo: No correction
+    assert policy.stats()['device1'] == {'times': 3, 'transmissions': 2, 'corrections': 0,
+                                         'echoes': 1, 'frames': 6, 'success_rate': 1.0}
+    assert 'device2' not in policy.stats()
+    dut.rc433.stop()
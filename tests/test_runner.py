@@ -0,0 +1,43 @@
+import json
+
+
+def test_owner_with_cluster_config(tmpdir, mocker):
+    import rpi433rc.config as cfg
+    import rpi433rc.business.discovery as discovery
+    import rpi433rc.business.rc433 as rc433
+    import rpi433rc.factories as factories
+    import rpi433rc.runner as runner
+    import rpi433rc.util as util
+    from rpi433rc.business.cluster import ClusterRegistry
+    from rpi433rc.business.state import MemoryState
+
+    with open(str(tmpdir.join('devices.json')), 'w') as fpointer:
+        json.dump({'device1': {'code_on': 1, 'code_off': 2}}, fpointer)
+    with open(str(tmpdir.join('cluster.json')), 'w') as fpointer:
+        json.dump({'nodes': {'garden': {'url': 'http://127.0.0.1:1'}},
+                   'devices': {'pump': 'garden'}}, fpointer)
+    for name, value in (('CONFIG_DIR', str(tmpdir)), ('CLUSTER_CONFIG', 'cluster.json'),
+                        ('OWNER_SOCKET', str(tmpdir.join('owner.sock'))),
+                        ('MQTT_HOST', 'localhost'), ('MQTT_DISCOVERY', True)):
+        mocker.patch.object(cfg, name, value)
+    mocker.patch.object(factories, 'create_state', lambda mirror=False: MemoryState())
+    mocker.patch.object(rc433, 'RFDevice')
+    mocker.patch.object(util, 'MQTTListener')
+    mocker.patch.object(discovery, 'MQTTListener')
+    publisher = mocker.patch.object(discovery, 'MQTTPublisher').return_value
+    run_server = mocker.patch.object(runner, 'run_server')
+    owners = []
+    mocker.patch.object(runner, 'create_owner',
+                        lambda: owners.append(factories.create_owner()) or owners[-1])
+
+    runner.main()
+    try:
+        assert run_server.called
+        assert isinstance(owners[0].registry, ClusterRegistry)
+        # Only the local devices are published
+        assert [call[0][1] for call in publisher.publish.call_args_list] == \
+            ['rc433/switch/device1/config']
+    finally:
+        runner.REGISTRIES.remove(owners[0].registry)
+        owners[0].stop()
+        owners[0].registry.stop()
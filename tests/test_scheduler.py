@@ -0,0 +1,36 @@
+import os
+
+
+def test_journal_survives_restart(tmpdir):
+    from rpi433rc.business.scheduler import Schedule, Scheduler
+
+    file_name = str(tmpdir.join('schedules.json'))
+    switched = []
+
+    class Registry:
+        def switch(self, on_off, device_name, source=None):
+            switched.append((device_name, on_off))
+
+    now = [0.0]
+    dut = Scheduler(Registry(), file_name=file_name, clock=lambda: now[0])
+    repeating = dut.add(Schedule.create('device1', 'on', now=0, every=10))
+    once = dut.add(Schedule.create('device2', 'off', now=0, delay=5))
+    dut.add(Schedule.create('device3', 'on', now=0, delay=5000))
+    dut.cancel(once.schedule_id)
+    for _ in range(100):
+        now[0] += 10
+        dut.run_pending()
+    assert len(switched) == 100
+    # The journal is compacted instead of growing with every fire
+    with open(file_name + '.journal', 'rb') as fpointer:
+        assert len(fpointer.readlines()) <= 2 + 64
+
+    with open(file_name + '.journal', 'ab') as fpointer:
+        fpointer.write(b'{"add": {"sched')  # Torn by a power loss
+    restarted = Scheduler(Registry(), file_name=file_name, clock=lambda: now[0])
+    restarted.load()
+    schedules = {s.schedule_id: s for s in restarted.list()}
+    assert set(schedules) == {s.schedule_id for s in dut.list()}
+    assert len(schedules) == 2
+    assert schedules[repeating.schedule_id].due == 1010.0
+    assert os.path.getsize(file_name + '.journal') == 0
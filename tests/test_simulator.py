@@ -0,0 +1,121 @@
+import functools
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def medium():
+    from rpi433rc.business.simulator import RFMedium
+    return RFMedium()
+
+
+def _radio(medium, gpio_out=17, **kwargs):
+    from rpi433rc.business.rc433 import RC433
+    from rpi433rc.business.simulator import SimulatedRFDevice
+    rc433 = RC433(gpio_out=gpio_out, rf_factory=functools.partial(SimulatedRFDevice,
+                                                                  medium=medium), **kwargs)
+    rc433.start()
+    return rc433
+
+
+def test_airtime_of_device_timing(medium):
+    from rpi433rc.business.devices import CodeDevice
+
+    rc433 = _radio(medium)
+    assert rc433.switch_device(True, CodeDevice('device1', code_on=1, code_off=2, resend=2))
+    assert rc433.switch_device(True, CodeDevice('device2', code_on=3, code_off=4, resend=1,
+                                                protocol=2, code_length=32))
+    assert [(frame.code, frame.protocol, frame.pulse_length, frame.start, frame.end)
+            for frame in medium.history] == [
+        (1, 1, 350, 0.0, 0.448),
+        (1, 1, 350, 0.448, 0.896),
+        (3, 2, 650, 0.896, 1.5915),
+    ]
+    rc433.stop()
+
+
+def test_concurrent_radios_collide(medium):
+    from rpi433rc.business.devices import DeviceDict
+    from rpi433rc.business.rc433 import RadioPool
+    from rpi433rc.business.registry import DeviceRegistry
+    from rpi433rc.business.simulator import SimulatedReceiver
+    from rpi433rc.business.state import MemoryState
+
+    receiver = SimulatedReceiver(medium)
+    receiver.start()
+    pool = RadioPool({'ground': _radio(medium, 17), 'upstairs': _radio(medium, 27)})
+    registry = DeviceRegistry(DeviceDict({
+        'kitchen': {'code_on': 1, 'code_off': 2, 'resend': 1, 'radio': 'ground'},
+        'bedroom': {'code_on': 3, 'code_off': 4, 'resend': 1, 'radio': 'upstairs'},
+        'garden': {'code_on': 5, 'code_off': 6, 'resend': 1},  # Sent by both radios
+    }), MemoryState(), pool)
+
+    threads = [threading.Thread(target=registry.switch, args=(True,),
+                                kwargs={'device_name': name}) for name in ('kitchen', 'bedroom')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [frame.collided for frame in medium.advance(1.0)] == [True, True]
+
+    registry.switch(True, device_name='kitchen')
+    assert [(frame.code, frame.collided) for frame in medium.advance(1.0)] == [(1, False)]
+    registry.switch(True, device_name='garden')
+    assert [(frame.code, frame.collided) for frame in medium.advance(1.0)] == \
+        [(5, True), (5, True)]
+    assert [frame.code for frame in receiver.frames] == [1]
+    assert medium.stats()['collisions'] == 4
+    pool.stop()
+
+
+def test_one_radio_never_overlaps(medium):
+    from rpi433rc.business.devices import CodeDevice
+
+    rc433 = _radio(medium)
+    devices = [CodeDevice('device{}'.format(i), code_on=i + 1, code_off=100, resend=1)
+               for i in range(8)]
+    threads = [threading.Thread(target=rc433.switch_device, args=(True, device))
+               for device in devices]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    frames = list(medium.advance(10.0))
+    assert sorted(frame.code for frame in frames) == list(range(1, 9))
+    assert not any(frame.collided for frame in frames)
+    assert all(a.end == b.start for a, b in zip(frames, frames[1:]))
+    rc433.stop()
+
+
+def test_learns_from_a_simulated_remote(medium):
+    from rpi433rc.business.learn import Learner
+    from rpi433rc.business.rc433 import RC433
+    from rpi433rc.business.registry import DeviceRegistry
+    from rpi433rc.business.simulator import SimulatedReceiver, SimulatedRFDevice
+    from rpi433rc.business.sqlstore import SQLiteStore
+    from rpi433rc.business.state import MemoryState
+
+    registry = DeviceRegistry(SQLiteStore(':memory:'), MemoryState(),
+                              RC433(rf_factory=functools.partial(SimulatedRFDevice,
+                                                                 medium=medium)))
+    dut = Learner(registry, SimulatedReceiver(medium))
+    session = dut.start('lamp', timeout=5)
+    remote = SimulatedRFDevice(99, medium, tx_repeat=4)
+    remote.enable_tx()
+    for code in (1361, 1364):
+        remote.tx_code(code, tx_proto=4, tx_pulselength=380)
+        medium.advance(1.0)
+        time.sleep(0.2)  # The learner polls the receiver
+    deadline = time.monotonic() + 5
+    while session.active and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert session.state == 'done'
+
+    # The learned device is sent with the timing of the remote
+    assert registry.switch(False, device_name='lamp')
+    frame = medium.history[-1]
+    assert (frame.code, frame.protocol, frame.pulse_length, frame.code_length) == \
+        (1364, 4, 380, 24)
+
@@ -0,0 +1,91 @@
+import json
+
+
+def _write_devices(file_name, count):
+    devices = {'device{}'.format(i): {'code_on': i * 2 + 1, 'code_off': i * 2 + 2}
+               for i in range(count)}
+    devices['group1'] = {'members': ['device1', 'device2']}
+    with open(file_name, 'w') as fpointer:
+        json.dump(devices, fpointer)
+
+
+def test_restart_loads_snapshot(tmpdir, mocker):
+    import rpi433rc.business.snapshot as snapshot
+    from rpi433rc.model import MQTTTopicConfig
+
+    devices_file = str(tmpdir.join('devices.json'))
+    _write_devices(devices_file, 100)
+    topic_config = MQTTTopicConfig(discovery=True, command_topic='set')
+    first = snapshot.SnapshotFile(str(tmpdir.join('devices.snapshot'))).devices(devices_file,
+                                                                                topic_config)
+
+    mocker.patch.object(snapshot, 'read_devices')  # A restart must not parse the devices again
+    second = snapshot.SnapshotFile(str(tmpdir.join('devices.snapshot'))).devices(devices_file,
+                                                                                 topic_config)
+    assert not snapshot.read_devices.called
+    assert second.store.list() == first.store.list()
+    assert second.state_topics['device7'] == 'rc433/switch/device7/state'
+    assert second.configs == first.configs
+    assert [device.device_name for device in second.store.find(code=4)] == ['device1']
+    assert second.store.groups_of('device2') == ['group1']
+
+
+def test_snapshot_is_rebuilt(tmpdir, mocker):
+    import rpi433rc.business.snapshot as snapshot
+
+    devices_file = str(tmpdir.join('devices.json'))
+    snapshot_file = str(tmpdir.join('devices.snapshot'))
+    _write_devices(devices_file, 3)
+    dut = snapshot.SnapshotFile(snapshot_file)
+    key = dut.devices(devices_file).key
+
+    # A new version of the code invalidates the snapshot
+    mocker.patch.object(snapshot, 'VERSION', '99.0.0')
+    assert dut.load(snapshot.snapshot_key(devices_file)) is None
+    assert dut.devices(devices_file).key != key
+    assert dut.load(key) is None
+
+    # So does a change of the device classes (without a new version)
+    key = dut.devices(devices_file).key
+    mocker.patch.object(snapshot, 'code_fingerprint', return_value='0' * 64)
+    assert dut.load(snapshot.snapshot_key(devices_file)) is None
+    assert dut.devices(devices_file).key != key
+
+    # Unreadable snapshots are ignored
+    with open(snapshot_file, 'wb') as fpointer:
+        fpointer.write(b'garbage')
+    assert len(dut.devices(devices_file).store.list()) == 4
+
+
+def test_indexed_find_matches_scan():
+    from rpi433rc.business.devices import DeviceDict, DeviceStore
+
+    dut = DeviceDict({'device1': {'code_on': 1, 'code_off': 2},
+                      'device2': {'code_on': 2, 'code_off': 2},
+                      'device3': {'system_code': '00010', 'device_code': 2},
+                      'group1': {'members': ['device1', 'device2']}})
+    for kwargs in ({'code': 2}, {'code': 2, 'group': 'group1'}, {'code': 5},
+                   {'code': 1, 'device_type': 'SystemDevice'}, {'device_type': 'DeviceGroup'}):
+        assert dut.find(**kwargs) == DeviceStore.find(dut, **kwargs)
+    assert dut.groups_of('device1') == DeviceStore.groups_of(dut, 'device1') == ['group1']
+
+
+def test_loader_change_invalidates_snapshot(tmpdir, mocker):
+    import rpi433rc.business.devicefile as devicefile
+    import rpi433rc.business.snapshot as snapshot
+
+    devices_file = str(tmpdir.join('devices.json'))
+    _write_devices(devices_file, 3)
+    dut = snapshot.SnapshotFile(str(tmpdir.join('devices.snapshot')))
+    key = dut.devices(devices_file).key
+
+    loader = tmpdir.join('devicefile.py')
+    with open(devicefile.__file__, 'r', encoding='utf-8') as fpointer:
+        loader.write(fpointer.read() + '\n# A new check of the loader\n')
+    mocker.patch.object(devicefile, '__file__', str(loader))
+    snapshot.code_fingerprint.cache_clear()
+    try:
+        assert dut.load(snapshot.snapshot_key(devices_file)) is None
+        assert dut.devices(devices_file).key != key
+    finally:
+        snapshot.code_fingerprint.cache_clear()
@@ -0,0 +1,57 @@
+import pytest
+
+from rpi433rc.business.devices import CodeDevice, DeviceGroup, UnknownDeviceError
+from rpi433rc.business.sqlstore import SQLiteStore
+
+
+def test_persistent(tmpdir):
+    fn = str(tmpdir.join('devices.db'))
+    dut = SQLiteStore(fn)
+    dut.add_all([CodeDevice('device1', code_on=1, code_off=2, radio='upstairs'),
+                 DeviceGroup('group1', members=['device1'])])
+    dut.close()
+
+    dut = SQLiteStore(fn)
+    assert len(dut) == 2
+    assert dut.lookup(device_name='device1').radio == 'upstairs'
+    assert dut.groups_of('device1') == ['group1']
+
+
+def test_invalid_group_is_rolled_back():
+    dut = SQLiteStore(':memory:')
+    with pytest.raises(ValueError):
+        dut.add_all([CodeDevice('device1', code_on=1, code_off=2),
+                     DeviceGroup('group1', members=['device1', 'device2'])])
+    assert len(dut) == 0
+    with pytest.raises(UnknownDeviceError):
+        dut.lookup(device_name='device1')
+
+
+def test_cache():
+    dut = SQLiteStore(':memory:', cache_size=2)
+    dut.add_all([CodeDevice('device{}'.format(i), code_on=i, code_off=i + 100)
+                 for i in range(3)])
+    first = dut.lookup(device_name='device0')
+    assert dut.lookup(device_name='device0') is first  # Hot device comes from the cache
+    dut.lookup(device_name='device1')
+    dut.lookup(device_name='device2')  # Evicts device0
+    assert dut.lookup(device_name='device0') is not first
+
+    dut.add(CodeDevice('device1', code_on=5, code_off=6))  # Changes invalidate the cache
+    assert dut.lookup(device_name='device1').code_on == 5
+
+
+def test_cache_hit_does_not_query(tmpdir, mocker):
+    fn = str(tmpdir.join('devices.db'))
+    dut, other = SQLiteStore(fn), SQLiteStore(fn)
+    dut.add(CodeDevice('device1', code_on=1, code_off=2))
+    first = dut.lookup(device_name='device1')
+
+    conn = mocker.patch.object(dut, '_conn', mocker.Mock(wraps=dut._conn))
+    for _ in range(100):
+        assert dut.lookup(device_name='device1') is first
+    assert not conn.execute.called
+
+    other.add(CodeDevice('device1', code_on=5, code_off=6))
+    dut.refresh()
+    assert dut.lookup(device_name='device1').code_on == 5
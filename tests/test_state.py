@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from rpi433rc.business.devices import Device
+from rpi433rc.business.outbox import MQTTOutbox
+from rpi433rc.business.state import MQTTState
+from rpi433rc.model import MQTTConfig, MQTTTopicConfig
+
+
+class Publisher:
+    def publish_many(self, messages):
+        pass
+
+
+def make_listener(retained, send_marker=True):
+    class Listener:
+        def __init__(self, config, listen_topic, message_callback, marker_topic=None,
+                     marker_callback=None):
+            self.message_callback = message_callback
+            self.marker_callback = marker_callback
+            self.marker_topic = marker_topic
+
+        def _run(self):
+            for topic, message in retained:
+                self.message_callback(topic, message)
+            if send_marker:
+                self.marker_callback()
+            self.message_callback('rc433/device1/state', 'off')  # Live message
+
+        def run_async(self):
+            threading.Thread(target=self._run).start()
+
+    return Listener
+
+
+@pytest.fixture
+def dut():
+    state = MQTTState(MQTTConfig('localhost'), MQTTTopicConfig(), bootstrap_timeout=0.2)
+    state.outbox = MQTTOutbox(Publisher())
+    state.init_device(Device('device1'))
+    state.init_device(Device('device2'))
+    yield state
+    state.outbox.stop()
+
+
+def test_bootstrap(dut, mocker):
+    import rpi433rc.business.state as state
+    retained = [('rc433/device{}/state'.format(i), 'on') for i in range(1, 1001)]
+    mocker.patch.object(state, 'MQTTListener', make_listener(retained))
+    assert not dut.ready
+    dut.init_done()
+    assert dut.ready
+    assert dut.state_listener.marker_topic.startswith('rc433/bootstrap/')
+    assert dut.lookup(device_name='device2')
+    assert len(dut.states) == 1000
+
+
+def test_bootstrap_timeout(dut, mocker):
+    import rpi433rc.business.state as state
+    mocker.patch.object(state, 'MQTTListener',
+                        make_listener([('rc433/device2/state', 'on')], send_marker=False))
+    dut.init_done()
+    assert dut.ready
+    assert dut.lookup(device_name='device2')
+
+
+def test_journal_ignores_echoes(dut, mocker):
+    import rpi433rc.business.state as state
+    mocker.patch.object(state, 'MQTTListener',
+                        make_listener([('rc433/device2/state', 'on')]))
+    dut.init_done()
+    changes = dut.changes(since=0)
+    assert changes.resync and changes.version == 1
+    assert ('device2', True) in [(change.device_name, change.state)
+                                 for change in changes.changes]
+
+    dut.switch(True, device_name='device1')
+    dut._on_state_message('rc433/device1/state', 'on')  # Our own state published by the broker
+    changes = dut.changes(since=changes.version, epoch=changes.epoch)
+    assert not changes.resync
+    assert [(change.device_name, change.state) for change in changes.changes] == \
+        [('device1', True)]
@@ -0,0 +1,58 @@
+import multiprocessing
+import subprocess
+import sys
+
+
+def _read(file_name, queue):
+    from rpi433rc.business.statefile import StateReader
+    reader = StateReader(file_name)
+    queue.put(reader.states())
+
+
+def test_read_from_other_process(tmpdir):
+    from rpi433rc.business.devices import DeviceDict
+    from rpi433rc.business.rc433 import RC433, RFDeviceMock
+    from rpi433rc.business.registry import DeviceRegistry
+    from rpi433rc.business.state import MemoryState
+    from rpi433rc.business.statefile import StateMirror
+
+    file_name = str(tmpdir.join('rpi433rc.state'))
+    rc433 = RC433()
+    rc433.rf_device = RFDeviceMock()
+    state = MemoryState()
+    state.mirror = StateMirror(file_name)
+    registry = DeviceRegistry(DeviceDict({'device1': {'code_on': 1, 'code_off': 2},
+                                          'device2': {'code_on': 3, 'code_off': 4}}),
+                              state, rc433)
+    registry.switch(True, device_name='device2')
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_read, args=(file_name, queue))
+    process.start()
+    assert queue.get(timeout=10) == {'device1': False, 'device2': True}
+    process.join()
+
+    out = subprocess.check_output([sys.executable, '-m', 'rpi433rc.business.statefile',
+                                   file_name, 'device2'])
+    assert out.decode('utf-8').strip() == 'on'
+
+
+def test_names_and_crashed_writer(tmpdir):
+    import pytest
+    from rpi433rc.business import statefile
+    from rpi433rc.business.devices import UnknownDeviceError
+
+    file_name = str(tmpdir.join('rpi433rc.state'))
+    dut = statefile.StateMirror(file_name)
+    multibyte = 'küche_' * 4 + 'lampe1'  # 34 bytes
+    dut.init({'lämpchen': True, multibyte: True, multibyte[:-1] + '2': False})
+    reader = statefile.StateReader(file_name)
+    assert reader.states() == {'lämpchen': True}
+    with pytest.raises(UnknownDeviceError):
+        reader.lookup(multibyte)
+
+    # The writer died between the two increments of the sequence counter
+    statefile._SEQ.pack_into(dut._mmap, statefile._SEQ_OFFSET, 1)
+    with pytest.raises(statefile.StateFileError):
+        reader.lookup('lämpchen')
+    dut.close()